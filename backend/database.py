@@ -1,4 +1,5 @@
 from sqlalchemy import create_engine
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
@@ -30,3 +31,10 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+def upsert(db, model):
+    """INSERT ... ON CONFLICT для текущего диалекта (PostgreSQL или SQLite)"""
+    if db.get_bind().dialect.name == "postgresql":
+        return postgresql.insert(model)
+    return sqlite.insert(model)
@@ -3,6 +3,10 @@ from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 
 from .database import engine, Base
+from .services.pubsub import broker
+from .services.scene_sync import scene_hub
+from .services.search_service import ensure_search_indexes
+from .services.llm_client import llm_client
 from .routers import (
     auth,
     users,
@@ -14,7 +18,9 @@ from .routers import (
     chat,
     analysis,
     validator,
-    corrector
+    corrector,
+    scene,
+    analytics
 )
 
 
@@ -22,7 +28,14 @@ from .routers import (
 async def lifespan(app: FastAPI):
     # Создание таблиц при запуске
     Base.metadata.create_all(bind=engine)
+    ensure_search_indexes(engine)
+    # Брокер событий реального времени (общий для всех воркеров)
+    await broker.start()
+    await scene_hub.start()
     yield
+    await scene_hub.stop()
+    await broker.stop()
+    await llm_client.close()
 
 
 app = FastAPI(
@@ -53,6 +66,8 @@ app.include_router(chat.router, prefix="/api/chat", tags=["Чат"])
 app.include_router(analysis.router, prefix="/api/analysis", tags=["Анализ"])
 app.include_router(validator.router, prefix="/api/validator", tags=["Валидатор"])
 app.include_router(corrector.router, prefix="/api/corrector", tags=["Корректор"])
+app.include_router(scene.router, prefix="/api/scene", tags=["Сцена"])
+app.include_router(analytics.router, prefix="/api/analytics", tags=["Аналитика"])
 
 
 @app.get("/")
@@ -2,10 +2,12 @@ from .user import User, UserRole
 from .project import Project
 from .room import Room
 from .model import Model
-from .catalog import Material, Standard, Catalog
+from .catalog import Material, Standard, Catalog, CatalogPrice
 from .recommendation import Recommendation, Task
-from .chat import ChatMessage, Consultation, Comment
-from .analysis import AnalysisResult
+from .chat import ChatMessage, ChatMessageArchive, ChatUnreadCounter, ChatConversation, Consultation, ConsultantStats, Comment
+from .analysis import AnalysisResult, ResultCache
+from .analytics import AnalyticsRollup
+from .validation import ValidationScope, ValidationIssue
 
 __all__ = [
     "User",
@@ -16,10 +18,19 @@ __all__ = [
     "Material",
     "Standard",
     "Catalog",
+    "CatalogPrice",
     "Recommendation",
     "Task",
     "ChatMessage",
+    "ChatMessageArchive",
+    "ChatUnreadCounter",
+    "ChatConversation",
     "Consultation",
+    "ConsultantStats",
     "Comment",
     "AnalysisResult",
+    "ResultCache",
+    "AnalyticsRollup",
+    "ValidationScope",
+    "ValidationIssue",
 ]
@@ -1,5 +1,5 @@
-from sqlalchemy import Column, Integer, String, Float, Text, ForeignKey, JSON, DateTime
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, Float, Text, ForeignKey, JSON, DateTime, Index
+from sqlalchemy.orm import relationship, deferred
 from datetime import datetime
 
 from ..database import Base
@@ -8,8 +8,14 @@ from ..database import Base
 class AnalysisResult(Base):
     """
     Результаты анализа планировки из подсистемы анализа
+    details и report загружаются только при обращении - списки и графики
+    читают лишь легкие колонки; история прореживается (services/analysis_history.py)
     """
     __tablename__ = "analysis_results"
+    __table_args__ = (
+        # Последний результат типа и ряды для графиков по проекту
+        Index("ix_analysis_results_project_type_created", "project_id", "analysis_type", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     
@@ -25,14 +31,40 @@ class AnalysisResult(Base):
     status = Column(String)  # good, warning, critical
     
     # Детали анализа
-    details = Column(JSON)  # Подробные результаты
+    details = deferred(Column(JSON))  # Подробные результаты
     issues = Column(JSON)  # Обнаруженные проблемы
     suggestions = Column(JSON)  # Предложения по улучшению
     
     # AI-генерированный отчет
-    report = Column(Text)  # Текстовый отчет
+    report = deferred(Column(Text))  # Текстовый отчет
+    
+    # Хэш details - одинаковый результат подряд не сохраняется повторно
+    fingerprint = Column(String(64))
     
     created_at = Column(DateTime, default=datetime.utcnow)
 
     def __repr__(self):
         return f"<AnalysisResult {self.analysis_type} for Project {self.project_id}>"
+
+
+class ResultCache(Base):
+    """
+    Кэш результатов LLM и анализа, адресуемый содержимым
+    Ключ - SHA-256 канонического JSON снимка проекта, типа запроса,
+    версии промпта и модели; при изменении проекта меняется ключ
+    """
+    __tablename__ = "result_cache"
+
+    key = Column(String(64), primary_key=True)
+    kind = Column(String, nullable=False)  # recommendations, analysis:layout, ...
+    project_id = Column(Integer, index=True)  # Только для статистики/очистки, без FK
+    
+    value = Column(JSON, nullable=False)
+    hits = Column(Integer, default=0)
+    
+    created_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False, index=True)
+    last_used_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+    def __repr__(self):
+        return f"<ResultCache {self.kind} {self.key[:12]}>"
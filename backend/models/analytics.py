@@ -0,0 +1,44 @@
+from sqlalchemy import Column, Integer, String, Float, Date, DateTime, UniqueConstraint
+from datetime import datetime
+
+from ..database import Base
+
+
+class AnalyticsRollup(Base):
+    """
+    Материализованные итоги для отчетов менеджера
+    Одна строка - день × дизайнер × статус проекта; метрики - аддитивные
+    суммы, которые обновляются инкрементально (services/analytics.py)
+    designer_id = 0 и project_status = "" - без дизайнера / без проекта
+    """
+    __tablename__ = "analytics_rollups"
+    __table_args__ = (
+        UniqueConstraint("day", "designer_id", "project_status", name="uq_analytics_rollups_key"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    day = Column(Date, nullable=False, index=True)
+    designer_id = Column(Integer, nullable=False, default=0, index=True)  # Без FK: 0 - не назначен
+    project_status = Column(String, nullable=False, default="")
+    
+    # Анализ проектов
+    analysis_count = Column(Integer, nullable=False, default=0)
+    analysis_score_sum = Column(Float, nullable=False, default=0.0)
+    
+    # Валидация: запуски, запуски с ошибками, всего ошибок
+    validation_count = Column(Integer, nullable=False, default=0)
+    validation_failed_count = Column(Integer, nullable=False, default=0)
+    validation_error_sum = Column(Integer, nullable=False, default=0)
+    
+    # Рекомендации (по дню создания рекомендации)
+    recommendation_count = Column(Integer, nullable=False, default=0)
+    recommendation_applied_count = Column(Integer, nullable=False, default=0)
+    
+    # Завершенные консультации (по дню завершения; designer_id - консультант)
+    consultation_completed_count = Column(Integer, nullable=False, default=0)
+    consultation_turnaround_seconds = Column(Float, nullable=False, default=0.0)
+    
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<AnalyticsRollup {self.day} designer={self.designer_id} status={self.project_status}>"
@@ -1,5 +1,6 @@
-from sqlalchemy import Column, Integer, String, Float, Text, JSON, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, Text, JSON, ForeignKey, DateTime
 from sqlalchemy.orm import relationship
+from datetime import datetime
 
 from ..database import Base
 
@@ -51,6 +52,9 @@ class Standard(Base):
     # Связь с материалами
     material_id = Column(Integer, ForeignKey("materials.id"), nullable=True)
     materials = relationship("Material", back_populates="standards")
+    
+    # Отпечаток набора правил валидации (services/validation_rules.py)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     def __repr__(self):
         return f"<Standard {self.code}: {self.name}>"
@@ -79,3 +83,22 @@ class Catalog(Base):
 
     def __repr__(self):
         return f"<Catalog {self.name}>"
+
+
+class CatalogPrice(Base):
+    """
+    Прайс-лист позиций каталога
+    Цена модели берется по ее catalog_id; если позиции нет в прайсе -
+    из properties.price материала модели (см. services/cost_analysis.py)
+    """
+    __tablename__ = "catalog_prices"
+
+    id = Column(Integer, primary_key=True, index=True)
+    catalog_id = Column(String, nullable=False, unique=True, index=True)  # Model.catalog_id
+    price = Column(Float, nullable=False)  # Цена за единицу
+    currency = Column(String, default="RUB")
+    
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<CatalogPrice {self.catalog_id}: {self.price} {self.currency}>"
@@ -1,4 +1,7 @@
-from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, Boolean
+from sqlalchemy import (
+    Column, Integer, String, Text, ForeignKey, DateTime, Boolean, Index, UniqueConstraint, LargeBinary,
+    Float, JSON, text
+)
 from sqlalchemy.orm import relationship
 from datetime import datetime
 
@@ -26,15 +29,97 @@ class ChatMessage(Base):
     
     # Метаданные
     is_read = Column(Boolean, default=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
 
     def __repr__(self):
         return f"<ChatMessage from User {self.sender_id}>"
 
 
+class ChatMessageArchive(Base):
+    """
+    Архив старых сообщений чата
+    Сообщения переносятся сюда с сохранением id, текст хранится сжатым (zlib)
+    """
+    __tablename__ = "chat_messages_archive"
+    __table_args__ = (
+        Index("ix_chat_messages_archive_sender_created", "sender_id", "created_at"),
+        Index("ix_chat_messages_archive_recipient_created", "recipient_id", "created_at"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    sender_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    recipient_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    project_id = Column(Integer, ForeignKey("projects.id"), nullable=True, index=True)
+
+    message_compressed = Column(LargeBinary, nullable=False)
+
+    is_read = Column(Boolean, default=True)
+    created_at = Column(DateTime, nullable=False)
+    archived_at = Column(DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<ChatMessageArchive {self.id} from User {self.sender_id}>"
+
+
+class ChatUnreadCounter(Base):
+    """
+    Счетчик непрочитанных сообщений пользователя в диалоге с отправителем
+    Обновляется при отправке и прочтении, вместо COUNT(*) по chat_messages
+    """
+    __tablename__ = "chat_unread_counters"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)  # Получатель
+    peer_id = Column(Integer, ForeignKey("users.id"), primary_key=True)  # Отправитель
+    unread_count = Column(Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<ChatUnreadCounter User {self.user_id} from {self.peer_id}: {self.unread_count}>"
+
+
+class ChatConversation(Base):
+    """
+    Сводка диалога во "входящих" пользователя
+    Одна строка на пару (пользователь, собеседник) или (пользователь, проект),
+    обновляется при отправке сообщения
+    """
+    __tablename__ = "chat_conversations"
+    __table_args__ = (
+        UniqueConstraint("user_id", "thread_key", name="uq_chat_conversations_user_thread"),
+        Index("ix_chat_conversations_user_last", "user_id", "last_message_at"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+
+    # "user:<id>" для личной переписки, "project:<id>" для обсуждения проекта
+    thread_key = Column(String, nullable=False)
+    peer_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    project_id = Column(Integer, ForeignKey("projects.id"), nullable=True)
+
+    # Последнее сообщение (может находиться в архиве, поэтому без внешнего ключа)
+    last_message_id = Column(Integer, nullable=False)
+    last_sender_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    last_message_preview = Column(String)
+    last_message_at = Column(DateTime, nullable=False)
+
+    def __repr__(self):
+        return f"<ChatConversation User {self.user_id} {self.thread_key}>"
+
+
 class Consultation(Base):
     """Модель для запросов на консультацию"""
     __tablename__ = "consultations"
+    __table_args__ = (
+        # Частичный индекс очереди: только ожидающие консультации,
+        # в порядке выборки priority DESC, created_at ASC
+        Index(
+            "ix_consultations_pending_queue", text("priority DESC"), "created_at",
+            postgresql_where=text("status = 'pending'"),
+            sqlite_where=text("status = 'pending'")
+        ),
+        # Консультации, назначенные консультанту
+        Index("ix_consultations_consultant_created", "consultant_id", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     
@@ -51,14 +136,34 @@ class Consultation(Base):
     topic = Column(String, nullable=False)
     description = Column(Text)
     status = Column(String, default="pending")  # pending, assigned, in_progress, completed
+    priority = Column(Integer, default=0, nullable=False)  # Чем больше, тем раньше в очереди
     
     created_at = Column(DateTime, default=datetime.utcnow)
+    assigned_at = Column(DateTime, nullable=True)
     completed_at = Column(DateTime, nullable=True)
 
     def __repr__(self):
         return f"<Consultation {self.topic} ({self.status})>"
 
 
+class ConsultantStats(Base):
+    """
+    Поддерживаемые счетчики нагрузки консультанта/дизайнера
+    Используются планировщиком вместо подсчета по таблице consultations
+    """
+    __tablename__ = "consultant_stats"
+
+    consultant_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    open_count = Column(Integer, nullable=False, default=0)  # Назначенные, не завершенные
+    assigned_count = Column(Integer, nullable=False, default=0)
+    completed_count = Column(Integer, nullable=False, default=0)
+    total_response_seconds = Column(Float, nullable=False, default=0.0)  # Сумма времени от назначения до завершения
+    category_counts = Column(JSON)  # {категория помещения: число завершенных консультаций}
+
+    def __repr__(self):
+        return f"<ConsultantStats User {self.consultant_id}: {self.open_count} open>"
+
+
 class Comment(Base):
     """Комментарии к проектам"""
     __tablename__ = "comments"
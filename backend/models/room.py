@@ -10,6 +10,9 @@ class Room(Base):
     Связана с проектом и содержит параметры помещения
     """
     __tablename__ = "rooms"
+    # id не переиспользуются после удаления: кэш результатов по помещениям
+    # адресуется парой (id, revision)
+    __table_args__ = {"sqlite_autoincrement": True}
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, nullable=False)  # Название комнаты (Гостиная, Кухня, etc.)
@@ -28,6 +31,9 @@ class Room(Base):
     position = Column(JSON)  # {x, y, z}
     rotation = Column(JSON)  # {x, y, z} углы поворота
     
+    # Счетчик изменений помещения и его моделей (services/change_tracking.py)
+    revision = Column(Integer, nullable=False, default=0, server_default="0")
+    
     # Relationships
     models = relationship("Model", back_populates="room")
     tasks = relationship("Task", back_populates="room")
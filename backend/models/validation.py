@@ -0,0 +1,57 @@
+from sqlalchemy import Column, Integer, String, Text, DateTime, UniqueConstraint
+from datetime import datetime
+
+from ..database import Base
+
+
+class ValidationScope(Base):
+    """
+    Проверенная часть проекта: помещение (с его моделями) на ревизии revision
+    room_id = 0 - модели без помещения и проект в целом (ревизии нет)
+    Результат помещения устаревает при изменении Room.revision или правил
+    """
+    __tablename__ = "validation_scopes"
+    __table_args__ = (
+        UniqueConstraint("project_id", "room_id", name="uq_validation_scopes_key"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    project_id = Column(Integer, nullable=False, index=True)  # Без FK, как result_cache
+    room_id = Column(Integer, nullable=False, default=0)
+    revision = Column(Integer, nullable=False, default=0)
+    rules_version = Column(String, nullable=False)
+    validated_at = Column(DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<ValidationScope project={self.project_id} room={self.room_id} rev={self.revision}>"
+
+
+class ValidationIssue(Base):
+    """
+    Текущие проблемы валидации (services/validation_store.py)
+    Одна строка - нарушение правила code объектом (entity_type, entity_id);
+    строка живет, пока нарушение повторяется при проверках
+    """
+    __tablename__ = "validation_issues"
+    __table_args__ = (
+        UniqueConstraint("project_id", "entity_type", "entity_id", "code", name="uq_validation_issues_key"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    project_id = Column(Integer, nullable=False, index=True)
+    room_id = Column(Integer, nullable=False, default=0)  # Область проверки (ValidationScope.room_id)
+
+    # Объект и стабильный код правила (room.min_height, model.collision, ...)
+    entity_type = Column(String(20), nullable=False)  # room, model, project
+    entity_id = Column(Integer)
+    code = Column(String(100), nullable=False)
+
+    severity = Column(String(20), nullable=False)  # error, warning
+    message = Column(Text)
+    standard = Column(String)  # Код стандарта, задавшего порог
+
+    first_seen_at = Column(DateTime, default=datetime.utcnow)
+    validated_at = Column(DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<ValidationIssue {self.code} {self.entity_type}:{self.entity_id}>"
@@ -1,35 +1,26 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
+from datetime import datetime
 
-from ..database import get_db
+from ..database import get_db, SessionLocal
 from ..models.user import User
 from ..models.project import Project
 from ..models.analysis import AnalysisResult
+from ..schemas.analysis import AnalysisResultSummary, AnalysisResultResponse, AnalysisTrendPoint
 from ..services.recommendation_system import RecommendationSystem
+from ..services.llm_client import LLMError, sse_event
+from ..services.result_cache import cache_key
+from ..services.analysis_history import AnalysisHistoryService, MAX_TREND_POINTS
+from ..services.analytics import AnalyticsService
 from .auth import get_current_user
 
 router = APIRouter()
 
 
-@router.post("/project/{project_id}")
-def analyze_project(
-    project_id: int,
-    analysis_type: str = "layout",
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
-) -> Dict[str, Any]:
-    """
-    Анализировать проект
-    
-    Типы анализа:
-    - layout: анализ планировки
-    - lighting: анализ освещения
-    - ergonomics: эргономика пространства
-    - cost: стоимостной анализ
-    
-    ⚠️ Использует заглушки. Для полного анализа интегрируйте LLM.
-    """
+def _get_project_for_analysis(db: Session, project_id: int, current_user: User) -> Project:
     project = db.query(Project).filter(Project.id == project_id).first()
     if not project:
         raise HTTPException(status_code=404, detail="Проект не найден")
@@ -39,47 +30,197 @@ def analyze_project(
         project.designer_id != current_user.id and
         current_user.role not in ["manager", "consultant"]):
         raise HTTPException(status_code=403, detail="Нет доступа")
+    return project
+
+
+def _save_analysis(
+    db: Session,
+    project_id: int,
+    analysis_type: str,
+    analysis_result: Dict[str, Any],
+    report: Optional[str] = None
+) -> AnalysisResult:
+    """
+    Сохранить результат анализа
+    Если последний результат того же типа не отличается - новая строка не
+    создается (повторный анализ без изменений проекта), обновляется только отчет
+    """
+    fingerprint = cache_key("analysis_result", analysis_result)
+    latest = db.query(AnalysisResult).filter(
+        AnalysisResult.project_id == project_id,
+        AnalysisResult.analysis_type == analysis_type
+    ).order_by(AnalysisResult.created_at.desc(), AnalysisResult.id.desc()).first()
+    if latest is not None and latest.fingerprint == fingerprint:
+        if report:
+            latest.report = report
+        db.commit()
+        return latest
     
-    # Выполняем анализ
-    rec_system = RecommendationSystem(db)
-    analysis_result = rec_system.analyze_project_layout(project_id)
-    
-    # Сохраняем результат в БД
+    score = analysis_result["analysis"]["score"]
     db_analysis = AnalysisResult(
         project_id=project_id,
         analysis_type=analysis_type,
-        score=analysis_result["analysis"]["score"],
-        status="good" if analysis_result["analysis"]["score"] > 75 else "warning",
+        score=score,
+        status="good" if score > 75 else "warning",
         details=analysis_result,
         issues=analysis_result["analysis"]["issues"],
         suggestions=analysis_result["analysis"]["suggestions"],
-        report=f"Анализ проекта #{project_id}: Общая оценка {analysis_result['analysis']['score']}/100"
+        report=report or f"Анализ проекта #{project_id}: Общая оценка {score}/100",
+        fingerprint=fingerprint
     )
     db.add(db_analysis)
+    db.flush()
+    AnalysisHistoryService(db).compact(project_id, analysis_type)
+    AnalyticsService(db).on_analysis(db.query(Project).filter(Project.id == project_id).first(), score)
     db.commit()
     db.refresh(db_analysis)
+    return db_analysis
+
+
+def _analysis_options(resolution: Optional[float]) -> Dict[str, Any]:
+    return {"resolution": resolution} if resolution else {}
+
+
+@router.post("/project/{project_id}")
+def analyze_project(
+    project_id: int,
+    analysis_type: str = "layout",
+    resolution: Optional[float] = Query(None, ge=0.05, le=1.0),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+) -> Dict[str, Any]:
+    """
+    Анализировать проект
+    
+    Типы анализа:
+    - layout: анализ планировки
+    - lighting: освещенность пола от светильников по нормам стандарта категории lighting
+    - ergonomics: эргономика пространства (доступность мебели и ширина проходов
+      по сетке занятости; resolution - шаг сетки в метрах)
+    - cost: смета по прайсу каталога и ценам материалов (по помещениям);
+      сохраненная смета обновляется при изменении моделей без полного пересчета
+    """
+    project = _get_project_for_analysis(db, project_id, current_user)
+    
+    # Выполняем анализ
+    rec_system = RecommendationSystem(db)
+    analysis_result = rec_system.analyze_project(project, analysis_type, _analysis_options(resolution))
+    
+    # Сохраняем результат в БД
+    _save_analysis(db, project_id, analysis_type, analysis_result)
     
     return analysis_result
 
 
-@router.get("/project/{project_id}/results")
-def get_project_analysis_results(
+@router.post("/project/{project_id}/stream")
+def stream_project_analysis(
     project_id: int,
+    request: Request,
+    analysis_type: str = "layout",
+    resolution: Optional[float] = Query(None, ge=0.05, le=1.0),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
-) -> List[AnalysisResult]:
-    """Получить все результаты анализа проекта"""
-    project = db.query(Project).filter(Project.id == project_id).first()
-    if not project:
-        raise HTTPException(status_code=404, detail="Проект не найден")
+):
+    """
+    Анализ проекта с текстовым отчетом LLM в потоковом режиме (Server-Sent Events)
     
-    if (project.user_id != current_user.id and 
-        project.designer_id != current_user.id and
-        current_user.role not in ["manager", "consultant"]):
-        raise HTTPException(status_code=403, detail="Нет доступа")
+    События:
+    - analysis: {...} - результат анализа (сразу)
+    - token: {"text": "..."} - фрагмент отчета
+    - done: {"id": ..., "score": ...} - результат сохранен
+    - error: {"detail": "..."}
+    
+    Результат сохраняется вместе с отчетом только после завершения потока;
+    при отключении клиента запрос к LLM прерывается.
+    """
+    _get_project_for_analysis(db, project_id, current_user)
+    
+    async def events():
+        # Сессия запроса закрывается до начала передачи ответа - нужна своя
+        session = SessionLocal()
+        try:
+            rec_system = RecommendationSystem(session)
+            # Запросы к БД и расчет анализа - в пуле потоков, не в цикле событий
+            project = await run_in_threadpool(
+                lambda: session.query(Project).filter(Project.id == project_id).first()
+            )
+            analysis_result = await run_in_threadpool(
+                rec_system.analyze_project, project, analysis_type, _analysis_options(resolution)
+            )
+            # Записи кэша анализа фиксируются до потока, чтобы не держать блокировки на время LLM
+            await run_in_threadpool(session.commit)
+            yield sse_event("analysis", analysis_result)
+            
+            chunks = []
+            async for chunk in rec_system.stream_report(analysis_result):
+                if await request.is_disconnected():
+                    return
+                chunks.append(chunk)
+                yield sse_event("token", {"text": chunk})
+            
+            db_analysis = await run_in_threadpool(
+                _save_analysis, session, project_id, analysis_type, analysis_result, "".join(chunks)
+            )
+            yield sse_event("done", {"id": db_analysis.id, "score": db_analysis.score})
+        except LLMError as e:
+            yield sse_event("error", {"detail": f"Ошибка формирования отчета: {e}"})
+        finally:
+            await run_in_threadpool(session.close)
     
-    results = db.query(AnalysisResult).filter(
-        AnalysisResult.project_id == project_id
-    ).all()
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.get("/project/{project_id}/results", response_model=List[AnalysisResultSummary])
+def get_project_analysis_results(
+    project_id: int,
+    analysis_type: Optional[str] = None,
+    skip: int = 0,
+    limit: int = Query(50, ge=1, le=500),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Получить результаты анализа проекта (новые первыми)
+    Без details и report - полный результат: GET /results/{result_id}
+    """
+    _get_project_for_analysis(db, project_id, current_user)
+    
+    query = db.query(AnalysisResult).filter(AnalysisResult.project_id == project_id)
+    if analysis_type:
+        query = query.filter(AnalysisResult.analysis_type == analysis_type)
     
-    return results
+    return query.order_by(
+        AnalysisResult.created_at.desc(), AnalysisResult.id.desc()
+    ).offset(skip).limit(limit).all()
+
+
+@router.get("/project/{project_id}/trend", response_model=List[AnalysisTrendPoint])
+def get_project_analysis_trend(
+    project_id: int,
+    analysis_type: Optional[str] = None,
+    since: Optional[datetime] = None,
+    limit: int = Query(MAX_TREND_POINTS, ge=1, le=MAX_TREND_POINTS),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Динамика оценки проекта: (created_at, score, status) по возрастанию времени"""
+    _get_project_for_analysis(db, project_id, current_user)
+    return AnalysisHistoryService(db).trend(project_id, analysis_type, since, limit)
+
+
+@router.get("/results/{result_id}", response_model=AnalysisResultResponse)
+def get_analysis_result(
+    result_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Полный результат анализа (details, report)"""
+    result = db.query(AnalysisResult).filter(AnalysisResult.id == result_id).first()
+    if not result:
+        raise HTTPException(status_code=404, detail="Результат анализа не найден")
+    _get_project_for_analysis(db, result.project_id, current_user)
+    return result
@@ -0,0 +1,50 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from typing import Dict, Any, Optional
+from datetime import date
+
+from ..database import get_db
+from ..models.user import User
+from ..services.analytics import AnalyticsService
+from .auth import get_current_user
+
+router = APIRouter()
+
+
+@router.get("/portfolio")
+def get_portfolio_report(
+    group_by: str = Query("day", pattern="^(day|designer|status)$"),
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    designer_id: Optional[int] = Query(None, description="0 - проекты без дизайнера"),
+    project_status: Optional[str] = None,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+) -> Dict[str, Any]:
+    """
+    Сводка по портфелю проектов (только менеджер)
+    
+    Метрики по группам (день, дизайнер или статус проекта) и общий итог:
+    средняя оценка анализа, доля проверок с ошибками, доля примененных
+    рекомендаций, среднее время выполнения консультаций.
+    Считается по материализованным итогам (analytics_rollups), без обхода
+    исходных таблиц.
+    """
+    if current_user.role != "manager":
+        raise HTTPException(status_code=403, detail="Только для менеджера")
+    
+    return AnalyticsService(db).report(group_by, date_from, date_to, designer_id, project_status)
+
+
+@router.post("/rebuild")
+def rebuild_rollups(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Пересобрать итоги рекомендаций и консультаций из исходных таблиц (только менеджер)"""
+    if current_user.role != "manager":
+        raise HTTPException(status_code=403, detail="Только для менеджера")
+    
+    AnalyticsService(db).rebuild()
+    db.commit()
+    return {"message": "Итоги аналитики пересобраны"}
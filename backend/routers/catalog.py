@@ -1,15 +1,19 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 from typing import List, Optional
+from datetime import datetime
 
-from ..database import get_db
+from ..database import get_db, upsert
 from ..models.user import User
-from ..models.catalog import Material, Standard, Catalog
+from ..models.catalog import Material, Standard, Catalog, CatalogPrice
 from ..schemas.catalog import (
     MaterialCreate, MaterialUpdate, MaterialResponse,
     StandardCreate, StandardUpdate, StandardResponse,
-    CatalogCreate, CatalogUpdate, CatalogResponse
+    CatalogCreate, CatalogUpdate, CatalogResponse,
+    CatalogPriceBase, CatalogPriceResponse
 )
+from ..services.change_tracking import touch_material_rooms
+from ..services.validation_rules import invalidate_rule_set
 from .auth import get_current_user
 
 router = APIRouter()
@@ -92,6 +96,8 @@ def update_material(
     for key, value in material_update.dict(exclude_unset=True).items():
         setattr(material, key, value)
     
+    # Свойства материала влияют на анализ помещений с его моделями
+    touch_material_rooms(db, material_id)
     db.commit()
     db.refresh(material)
     return material
@@ -111,6 +117,7 @@ def delete_material(
     if not material:
         raise HTTPException(status_code=404, detail="Материал не найден")
     
+    touch_material_rooms(db, material_id)
     db.delete(material)
     db.commit()
     return {"message": "Материал удален"}
@@ -139,6 +146,7 @@ def create_standard(
     db.add(db_standard)
     db.commit()
     db.refresh(db_standard)
+    invalidate_rule_set()
     return db_standard
 
 
@@ -202,9 +210,61 @@ def update_standard(
     
     db.commit()
     db.refresh(standard)
+    # Другие процессы перекомпилируют правила по updated_at
+    invalidate_rule_set()
     return standard
 
 
+# ============= ПРАЙС =============
+
+@router.put("/prices", response_model=List[CatalogPriceResponse])
+def upsert_prices(
+    prices: List[CatalogPriceBase],
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Загрузить цены позиций каталога (создание или обновление по catalog_id)
+    Сохраненные сметы проектов не пересчитываются - только при следующем анализе cost
+    """
+    if current_user.role not in ["designer", "manager"]:
+        raise HTTPException(status_code=403, detail="Недостаточно прав")
+    if not prices:
+        return []
+    
+    # Последняя цена для повторяющегося catalog_id
+    rows = {item.catalog_id: item.dict() for item in prices}
+    statement = upsert(db, CatalogPrice)
+    db.execute(
+        statement.on_conflict_do_update(
+            index_elements=[CatalogPrice.catalog_id],
+            set_={
+                "price": statement.excluded.price,
+                "currency": statement.excluded.currency,
+                "updated_at": datetime.utcnow(),
+            }
+        ),
+        [{**row, "updated_at": datetime.utcnow()} for row in rows.values()]
+    )
+    db.commit()
+    return db.query(CatalogPrice).filter(CatalogPrice.catalog_id.in_(rows)).all()
+
+
+@router.get("/prices", response_model=List[CatalogPriceResponse])
+def get_prices(
+    skip: int = 0,
+    limit: int = 100,
+    catalog_id: Optional[List[str]] = Query(None, description="Фильтр по позициям каталога"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Получить цены позиций каталога"""
+    query = db.query(CatalogPrice)
+    if catalog_id:
+        query = query.filter(CatalogPrice.catalog_id.in_(catalog_id))
+    return query.order_by(CatalogPrice.catalog_id).offset(skip).limit(limit).all()
+
+
 # ============= КАТАЛОГ =============
 
 @router.post("/", response_model=CatalogResponse, status_code=201)
@@ -1,27 +1,41 @@
-from fastapi import APIRouter, Depends, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi import (
+    APIRouter, BackgroundTasks, Depends, HTTPException, Query, WebSocket, WebSocketDisconnect
+)
 from sqlalchemy.orm import Session
-from typing import List, Dict
+from typing import List, Dict, Any, Iterable, Optional
 from datetime import datetime
+import json
 
-from ..database import get_db
+from ..database import get_db, SessionLocal
 from ..models.user import User
-from ..models.chat import ChatMessage, Consultation, Comment
+from ..models.chat import ChatMessage, ChatMessageArchive, Consultation, Comment
 from ..models.project import Project
 from ..schemas.chat import (
-    ChatMessageCreate, ChatMessageResponse,
+    ChatMessageCreate, ChatMessageResponse, ConversationResponse,
     ConsultationCreate, ConsultationUpdate, ConsultationResponse,
-    CommentCreate, CommentResponse
+    CommentCreate, CommentResponse, SearchResult
 )
-from .auth import get_current_user
+from ..services.pubsub import Broker, broker as default_broker
+from ..services.connections import ClientConnection, connection_stats
+from ..services.scene_sync import scene_hub
+from ..services.chat_service import ChatService
+from ..services.search_service import SearchService
+from ..services.consultation_queue import ConsultationQueue, ConsultantLoadTracker
+from ..services.consultation_scheduler import ConsultationScheduler
+from ..services.analytics import AnalyticsService
+from .auth import get_current_user, get_user_from_token
 
 router = APIRouter()
 
+CHAT_CHANNEL = "chat"
+
 
 # ============= СООБЩЕНИЯ ЧАТА =============
 
 @router.post("/messages", response_model=ChatMessageResponse, status_code=201)
 def send_message(
     message: ChatMessageCreate,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
@@ -36,6 +50,7 @@ def send_message(
             raise HTTPException(status_code=404, detail="Получатель не найден")
     
     # Проверка проекта
+    project = None
     if message.project_id:
         project = db.query(Project).filter(Project.id == message.project_id).first()
         if not project:
@@ -54,9 +69,23 @@ def send_message(
         message=message.message
     )
     db.add(db_message)
+    db.flush()
+    ChatService(db).record_message(db_message, project)
     db.commit()
     db.refresh(db_message)
     
+    # Личное сообщение получает адресат, сообщение в проекте - его участники
+    if message.recipient_id:
+        recipients = [message.recipient_id]
+    elif project:
+        recipients = [project.user_id, project.designer_id]
+    else:
+        recipients = []
+    notify_users(
+        background_tasks, recipients, "chat_message",
+        ChatMessageResponse.model_validate(db_message), exclude=current_user.id
+    )
+    
     return db_message
 
 
@@ -72,28 +101,23 @@ def get_messages(
     """
     Получить сообщения чата
     выделитьСрочные(): void
+    Старые сообщения прозрачно читаются из архива
     """
-    query = db.query(ChatMessage)
-    
-    # Фильтрация по получателю или отправителю
-    if recipient_id:
-        query = query.filter(
-            ((ChatMessage.sender_id == current_user.id) & (ChatMessage.recipient_id == recipient_id)) |
-            ((ChatMessage.sender_id == recipient_id) & (ChatMessage.recipient_id == current_user.id))
-        )
-    else:
-        # Все сообщения пользователя
-        query = query.filter(
-            (ChatMessage.sender_id == current_user.id) | 
-            (ChatMessage.recipient_id == current_user.id)
-        )
-    
-    # Фильтрация по проекту
-    if project_id:
-        query = query.filter(ChatMessage.project_id == project_id)
-    
-    messages = query.order_by(ChatMessage.created_at.desc()).offset(skip).limit(limit).all()
-    return messages
+    return ChatService(db).get_messages(current_user.id, recipient_id, project_id, skip, limit)
+
+
+@router.get("/conversations", response_model=List[ConversationResponse])
+def get_conversations(
+    skip: int = 0,
+    limit: int = 50,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Список диалогов пользователя с последним сообщением и числом непрочитанных
+    Читается из сводной таблицы одним запросом
+    """
+    return ChatService(db).get_conversations(current_user.id, skip, limit)
 
 
 @router.put("/messages/{message_id}/read")
@@ -103,7 +127,10 @@ def mark_message_as_read(
     current_user: User = Depends(get_current_user)
 ):
     """Пометить сообщение как прочитанное"""
-    message = db.query(ChatMessage).filter(ChatMessage.id == message_id).first()
+    message = (
+        db.query(ChatMessage).filter(ChatMessage.id == message_id).first()
+        or db.query(ChatMessageArchive).filter(ChatMessageArchive.id == message_id).first()
+    )
     if not message:
         raise HTTPException(status_code=404, detail="Сообщение не найдено")
     
@@ -111,24 +138,59 @@ def mark_message_as_read(
     if message.recipient_id != current_user.id:
         raise HTTPException(status_code=403, detail="Нет доступа")
     
-    message.is_read = True
-    db.commit()
+    ChatService(db).mark_read(current_user.id, message.sender_id, message_id=message_id)
     
     return {"message": "Сообщение помечено как прочитанное"}
 
 
+@router.put("/messages/read")
+def mark_conversation_as_read(
+    peer_id: int,
+    up_to_message_id: Optional[int] = None,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Пометить прочитанными все входящие сообщения от собеседника
+    (до up_to_message_id включительно, если указан) одним запросом
+    """
+    marked = ChatService(db).mark_read(
+        current_user.id, peer_id, up_to_message_id=up_to_message_id
+    )
+    
+    return {"marked_count": marked}
+
+
 @router.get("/messages/unread/count")
 def get_unread_count(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Получить количество непрочитанных сообщений"""
-    count = db.query(ChatMessage).filter(
-        ChatMessage.recipient_id == current_user.id,
-        ChatMessage.is_read == False
-    ).count()
+    """Получить количество непрочитанных сообщений (всего и по отправителям)"""
+    by_sender = ChatService(db).get_unread_counts(current_user.id)
     
-    return {"unread_count": count}
+    return {"unread_count": sum(by_sender.values()), "by_sender": by_sender}
+
+
+@router.get("/search", response_model=List[SearchResult])
+def search(
+    q: str = Query(..., min_length=1),
+    skip: int = 0,
+    limit: int = 20,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Полнотекстовый поиск по своим сообщениям и комментариям доступных проектов
+    Последнее слово ищется по префиксу (поиск при вводе)
+    """
+    return SearchService(db).search(
+        q,
+        current_user.id,
+        see_all_projects=current_user.role in ["manager", "consultant"],
+        skip=skip,
+        limit=limit
+    )
 
 
 # ============= КОНСУЛЬТАЦИИ =============
@@ -175,22 +237,30 @@ def get_consultations(
 ):
     """Получить консультации"""
     query = db.query(Consultation)
+    if status:
+        query = query.filter(Consultation.status == status)
+    
+    if current_user.role in ["designer", "consultant"]:
+        # Консультанты видят назначенные им или pending: два запроса по индексам
+        # (очередь pending - частичный индекс, свои - по consultant_id) вместо OR
+        top = skip + limit
+        pending = query.filter(Consultation.status == "pending").order_by(
+            Consultation.created_at.desc()
+        ).limit(top).all()
+        mine = query.filter(Consultation.consultant_id == current_user.id).order_by(
+            Consultation.created_at.desc()
+        ).limit(top).all()
+        merged = {consultation.id: consultation for consultation in pending + mine}
+        consultations = sorted(
+            merged.values(), key=lambda c: (c.created_at or datetime.min, c.id), reverse=True
+        )
+        return consultations[skip:top]
     
-    # Фильтрация по роли
     if current_user.role == "client":
         # Клиент видит только свои запросы
         query = query.filter(Consultation.client_id == current_user.id)
-    elif current_user.role in ["designer", "consultant"]:
-        # Консультанты видят назначенные им или pending
-        query = query.filter(
-            (Consultation.consultant_id == current_user.id) |
-            (Consultation.status == "pending")
-        )
     # Менеджеры видят все
     
-    if status:
-        query = query.filter(Consultation.status == status)
-    
     consultations = query.order_by(Consultation.created_at.desc()).offset(skip).limit(limit).all()
     return consultations
 
@@ -219,6 +289,7 @@ def get_consultation(
 def update_consultation(
     consultation_id: int,
     consultation_update: ConsultationUpdate,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
@@ -233,30 +304,67 @@ def update_consultation(
     if current_user.role not in ["designer", "consultant", "manager"]:
         raise HTTPException(status_code=403, detail="Недостаточно прав")
     
+    tracker = ConsultantLoadTracker(db)
+    analytics = AnalyticsService(db)
+    project = None
+    if consultation.project_id:
+        project = db.query(Project).filter(Project.id == consultation.project_id).first()
+    updates = consultation_update.dict(exclude_unset=True, exclude={"consultant_id"})
+    reassigning = bool(
+        consultation_update.consultant_id and consultation_update.consultant_id != consultation.consultant_id
+    )
+    was_completed = consultation.status == "completed"
+    
+    # Повторное открытие (или переназначение) завершенной консультации:
+    # ее вклад вычитается из счетчиков и итогов, повторное завершение учтется заново
+    if was_completed and (reassigning or updates.get("status", "completed") != "completed"):
+        if consultation.consultant_id:
+            tracker.on_completed(consultation, sign=-1)
+        analytics.on_consultation_completed(consultation, project, sign=-1)
+        consultation.completed_at = None
+        was_completed = False
+    
     # Назначение консультанта
-    if consultation_update.consultant_id:
+    if reassigning:
         consultant = db.query(User).filter(User.id == consultation_update.consultant_id).first()
         if not consultant or consultant.role not in ["designer", "consultant"]:
             raise HTTPException(status_code=400, detail="Неверный консультант")
+        if consultation.consultant_id:
+            tracker.on_unassigned(consultation.consultant_id)
+        tracker.on_assigned(consultation_update.consultant_id)
         consultation.consultant_id = consultation_update.consultant_id
+        consultation.assigned_at = datetime.utcnow()
         consultation.status = "assigned"
     
     # Обновление других полей
-    for key, value in consultation_update.dict(exclude_unset=True, exclude={"consultant_id"}).items():
+    for key, value in updates.items():
         setattr(consultation, key, value)
     
     # Установка времени завершения
     if consultation_update.status == "completed" and not consultation.completed_at:
         consultation.completed_at = datetime.utcnow()
     
+    # Счетчики нагрузки консультанта обновляются в той же транзакции
+    if consultation.status == "completed" and not was_completed:
+        if consultation.consultant_id:
+            tracker.on_completed(consultation)
+        analytics.on_consultation_completed(consultation, project)
+    
     db.commit()
     db.refresh(consultation)
+    
+    notify_users(
+        background_tasks, [consultation.client_id, consultation.consultant_id],
+        "consultation_updated", ConsultationResponse.model_validate(consultation),
+        exclude=current_user.id
+    )
     return consultation
 
 
 @router.post("/consultations/{consultation_id}/assign")
 def assign_consultation_to_self(
     consultation_id: int,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
@@ -264,25 +372,79 @@ def assign_consultation_to_self(
     if current_user.role not in ["designer", "consultant"]:
         raise HTTPException(status_code=403, detail="Недостаточно прав")
     
-    consultation = db.query(Consultation).filter(Consultation.id == consultation_id).first()
-    if not consultation:
-        raise HTTPException(status_code=404, detail="Консультация не найдена")
-    
-    if consultation.consultant_id:
+    # Атомарное назначение: из конкурирующих запросов выигрывает один
+    if not ConsultationQueue(db).claim(consultation_id, current_user.id):
+        exists = db.query(Consultation.id).filter(Consultation.id == consultation_id).first()
+        if not exists:
+            raise HTTPException(status_code=404, detail="Консультация не найдена")
         raise HTTPException(status_code=400, detail="Консультация уже назначена")
     
-    consultation.consultant_id = current_user.id
-    consultation.status = "assigned"
-    db.commit()
+    consultation = db.query(Consultation).filter(Consultation.id == consultation_id).first()
     
+    notify_users(
+        background_tasks, [consultation.client_id], "consultation_updated",
+        ConsultationResponse.model_validate(consultation)
+    )
     return {"message": "Консультация назначена"}
 
 
+@router.post("/consultations/claim-next", response_model=ConsultationResponse)
+def claim_next_consultation(
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Забрать следующую консультацию из очереди (по приоритету, затем по возрасту)"""
+    if current_user.role not in ["designer", "consultant"]:
+        raise HTTPException(status_code=403, detail="Недостаточно прав")
+    
+    consultation = ConsultationQueue(db).claim_next(current_user.id)
+    if not consultation:
+        raise HTTPException(status_code=404, detail="Нет ожидающих консультаций")
+    
+    notify_users(
+        background_tasks, [consultation.client_id], "consultation_updated",
+        ConsultationResponse.model_validate(consultation)
+    )
+    return consultation
+
+
+@router.post("/consultations/auto-assign")
+def auto_assign_consultations(
+    background_tasks: BackgroundTasks,
+    limit: int = Query(100, ge=1, le=1000),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Распределить ожидающие консультации между консультантами (только для менеджеров)"""
+    if current_user.role != "manager":
+        raise HTTPException(status_code=403, detail="Недостаточно прав")
+    
+    assigned = ConsultationScheduler(db).assign_pending(limit)
+    if assigned:
+        consultations = db.query(Consultation).filter(
+            Consultation.id.in_([consultation_id for consultation_id, _ in assigned])
+        ).all()
+        for consultation in consultations:
+            notify_users(
+                background_tasks, [consultation.client_id, consultation.consultant_id],
+                "consultation_updated", ConsultationResponse.model_validate(consultation)
+            )
+    
+    return {
+        "assigned": [
+            {"consultation_id": consultation_id, "consultant_id": consultant_id}
+            for consultation_id, consultant_id in assigned
+        ]
+    }
+
+
 # ============= КОММЕНТАРИИ =============
 
 @router.post("/comments", response_model=CommentResponse, status_code=201)
 def create_comment(
     comment: CommentCreate,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
@@ -309,6 +471,10 @@ def create_comment(
     db.commit()
     db.refresh(db_comment)
     
+    notify_users(
+        background_tasks, [project.user_id, project.designer_id], "comment_created",
+        CommentResponse.model_validate(db_comment), exclude=current_user.id
+    )
     return db_comment
 
 
@@ -361,46 +527,119 @@ def delete_comment(
 # ============= WebSocket для реального времени =============
 
 class ConnectionManager:
-    """Менеджер WebSocket соединений для чата в реальном времени"""
+    """
+    Менеджер WebSocket соединений для чата в реальном времени
+    Сообщения идут через брокер, чтобы доставка работала при нескольких воркерах.
+    Каждое соединение отправляет данные из своей очереди (services.connections),
+    поэтому медленный клиент не задерживает остальных.
+    """
     
-    def __init__(self):
-        self.active_connections: Dict[int, List[WebSocket]] = {}
+    def __init__(self, broker: Broker = default_broker):
+        self.active_connections: Dict[int, List[ClientConnection]] = {}
+        self.broker = broker
+        self.broker.add_listener(CHAT_CHANNEL, self._deliver_local)
     
-    async def connect(self, websocket: WebSocket, user_id: int):
+    async def connect(self, websocket: WebSocket, user_id: int) -> ClientConnection:
         await websocket.accept()
+        connection = ClientConnection(
+            websocket, on_close=lambda closed: self._remove(closed, user_id)
+        )
         if user_id not in self.active_connections:
             self.active_connections[user_id] = []
-        self.active_connections[user_id].append(websocket)
-    
-    def disconnect(self, websocket: WebSocket, user_id: int):
-        if user_id in self.active_connections:
-            self.active_connections[user_id].remove(websocket)
-            if not self.active_connections[user_id]:
+        self.active_connections[user_id].append(connection)
+        return connection
+    
+    def disconnect(self, connection: ClientConnection, user_id: int):
+        connection.close()
+        self._remove(connection, user_id)
+    
+    def _remove(self, connection: ClientConnection, user_id: int):
+        connections = self.active_connections.get(user_id)
+        if connections and connection in connections:
+            connections.remove(connection)
+            if not connections:
                 del self.active_connections[user_id]
     
     async def send_personal_message(self, message: str, user_id: int):
-        if user_id in self.active_connections:
-            for connection in self.active_connections[user_id]:
-                await connection.send_text(message)
+        if self.broker.is_local and user_id not in self.active_connections:
+            return
+        await self.broker.publish(CHAT_CHANNEL, {"user_id": user_id, "message": message})
+    
+    async def _deliver_local(self, payload: Dict[str, Any]):
+        """Поставить сообщение в очереди соединений пользователя в этом процессе"""
+        for connection in list(self.active_connections.get(payload["user_id"], [])):
+            connection.send(payload["message"])
+    
+    def stats(self) -> Dict[str, int]:
+        return {
+            "online_users": len(self.active_connections),
+            "chat_connections": sum(len(c) for c in self.active_connections.values()),
+        }
 
 
 manager = ConnectionManager()
 
 
+def notify_users(
+    background_tasks: BackgroundTasks,
+    user_ids: Iterable[Optional[int]],
+    event_type: str,
+    data: Any,
+    exclude: Optional[int] = None
+):
+    """
+    Отправить событие пользователям через WebSocket после ответа на запрос
+    data - Pydantic схема, сериализуется в JSON
+    """
+    message = json.dumps(
+        {"type": event_type, "data": data.model_dump(mode="json")},
+        ensure_ascii=False
+    )
+    for user_id in set(user_ids):
+        if user_id is not None and user_id != exclude:
+            background_tasks.add_task(manager.send_personal_message, message, user_id)
+
+
 @router.websocket("/ws/{user_id}")
-async def websocket_endpoint(websocket: WebSocket, user_id: int):
+async def websocket_endpoint(websocket: WebSocket, user_id: int, token: str = Query(...)):
     """
     WebSocket endpoint для чата в реальном времени
     Использование:
-    ws://localhost:8000/api/chat/ws/{user_id}
+    ws://localhost:8000/api/chat/ws/{user_id}?token=<JWT>
+    
+    Сервер присылает события {"type": ..., "data": {...}}:
+    chat_message, consultation_updated, comment_created
     """
-    await manager.connect(websocket, user_id)
+    db = SessionLocal()
+    try:
+        current_user = get_user_from_token(token, db)
+    except HTTPException:
+        current_user = None
+    finally:
+        db.close()
+    
+    # Подключиться можно только к своему каналу
+    if current_user is None or current_user.id != user_id:
+        await websocket.close(code=1008)
+        return
+    
+    connection = await manager.connect(websocket, user_id)
     try:
         while True:
-            # Ожидаем сообщения от клиента
-            data = await websocket.receive_text()
-            # Здесь можно обрабатывать входящие сообщения
-            # и отправлять их другим пользователям
-            await websocket.send_text(f"Message received: {data}")
+            # Сообщения отправляются через POST /messages,
+            # входящие данные от клиента (в т.ч. ответ на ping) только поддерживают соединение
+            await websocket.receive_text()
+            connection.touch()
     except WebSocketDisconnect:
-        manager.disconnect(websocket, user_id)
+        pass
+    finally:
+        manager.disconnect(connection, user_id)
+
+
+@router.get("/connections/stats")
+def get_connection_stats(current_user: User = Depends(get_current_user)):
+    """Метрики WebSocket соединений текущего воркера (только для менеджера)"""
+    if current_user.role != "manager":
+        raise HTTPException(status_code=403, detail="Недостаточно прав")
+    
+    return {**connection_stats, **manager.stats(), **scene_hub.stats()}
@@ -1,13 +1,22 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import insert, update, delete
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Dict, Any, Optional
 
 from ..database import get_db
 from ..models.user import User
 from ..models.model import Model
 from ..models.room import Room
-from ..schemas.model import ModelCreate, ModelUpdate, ModelResponse
+from ..models.project import Project
+from ..schemas.model import (
+    ModelCreate, ModelUpdate, ModelResponse,
+    ModelBatchRequest, ModelBatchItemResult, ModelBatchResponse
+)
+from ..services.scene_sync import scene_hub, entity_fields, changed_fields
+from ..services.cost_analysis import CostAnalyzer
+from ..services.change_tracking import touch_rooms
 from .auth import get_current_user
+from .validator import validate_on_write, WRITE_VALIDATION_PATTERN
 
 router = APIRouter()
 
@@ -15,6 +24,7 @@ router = APIRouter()
 @router.post("/", response_model=ModelResponse, status_code=201)
 def create_model(
     model: ModelCreate,
+    validate: Optional[str] = Query(None, pattern=WRITE_VALIDATION_PATTERN),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
@@ -26,7 +36,6 @@ def create_model(
             raise HTTPException(status_code=404, detail="Комната не найдена")
         project = room.project
     elif model.project_id:
-        from ..models.project import Project
         project = db.query(Project).filter(Project.id == model.project_id).first()
         if not project:
             raise HTTPException(status_code=404, detail="Проект не найден")
@@ -40,11 +49,142 @@ def create_model(
     
     db_model = Model(**model.dict())
     db.add(db_model)
+    db.flush()
+    touch_rooms(db, [db_model.room_id])
+    cost = CostAnalyzer(db)
+    cost.apply_change(project.id, None, cost.model_entry(db_model.id))
+    validation = validate_on_write(db, db_model, validate)
     db.commit()
     db.refresh(db_model)
+    db_model.validation = validation
+    scene_hub.publish(project.id, "model", db_model.id, entity_fields(db_model))
     return db_model
 
 
+@router.post("/batch", response_model=ModelBatchResponse)
+def batch_models(
+    batch: ModelBatchRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Пакетное создание/обновление/удаление моделей одного проекта
+    Одна проверка прав, пакетные запросы и одна транзакция на весь пакет
+    """
+    project = db.query(Project).filter(Project.id == batch.project_id).first()
+    if not project:
+        raise HTTPException(status_code=404, detail="Проект не найден")
+    
+    if (project.user_id != current_user.id and 
+        project.designer_id != current_user.id and
+        current_user.role != "manager"):
+        raise HTTPException(status_code=403, detail="Нет доступа к этому проекту")
+    
+    room_ids = {
+        room_id for (room_id,) in
+        db.query(Room.id).filter(Room.project_id == project.id).all()
+    }
+    
+    # Модели, затрагиваемые обновлениями и удалениями, - одним запросом
+    target_ids = {item.id for item in batch.update} | set(batch.delete)
+    owned_rooms: Dict[int, Any] = {}
+    if target_ids:
+        owned_rooms = {
+            model_id: room_id for (model_id, project_id, room_id) in
+            db.query(Model.id, Model.project_id, Model.room_id).filter(
+                Model.id.in_(target_ids)
+            ).all()
+            if project_id == project.id or room_id in room_ids
+        }
+    owned_ids = set(owned_rooms)
+    
+    results: List[ModelBatchItemResult] = []
+    
+    # Создание
+    create_rows: List[Dict[str, Any]] = []
+    create_results: List[ModelBatchItemResult] = []
+    for index, item in enumerate(batch.create):
+        if item.room_id and item.room_id not in room_ids:
+            results.append(ModelBatchItemResult(
+                operation="create", index=index, success=False,
+                error="Комната не найдена в проекте"
+            ))
+            continue
+        row = item.dict()
+        row["project_id"] = project.id
+        create_rows.append(row)
+        create_results.append(ModelBatchItemResult(operation="create", index=index, success=True))
+        results.append(create_results[-1])
+    
+    # Обновление
+    update_rows: List[Dict[str, Any]] = []
+    for index, item in enumerate(batch.update):
+        if item.id not in owned_ids:
+            results.append(ModelBatchItemResult(
+                operation="update", index=index, id=item.id, success=False,
+                error="Модель не найдена"
+            ))
+            continue
+        row = item.dict(exclude_unset=True)
+        row["id"] = item.id
+        if len(row) > 1:
+            update_rows.append(row)
+        results.append(ModelBatchItemResult(operation="update", index=index, id=item.id, success=True))
+    
+    # Удаление
+    delete_ids: List[int] = []
+    for index, model_id in enumerate(batch.delete):
+        if model_id not in owned_ids:
+            results.append(ModelBatchItemResult(
+                operation="delete", index=index, id=model_id, success=False,
+                error="Модель не найдена"
+            ))
+            continue
+        delete_ids.append(model_id)
+        results.append(ModelBatchItemResult(operation="delete", index=index, id=model_id, success=True))
+    
+    try:
+        if create_rows:
+            new_ids = db.execute(
+                insert(Model).returning(Model.id, sort_by_parameter_order=True),
+                create_rows
+            ).scalars().all()
+            for result, new_id in zip(create_results, new_ids):
+                result.id = new_id
+        if update_rows:
+            db.execute(update(Model), update_rows)
+        if delete_ids:
+            db.execute(
+                delete(Model).where(Model.id.in_(delete_ids)),
+                execution_options={"synchronize_session": False}
+            )
+        touch_rooms(db, (
+            [row.get("room_id") for row in create_rows] +
+            [owned_rooms[row["id"]] for row in update_rows] +
+            [owned_rooms[model_id] for model_id in delete_ids]
+        ))
+        if create_rows or delete_ids or any("material_id" in row for row in update_rows):
+            CostAnalyzer(db).refresh(project.id)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    
+    for row, result in zip(create_rows, create_results):
+        scene_hub.publish(project.id, "model", result.id, {**row, "id": result.id})
+    for row in update_rows:
+        scene_hub.publish(project.id, "model", row["id"], row)
+    for model_id in delete_ids:
+        scene_hub.publish(project.id, "model", model_id, None)
+    
+    return ModelBatchResponse(
+        results=results,
+        created=len(create_rows),
+        updated=len(update_rows),
+        deleted=len(delete_ids)
+    )
+
+
 @router.get("/room/{room_id}", response_model=List[ModelResponse])
 def get_room_models(
     room_id: int,
@@ -70,6 +210,7 @@ def get_room_models(
 def update_model(
     model_id: int,
     model_update: ModelUpdate,
+    validate: Optional[str] = Query(None, pattern=WRITE_VALIDATION_PATTERN),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
@@ -83,7 +224,6 @@ def update_model(
         room = db.query(Room).filter(Room.id == model.room_id).first()
         project = room.project
     else:
-        from ..models.project import Project
         project = db.query(Project).filter(Project.id == model.project_id).first()
     
     if (project.user_id != current_user.id and 
@@ -91,11 +231,22 @@ def update_model(
         current_user.role != "manager"):
         raise HTTPException(status_code=403, detail="Нет доступа")
     
-    for key, value in model_update.dict(exclude_unset=True).items():
+    changes = changed_fields(model, model_update.dict(exclude_unset=True))
+    cost = CostAnalyzer(db)
+    cost_before = cost.model_entry(model.id) if "material_id" in changes else None
+    for key, value in changes.items():
         setattr(model, key, value)
     
+    if changes:
+        touch_rooms(db, [model.room_id])
+    if "material_id" in changes:
+        db.flush()
+        cost.apply_change(project.id, cost_before, cost.model_entry(model.id))
+    validation = validate_on_write(db, model, validate)
     db.commit()
     db.refresh(model)
+    model.validation = validation
+    scene_hub.publish(project.id, "model", model.id, changes)
     return model
 
 
@@ -110,6 +261,16 @@ def delete_model(
     if not model:
         raise HTTPException(status_code=404, detail="Модель не найдена")
     
+    project_id = model.project_id
+    if project_id is None and model.room_id:
+        project_id = db.query(Room.project_id).filter(Room.id == model.room_id).scalar()
+    
+    cost = CostAnalyzer(db)
+    cost_before = cost.model_entry(model_id)
+    touch_rooms(db, [model.room_id])
     db.delete(model)
+    if project_id is not None:
+        cost.apply_change(project_id, cost_before, None)
     db.commit()
+    scene_hub.publish(project_id, "model", model_id, None)
     return {"message": "Модель удалена"}
@@ -1,11 +1,15 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 
 from ..database import get_db
 from ..models.user import User
 from ..models.project import Project
-from ..schemas.project import ProjectCreate, ProjectUpdate, ProjectResponse, ProjectWithRooms
+from ..schemas.project import (
+    ProjectCreate, ProjectUpdate, ProjectResponse, ProjectWithRooms, ProjectExport
+)
+from ..services.project_service import ProjectService
+from ..services.validation_store import ValidationStore
 from .auth import get_current_user
 
 router = APIRouter()
@@ -111,6 +115,59 @@ def delete_project(
     if project.user_id != current_user.id and current_user.role != "manager":
         raise HTTPException(status_code=403, detail="Нет прав на удаление")
     
+    ValidationStore(db).clear(project.id)
     db.delete(project)
     db.commit()
     return {"message": "Проект удален"}
+
+
+@router.get("/{project_id}/export", response_model=ProjectExport)
+def export_project(
+    project_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Экспортировать проект с комнатами и моделями"""
+    project = db.query(Project).filter(Project.id == project_id).first()
+    if not project:
+        raise HTTPException(status_code=404, detail="Проект не найден")
+    
+    if (project.user_id != current_user.id and 
+        project.designer_id != current_user.id and
+        current_user.role not in ["manager", "consultant"]):
+        raise HTTPException(status_code=403, detail="Нет доступа к этому проекту")
+    
+    return ProjectService(db).export_project(project)
+
+
+@router.post("/import", response_model=ProjectResponse, status_code=201)
+def import_project(
+    data: ProjectExport,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Импортировать проект из формата экспорта
+    Комнаты и модели создаются пакетно в одной транзакции
+    """
+    return ProjectService(db).import_project(data, current_user.id)
+
+
+@router.post("/{project_id}/duplicate", response_model=ProjectResponse, status_code=201)
+def duplicate_project(
+    project_id: int,
+    name: Optional[str] = None,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Создать копию проекта (например, шаблонной квартиры)"""
+    project = db.query(Project).filter(Project.id == project_id).first()
+    if not project:
+        raise HTTPException(status_code=404, detail="Проект не найден")
+    
+    if (project.user_id != current_user.id and 
+        project.designer_id != current_user.id and
+        current_user.role not in ["manager", "consultant"]):
+        raise HTTPException(status_code=403, detail="Нет доступа к этому проекту")
+    
+    return ProjectService(db).duplicate_project(project, current_user.id, name)
@@ -1,8 +1,10 @@
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from typing import List
 
-from ..database import get_db
+from ..database import get_db, SessionLocal
 from ..models.user import User
 from ..models.recommendation import Recommendation, Task
 from ..models.project import Project
@@ -11,6 +13,8 @@ from ..schemas.recommendation import (
     TaskCreate, TaskUpdate, TaskResponse
 )
 from ..services.recommendation_system import RecommendationSystem
+from ..services.llm_client import LLMError, sse_event
+from ..services.analytics import AnalyticsService
 from .auth import get_current_user
 
 router = APIRouter()
@@ -18,6 +22,19 @@ router = APIRouter()
 
 # ============= РЕКОМЕНДАЦИИ =============
 
+def _get_project(db: Session, project_id: int, current_user: User) -> Project:
+    """Проект с проверкой прав доступа к генерации рекомендаций"""
+    project = db.query(Project).filter(Project.id == project_id).first()
+    if not project:
+        raise HTTPException(status_code=404, detail="Проект не найден")
+    
+    if (project.user_id != current_user.id and 
+        project.designer_id != current_user.id and
+        current_user.role not in ["manager", "consultant"]):
+        raise HTTPException(status_code=403, detail="Нет доступа к проекту")
+    return project
+
+
 @router.post("/", response_model=RecommendationResponse, status_code=201)
 def create_recommendation(
     recommendation: RecommendationCreate,
@@ -37,15 +54,16 @@ def create_recommendation(
     
     db_recommendation = Recommendation(**recommendation.dict())
     db.add(db_recommendation)
+    db.flush()
+    AnalyticsService(db).on_recommendations(project, [db_recommendation])
     db.commit()
     db.refresh(db_recommendation)
     return db_recommendation
 
 
 @router.post("/generate/{project_id}", response_model=List[RecommendationResponse])
-def generate_recommendations(
+async def generate_recommendations(
     project_id: int,
-    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
@@ -53,25 +71,70 @@ def generate_recommendations(
     Сгенерировать AI-рекомендации для проекта
     Реализация метода: предложитьАльтернативы(проект: Проект)
     
-    ⚠️ Использует заглушки. Интегрируйте LLM для реальной генерации.
+    Все типы рекомендаций генерируются одним запросом к LLM;
+    запросы к БД выполняются в пуле потоков
     """
-    project = db.query(Project).filter(Project.id == project_id).first()
-    if not project:
-        raise HTTPException(status_code=404, detail="Проект не найден")
-    
-    # Проверка прав доступа
-    if (project.user_id != current_user.id and 
-        project.designer_id != current_user.id and
-        current_user.role not in ["manager", "consultant"]):
-        raise HTTPException(status_code=403, detail="Нет доступа к проекту")
+    project = await run_in_threadpool(_get_project, db, project_id, current_user)
     
     # Генерация рекомендаций
     rec_system = RecommendationSystem(db)
-    recommendations = rec_system.suggest_alternatives(project)
+    try:
+        recommendations = await rec_system.suggest_alternatives(project)
+    except LLMError as e:
+        raise HTTPException(status_code=502, detail=f"Ошибка генерации рекомендаций: {e}")
     
     return recommendations
 
 
+@router.post("/generate/{project_id}/stream")
+def stream_recommendations(
+    project_id: int,
+    request: Request,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Сгенерировать AI-рекомендации с потоковой передачей (Server-Sent Events)
+    
+    События:
+    - token: {"text": "..."} - фрагмент ответа модели
+    - result: [...] - сохраненные рекомендации (в конце)
+    - error: {"detail": "..."}
+    
+    Если клиент закрывает соединение, запрос к LLM прерывается и
+    рекомендации не сохраняются.
+    """
+    _get_project(db, project_id, current_user)
+    
+    async def events():
+        # Сессия запроса закрывается до начала передачи ответа - нужна своя
+        session = SessionLocal()
+        try:
+            rec_system = RecommendationSystem(session)
+            stream_project = await run_in_threadpool(
+                lambda: session.query(Project).filter(Project.id == project_id).first()
+            )
+            async for event, data in rec_system.stream_alternatives(stream_project):
+                if await request.is_disconnected():
+                    return
+                if event == "token":
+                    yield sse_event(event, {"text": data})
+                else:
+                    yield sse_event(event, [
+                        RecommendationResponse.model_validate(r).model_dump(mode="json") for r in data
+                    ])
+        except (LLMError, ValueError) as e:
+            yield sse_event("error", {"detail": f"Ошибка генерации рекомендаций: {e}"})
+        finally:
+            await run_in_threadpool(session.close)
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @router.get("/project/{project_id}", response_model=List[RecommendationResponse])
 def get_project_recommendations(
     project_id: int,
@@ -109,9 +172,14 @@ def update_recommendation(
     if not recommendation:
         raise HTTPException(status_code=404, detail="Рекомендация не найдена")
     
+    was_applied = bool(recommendation.is_applied)
     for key, value in recommendation_update.dict(exclude_unset=True).items():
         setattr(recommendation, key, value)
     
+    if bool(recommendation.is_applied) != was_applied:
+        AnalyticsService(db).on_recommendation_applied(
+            recommendation.project, recommendation, bool(recommendation.is_applied)
+        )
     db.commit()
     db.refresh(recommendation)
     return recommendation
@@ -133,6 +201,7 @@ def delete_recommendation(
     if not recommendation:
         raise HTTPException(status_code=404, detail="Рекомендация не найдена")
     
+    AnalyticsService(db).on_recommendations(recommendation.project, [recommendation], sign=-1)
     db.delete(recommendation)
     db.commit()
     return {"message": "Рекомендация удалена"}
@@ -1,13 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 
 from ..database import get_db
 from ..models.user import User
 from ..models.project import Project
 from ..models.room import Room
 from ..schemas.room import RoomCreate, RoomUpdate, RoomResponse
+from ..services.scene_sync import scene_hub, entity_fields, changed_fields
+from ..services.change_tracking import touch_rooms
 from .auth import get_current_user
+from .validator import validate_on_write, WRITE_VALIDATION_PATTERN
 
 router = APIRouter()
 
@@ -15,6 +18,7 @@ router = APIRouter()
 @router.post("/", response_model=RoomResponse, status_code=201)
 def create_room(
     room: RoomCreate,
+    validate: Optional[str] = Query(None, pattern=WRITE_VALIDATION_PATTERN),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
@@ -43,8 +47,12 @@ def create_room(
         rotation=room.rotation
     )
     db.add(db_room)
+    db.flush()
+    validation = validate_on_write(db, db_room, validate)
     db.commit()
     db.refresh(db_room)
+    db_room.validation = validation
+    scene_hub.publish(db_room.project_id, "room", db_room.id, entity_fields(db_room))
     return db_room
 
 
@@ -93,6 +101,7 @@ def get_room(
 def update_room(
     room_id: int,
     room_update: RoomUpdate,
+    validate: Optional[str] = Query(None, pattern=WRITE_VALIDATION_PATTERN),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
@@ -107,15 +116,22 @@ def update_room(
         current_user.role != "manager"):
         raise HTTPException(status_code=403, detail="Нет доступа")
     
-    for key, value in room_update.dict(exclude_unset=True).items():
+    changes = changed_fields(room, room_update.dict(exclude_unset=True))
+    for key, value in changes.items():
         setattr(room, key, value)
     
     # Пересчет площади если изменились размеры
-    if room_update.width or room_update.length:
+    if "width" in changes or "length" in changes:
+        changes.update(changed_fields(room, {"area": room.width * room.length}))
         room.area = room.width * room.length
     
+    if changes:
+        touch_rooms(db, [room.id])
+    validation = validate_on_write(db, room, validate)
     db.commit()
     db.refresh(room)
+    room.validation = validation
+    scene_hub.publish(room.project_id, "room", room.id, changes)
     return room
 
 
@@ -138,4 +154,5 @@ def delete_room(
     
     db.delete(room)
     db.commit()
+    scene_hub.publish(project.id, "room", room_id, None)
     return {"message": "Комната удалена"}
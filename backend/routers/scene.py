@@ -0,0 +1,109 @@
+from fastapi import APIRouter, HTTPException, Query, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import or_
+from typing import List, Optional, Set
+import json
+
+from ..database import SessionLocal
+from ..models.project import Project
+from ..models.room import Room
+from ..models.model import Model
+from ..services.scene_sync import scene_hub, LIVE_TRANSFORM_FIELDS
+from .auth import get_user_from_token
+
+router = APIRouter()
+
+
+def _project_model_ids(project_id: int, model_ids: Optional[List[int]] = None) -> Set[int]:
+    """id моделей проекта (в том числе в его помещениях), при model_ids - только из них"""
+    db = SessionLocal()
+    try:
+        room_ids = db.query(Room.id).filter(Room.project_id == project_id)
+        query = db.query(Model.id).filter(or_(Model.project_id == project_id, Model.room_id.in_(room_ids)))
+        if model_ids is not None:
+            query = query.filter(Model.id.in_(model_ids))
+        return {model_id for (model_id,) in query.all()}
+    finally:
+        db.close()
+
+
+def _project_access(project_id: int, token: str) -> bool:
+    """Проверка доступа к сцене проекта, возвращает право редактирования"""
+    db = SessionLocal()
+    try:
+        current_user = get_user_from_token(token, db)
+        project = db.query(Project).filter(Project.id == project_id).first()
+        if not project:
+            raise HTTPException(status_code=404, detail="Проект не найден")
+
+        if (project.user_id != current_user.id and
+            project.designer_id != current_user.id and
+            current_user.role not in ["manager", "consultant"]):
+            raise HTTPException(status_code=403, detail="Нет доступа к этому проекту")
+
+        return (project.user_id == current_user.id or
+                project.designer_id == current_user.id or
+                current_user.role == "manager")
+    finally:
+        db.close()
+
+
+@router.websocket("/ws/project/{project_id}")
+async def scene_websocket(
+    websocket: WebSocket,
+    project_id: int,
+    token: str = Query(...),
+    encoding: str = Query("json")
+):
+    """
+    Канал синхронизации сцены проекта
+    Использование:
+    ws://localhost:8000/api/scene/ws/project/{project_id}?token=<JWT>&encoding=json|msgpack
+
+    Сервер присылает сообщения {"type": "scene_delta", "changes": [...]} с
+    изменившимися полями комнат и моделей. Клиенты с правом редактирования
+    могут транслировать перемещение модели во время перетаскивания:
+    {"type": "move", "model_id": 1, "position": {...}} - такие сообщения
+    не сохраняются в БД, сохранение выполняется через /api/models.
+    Перемещения моделей других проектов отбрасываются.
+    """
+    try:
+        can_edit = await run_in_threadpool(_project_access, project_id, token)
+    except HTTPException:
+        await websocket.close(code=1008)
+        return
+
+    # Модели проекта на момент подключения; созданные позже проверяются по БД
+    known_models = await run_in_threadpool(_project_model_ids, project_id) if can_edit else set()
+    rejected_models: Set[int] = set()
+
+    await websocket.accept()
+    connection = await scene_hub.subscribe(websocket, project_id, encoding)
+    try:
+        while True:
+            data = await websocket.receive_text()
+            connection.touch()
+            try:
+                event = json.loads(data)
+            except ValueError:
+                continue
+
+            if not can_edit or not isinstance(event, dict) or event.get("type") != "move":
+                continue
+
+            model_id = event.get("model_id")
+            if not isinstance(model_id, int) or model_id in rejected_models:
+                continue
+            if model_id not in known_models:
+                if await run_in_threadpool(_project_model_ids, project_id, [model_id]):
+                    known_models.add(model_id)
+                else:
+                    rejected_models.add(model_id)
+                    continue
+
+            fields = {key: event[key] for key in LIVE_TRANSFORM_FIELDS if key in event}
+            scene_hub.publish(project_id, "model", model_id, fields)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        scene_hub.unsubscribe(connection, project_id)
@@ -1,28 +1,48 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
-from typing import Dict, Any
+from typing import Dict, Any, Optional, Union
 
 from ..database import get_db
 from ..models.user import User
 from ..models.project import Project
 from ..models.room import Room
 from ..models.model import Model
-from ..services.validator import Validator
+from ..services.validator import Validator, VALIDATE_ON_WRITE
+from ..services.analytics import AnalyticsService
+from ..services.validation_store import ValidationStore
 from .auth import get_current_user
 
 router = APIRouter()
 
+# Параметр validate эндпоинтов записи помещений и моделей
+WRITE_VALIDATION_PATTERN = "^(off|warn|strict)$"
 
-@router.post("/project/{project_id}")
-def validate_project(
-    project_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
-) -> Dict[str, Any]:
+
+def validate_on_write(
+    db: Session,
+    entity: Union[Room, Model],
+    mode: Optional[str] = None
+) -> Optional[Dict[str, Any]]:
     """
-    Валидация проекта на соответствие стандартам
-    Реализует: проверитьПараметры(параметры: list<string>)
+    Проверка изменяемого помещения/модели перед commit
+    Возвращает результат для ответа (None - проверка выключена);
+    в режиме strict запись с ошибками откатывается (422)
     """
+    mode = mode or VALIDATE_ON_WRITE
+    if mode not in ("warn", "strict"):
+        return None
+    
+    result = Validator(db).validate_write(entity)
+    if mode == "strict" and not result.is_valid:
+        db.rollback()
+        raise HTTPException(
+            status_code=422,
+            detail={"message": "Изменение нарушает нормы", **result.to_dict()}
+        )
+    return result.to_dict()
+
+
+def _get_project(db: Session, project_id: int, current_user: User) -> Project:
     project = db.query(Project).filter(Project.id == project_id).first()
     if not project:
         raise HTTPException(status_code=404, detail="Проект не найден")
@@ -32,11 +52,50 @@ def validate_project(
         project.designer_id != current_user.id and
         current_user.role not in ["manager", "consultant"]):
         raise HTTPException(status_code=403, detail="Нет доступа")
+    return project
+
+
+@router.post("/project/{project_id}")
+def validate_project(
+    project_id: int,
+    changes_only: bool = Query(False, description="Только новые и устраненные проблемы"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+) -> Dict[str, Any]:
+    """
+    Валидация проекта на соответствие стандартам
+    Реализует: проверитьПараметры(параметры: list<string>)
+    Результат сохраняется; new_issues/resolved_issues - разница с прошлой проверкой
+    """
+    project = _get_project(db, project_id, current_user)
     
     validator = Validator(db)
     result = validator.validate_project(project_id)
+    delta = ValidationStore(db).save(project_id, result.issues, validator.rules.version)
+    AnalyticsService(db).on_validation(project, len(result.errors))
+    db.commit()  # Проблемы проекта, результаты проверки комнат (кэш) и итоги аналитики
     
-    return result.to_dict()
+    response = result.to_dict()
+    if changes_only:
+        for key in ("errors", "warnings", "issues"):
+            response.pop(key)
+    response["new_issues"] = delta["new"]
+    response["resolved_issues"] = delta["resolved"]
+    return response
+
+
+@router.get("/project/{project_id}/issues")
+def get_project_issues(
+    project_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+) -> Dict[str, Any]:
+    """
+    Текущие проблемы проекта по последней проверке (без повторной проверки)
+    Помещения, измененные после проверки, перечислены в stale_rooms
+    """
+    _get_project(db, project_id, current_user)
+    return ValidationStore(db).current(project_id)
 
 
 @router.post("/room/{room_id}")
@@ -1,11 +1,11 @@
 from .user import UserBase, UserCreate, UserUpdate, UserResponse, Token, TokenData
-from .project import ProjectBase, ProjectCreate, ProjectUpdate, ProjectResponse, ProjectWithRooms
+from .project import ProjectBase, ProjectCreate, ProjectUpdate, ProjectResponse, ProjectWithRooms, ProjectExport
 from .room import RoomBase, RoomCreate, RoomUpdate, RoomResponse
 from .model import ModelBase, ModelCreate, ModelUpdate, ModelResponse
 
 __all__ = [
     "UserBase", "UserCreate", "UserUpdate", "UserResponse", "Token", "TokenData",
-    "ProjectBase", "ProjectCreate", "ProjectUpdate", "ProjectResponse", "ProjectWithRooms",
+    "ProjectBase", "ProjectCreate", "ProjectUpdate", "ProjectResponse", "ProjectWithRooms", "ProjectExport",
     "RoomBase", "RoomCreate", "RoomUpdate", "RoomResponse",
     "ModelBase", "ModelCreate", "ModelUpdate", "ModelResponse",
 ]
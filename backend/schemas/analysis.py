@@ -0,0 +1,33 @@
+from pydantic import BaseModel
+from datetime import datetime
+from typing import Optional, Dict, Any, List
+
+
+class AnalysisResultSummary(BaseModel):
+    """Результат анализа без details и report (для списков)"""
+    id: int
+    project_id: int
+    analysis_type: str
+    score: Optional[float] = None
+    status: Optional[str] = None
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class AnalysisResultResponse(AnalysisResultSummary):
+    details: Optional[Dict[str, Any]] = None
+    issues: Optional[List[str]] = None
+    suggestions: Optional[List[str]] = None
+    report: Optional[str] = None
+
+
+class AnalysisTrendPoint(BaseModel):
+    analysis_type: str
+    created_at: datetime
+    score: Optional[float] = None
+    status: Optional[str] = None
+
+    class Config:
+        from_attributes = True
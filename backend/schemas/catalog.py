@@ -1,5 +1,6 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional, Dict, Any, List
+from datetime import datetime
 
 
 class MaterialBase(BaseModel):
@@ -81,3 +82,17 @@ class CatalogResponse(CatalogBase):
 
     class Config:
         from_attributes = True
+
+
+class CatalogPriceBase(BaseModel):
+    catalog_id: str
+    price: float = Field(..., ge=0)
+    currency: str = "RUB"
+
+
+class CatalogPriceResponse(CatalogPriceBase):
+    id: int
+    updated_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
@@ -23,6 +23,17 @@ class ChatMessageResponse(ChatMessageBase):
         from_attributes = True
 
 
+class ConversationResponse(BaseModel):
+    thread_key: str
+    peer_id: Optional[int] = None
+    project_id: Optional[int] = None
+    last_message_id: int
+    last_sender_id: int
+    last_message_preview: Optional[str] = None
+    last_message_at: datetime
+    unread_count: int = 0
+
+
 class ConsultationBase(BaseModel):
     topic: str
     description: Optional[str] = None
@@ -38,6 +49,7 @@ class ConsultationUpdate(BaseModel):
     description: Optional[str] = None
     consultant_id: Optional[int] = None
     status: Optional[str] = None
+    priority: Optional[int] = None
 
 
 class ConsultationResponse(ConsultationBase):
@@ -45,7 +57,9 @@ class ConsultationResponse(ConsultationBase):
     client_id: int
     consultant_id: Optional[int] = None
     status: str
+    priority: int = 0
     created_at: datetime
+    assigned_at: Optional[datetime] = None
     completed_at: Optional[datetime] = None
 
     class Config:
@@ -68,3 +82,12 @@ class CommentResponse(CommentBase):
 
     class Config:
         from_attributes = True
+
+
+class SearchResult(BaseModel):
+    type: str  # message, comment
+    id: int
+    project_id: Optional[int] = None
+    snippet: str  # Фрагмент текста с подсветкой <b>...</b>
+    rank: float
+    created_at: datetime
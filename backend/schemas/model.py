@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 
 
 class ModelBase(BaseModel):
@@ -39,6 +39,34 @@ class ModelResponse(ModelBase):
     room_id: Optional[int] = None
     project_id: Optional[int] = None
     material_id: Optional[int] = None
+    validation: Optional[Dict[str, Any]] = None  # Результат проверки при записи (validate=warn|strict)
 
     class Config:
         from_attributes = True
+
+
+class ModelBatchUpdate(ModelUpdate):
+    id: int
+
+
+class ModelBatchRequest(BaseModel):
+    """Пакет изменений моделей одного проекта"""
+    project_id: int
+    create: List[ModelCreate] = []
+    update: List[ModelBatchUpdate] = []
+    delete: List[int] = []
+
+
+class ModelBatchItemResult(BaseModel):
+    operation: str  # create, update, delete
+    index: int  # Позиция элемента в соответствующем списке запроса
+    id: Optional[int] = None
+    success: bool
+    error: Optional[str] = None
+
+
+class ModelBatchResponse(BaseModel):
+    results: List[ModelBatchItemResult]
+    created: int
+    updated: int
+    deleted: int
@@ -1,6 +1,6 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, field_validator
 from datetime import datetime
-from typing import Optional, List
+from typing import Optional, List, Dict
 
 
 class ProjectBase(BaseModel):
@@ -36,3 +36,46 @@ class ProjectWithRooms(ProjectResponse):
 
     class Config:
         from_attributes = True
+
+
+class ExportedModel(BaseModel):
+    """3D модель в формате экспорта проекта"""
+    name: str
+    catalog_id: Optional[str] = None
+    type: str
+    category: Optional[str] = None
+    file_url: Optional[str] = None
+    thumbnail_url: Optional[str] = None
+    dimensions: Optional[Dict[str, float]] = None
+    position: Optional[Dict[str, float]] = None
+    rotation: Optional[Dict[str, float]] = None
+    scale: Optional[Dict[str, float]] = None
+    material_id: Optional[int] = None
+
+
+class ExportedRoom(BaseModel):
+    """Комната в формате экспорта проекта вместе с её моделями"""
+    name: str
+    width: float
+    length: float
+    height: float
+    position: Optional[Dict[str, float]] = None
+    rotation: Optional[Dict[str, float]] = None
+    models: List[ExportedModel] = []
+
+    @field_validator('width', 'length', 'height')
+    @classmethod
+    def validate_positive(cls, v: float) -> float:
+        if v <= 0:
+            raise ValueError('Размеры должны быть положительными')
+        return v
+
+
+class ProjectExport(ProjectBase):
+    """
+    Формат экспорта/импорта проекта
+    ID комнат и моделей не передаются - при импорте создаются новые
+    """
+    designer_id: Optional[int] = None
+    rooms: List[ExportedRoom] = []
+    models: List[ExportedModel] = []  # Модели проекта без комнаты
@@ -35,6 +35,7 @@ class RoomResponse(RoomBase):
     id: int
     project_id: int
     area: Optional[float] = None
+    validation: Optional[Dict[str, Any]] = None  # Результат проверки при записи (validate=warn|strict)
 
     class Config:
         from_attributes = True
@@ -1,3 +1,4 @@
 from .catalog_service import CatalogService
+from .project_service import ProjectService
 
-__all__ = ["CatalogService"]
+__all__ = ["CatalogService", "ProjectService"]
@@ -0,0 +1,124 @@
+"""
+История результатов анализа: прореживание и ряды для графиков
+
+Политика хранения (для каждой пары проект + тип анализа):
+- последний результат хранится всегда
+- за последние ANALYSIS_HISTORY_FULL_DAYS дней - все результаты
+- старше - по одному (последнему) результату за день
+- старше ANALYSIS_HISTORY_MAX_DAYS дней - только последний результат
+
+Прореживание выполняется для проекта после каждого сохранения результата
+и для всей таблицы командой:
+    python -m backend.services.analysis_history compact
+"""
+from sqlalchemy import select, delete, func
+from sqlalchemy.orm import Session
+from datetime import datetime, timedelta
+from typing import List, Optional
+import os
+
+from ..models.analysis import AnalysisResult
+
+ANALYSIS_HISTORY_FULL_DAYS = int(os.getenv("ANALYSIS_HISTORY_FULL_DAYS", "7"))
+ANALYSIS_HISTORY_MAX_DAYS = int(os.getenv("ANALYSIS_HISTORY_MAX_DAYS", "365"))
+MAX_TREND_POINTS = 1000
+
+
+class AnalysisHistoryService:
+    """Прореживание истории анализа (без commit - фиксирует вызывающий код)"""
+
+    def __init__(
+        self,
+        db: Session,
+        full_days: int = ANALYSIS_HISTORY_FULL_DAYS,
+        max_days: int = ANALYSIS_HISTORY_MAX_DAYS
+    ):
+        self.db = db
+        self.full_days = full_days
+        self.max_days = max_days
+
+    def compact(self, project_id: Optional[int] = None, analysis_type: Optional[str] = None) -> int:
+        """Удалить результаты сверх политики хранения; возвращает число удаленных строк"""
+        now = datetime.utcnow()
+        daily_cutoff = now - timedelta(days=self.full_days)
+        latest_cutoff = now - timedelta(days=self.max_days)
+
+        def scoped(statement):
+            if project_id is not None:
+                statement = statement.where(AnalysisResult.project_id == project_id)
+            if analysis_type is not None:
+                statement = statement.where(AnalysisResult.analysis_type == analysis_type)
+            return statement
+
+        group = (AnalysisResult.project_id, AnalysisResult.analysis_type)
+        # Старше max_days - все, кроме последнего результата типа
+        latest_ids = scoped(select(func.max(AnalysisResult.id)).group_by(*group))
+        removed = self.db.execute(
+            scoped(delete(AnalysisResult).where(
+                AnalysisResult.created_at < latest_cutoff,
+                AnalysisResult.id.not_in(latest_ids)
+            )),
+            execution_options={"synchronize_session": False}
+        ).rowcount
+
+        # Между full_days и max_days - последний результат каждого дня
+        # (последний результат типа - последний в своем дне и сохраняется)
+        daily_ids = scoped(
+            select(func.max(AnalysisResult.id))
+            .where(AnalysisResult.created_at < daily_cutoff)
+            .group_by(*group, func.date(AnalysisResult.created_at))
+        )
+        removed += self.db.execute(
+            scoped(delete(AnalysisResult).where(
+                AnalysisResult.created_at < daily_cutoff,
+                AnalysisResult.id.not_in(daily_ids)
+            )),
+            execution_options={"synchronize_session": False}
+        ).rowcount
+        return removed
+
+    def trend(
+        self,
+        project_id: int,
+        analysis_type: Optional[str] = None,
+        since: Optional[datetime] = None,
+        limit: int = MAX_TREND_POINTS
+    ) -> List[dict]:
+        """Ряд (created_at, score, status) по возрастанию времени - без details/report"""
+        query = self.db.query(
+            AnalysisResult.analysis_type,
+            AnalysisResult.created_at,
+            AnalysisResult.score,
+            AnalysisResult.status
+        ).filter(AnalysisResult.project_id == project_id)
+        if analysis_type:
+            query = query.filter(AnalysisResult.analysis_type == analysis_type)
+        if since:
+            query = query.filter(AnalysisResult.created_at >= since)
+        # Последние limit точек, затем по возрастанию
+        rows = query.order_by(AnalysisResult.created_at.desc(), AnalysisResult.id.desc()).limit(limit).all()
+        return [
+            {"analysis_type": row.analysis_type, "created_at": row.created_at,
+             "score": row.score, "status": row.status}
+            for row in reversed(rows)
+        ]
+
+
+if __name__ == "__main__":
+    # python -m backend.services.analysis_history compact [--full-days N] [--max-days N]
+    import argparse
+    from ..database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Обслуживание истории анализа")
+    parser.add_argument("command", choices=["compact"])
+    parser.add_argument("--full-days", type=int, default=ANALYSIS_HISTORY_FULL_DAYS)
+    parser.add_argument("--max-days", type=int, default=ANALYSIS_HISTORY_MAX_DAYS)
+    args = parser.parse_args()
+
+    session = SessionLocal()
+    try:
+        removed = AnalysisHistoryService(session, args.full_days, args.max_days).compact()
+        session.commit()
+        print(f"Удалено результатов анализа: {removed}")
+    finally:
+        session.close()
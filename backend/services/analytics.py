@@ -0,0 +1,248 @@
+"""
+Сводная аналитика для менеджеров (материализованные итоги)
+
+Метрики портфеля - средняя оценка анализа, доля проверок с ошибками,
+доля примененных рекомендаций, время выполнения консультаций - хранятся
+суммами в analytics_rollups по ключу (день, дизайнер, статус проекта).
+События (сохранение анализа, проверка, рекомендации, завершение
+консультации) прибавляют приращения одним UPSERT в той же транзакции,
+поэтому отчет читает только небольшую таблицу итогов.
+
+Пересборка из исходных таблиц:
+    python -m backend.services.analytics rebuild
+Пересчитываются только рекомендации и консультации. Счетчики валидации
+(запуски нигде не хранятся) и анализа (история analysis_results
+прореживается - services/analysis_history.py) при пересборке сохраняются.
+"""
+from sqlalchemy import func, case, update, delete, and_
+from sqlalchemy.orm import Session
+from datetime import datetime, date
+from typing import Dict, Any, List, Optional, Tuple
+
+from ..database import upsert
+from ..models.analytics import AnalyticsRollup
+from ..models.chat import Consultation
+from ..models.project import Project
+from ..models.recommendation import Recommendation
+
+METRICS = (
+    "analysis_count",
+    "analysis_score_sum",
+    "validation_count",
+    "validation_failed_count",
+    "validation_error_sum",
+    "recommendation_count",
+    "recommendation_applied_count",
+    "consultation_completed_count",
+    "consultation_turnaround_seconds",
+)
+VALIDATION_METRICS = ("validation_count", "validation_failed_count", "validation_error_sum")
+ANALYSIS_METRICS = ("analysis_count", "analysis_score_sum")
+# Метрики, которые нельзя восстановить из исходных таблиц
+PRESERVED_METRICS = VALIDATION_METRICS + ANALYSIS_METRICS
+GROUP_BY_COLUMNS = {
+    "day": AnalyticsRollup.day,
+    "designer": AnalyticsRollup.designer_id,
+    "status": AnalyticsRollup.project_status,
+}
+
+RollupKey = Tuple[date, int, str]
+
+
+def _as_date(value) -> date:
+    """Дата из datetime/date или строки func.date() (SQLite возвращает строку)"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+
+def _project_key(project: Optional[Project], when: Optional[datetime] = None) -> RollupKey:
+    return (
+        _as_date(when or datetime.utcnow()),
+        (project.designer_id or 0) if project else 0,
+        (project.status or "") if project else "",
+    )
+
+
+class AnalyticsService:
+    """Инкрементальное обновление итогов и отчеты по ним (без commit)"""
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def add(self, key: RollupKey, **metrics):
+        """Прибавить приращения метрик к строке итогов (создается при отсутствии)"""
+        metrics = {name: value for name, value in metrics.items() if value}
+        if not metrics:
+            return
+        day, designer_id, project_status = key
+        statement = upsert(self.db, AnalyticsRollup).values(
+            day=day, designer_id=designer_id, project_status=project_status,
+            updated_at=datetime.utcnow(),
+            **{name: metrics.get(name, 0) for name in METRICS}
+        )
+        statement = statement.on_conflict_do_update(
+            index_elements=["day", "designer_id", "project_status"],
+            set_={
+                **{name: getattr(AnalyticsRollup, name) + value for name, value in metrics.items()},
+                "updated_at": datetime.utcnow(),
+            }
+        )
+        self.db.execute(statement)
+
+    # ----- События -----
+
+    def on_analysis(self, project: Project, score: Optional[float]):
+        self.add(_project_key(project), analysis_count=1, analysis_score_sum=score or 0.0)
+
+    def on_validation(self, project: Project, error_count: int):
+        self.add(
+            _project_key(project),
+            validation_count=1,
+            validation_failed_count=1 if error_count else 0,
+            validation_error_sum=error_count
+        )
+
+    def on_recommendations(self, project: Project, recommendations: List[Recommendation], sign: int = 1):
+        """Создание (sign=1) или удаление (sign=-1) рекомендаций"""
+        for recommendation in recommendations:
+            self.add(
+                _project_key(project, recommendation.created_at),
+                recommendation_count=sign,
+                recommendation_applied_count=sign if recommendation.is_applied else 0
+            )
+
+    def on_recommendation_applied(self, project: Project, recommendation: Recommendation, applied: bool):
+        """Изменение отметки is_applied - учитывается в дне создания рекомендации"""
+        self.add(
+            _project_key(project, recommendation.created_at),
+            recommendation_applied_count=1 if applied else -1
+        )
+
+    def on_consultation_completed(
+        self, consultation: Consultation, project: Optional[Project] = None, sign: int = 1
+    ):
+        """Завершение (sign=1) или повторное открытие (sign=-1) консультации"""
+        completed_at = consultation.completed_at or datetime.utcnow()
+        turnaround = (completed_at - consultation.created_at).total_seconds() if consultation.created_at else 0.0
+        self.add(
+            (_as_date(completed_at), consultation.consultant_id or 0, (project.status or "") if project else ""),
+            consultation_completed_count=sign,
+            consultation_turnaround_seconds=sign * max(turnaround, 0.0)
+        )
+
+    # ----- Отчеты -----
+
+    def report(
+        self,
+        group_by: str = "day",
+        date_from: Optional[date] = None,
+        date_to: Optional[date] = None,
+        designer_id: Optional[int] = None,
+        project_status: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Итоги по группам и общий итог - только по таблице analytics_rollups"""
+        sums = [func.coalesce(func.sum(getattr(AnalyticsRollup, name)), 0) for name in METRICS]
+        filters = []
+        if date_from:
+            filters.append(AnalyticsRollup.day >= date_from)
+        if date_to:
+            filters.append(AnalyticsRollup.day <= date_to)
+        if designer_id is not None:
+            filters.append(AnalyticsRollup.designer_id == designer_id)
+        if project_status is not None:
+            filters.append(AnalyticsRollup.project_status == project_status)
+
+        column = GROUP_BY_COLUMNS[group_by]
+        rows = self.db.query(column, *sums).filter(*filters).group_by(column).order_by(column).all()
+        total = self.db.query(*sums).filter(*filters).one()
+        return {
+            "group_by": group_by,
+            "groups": [{group_by: row[0], **self._metrics(row[1:])} for row in rows],
+            "total": self._metrics(total),
+        }
+
+    @staticmethod
+    def _metrics(values) -> Dict[str, Any]:
+        data = dict(zip(METRICS, values))
+
+        def ratio(numerator, denominator):
+            return round(numerator / denominator, 4) if denominator else None
+
+        turnaround = ratio(data["consultation_turnaround_seconds"], data["consultation_completed_count"])
+        return {
+            "analyses": int(data["analysis_count"]),
+            "avg_score": ratio(data["analysis_score_sum"], data["analysis_count"]),
+            "validations": int(data["validation_count"]),
+            "validation_error_rate": ratio(data["validation_failed_count"], data["validation_count"]),
+            "validation_errors": int(data["validation_error_sum"]),
+            "recommendations": int(data["recommendation_count"]),
+            "acceptance_rate": ratio(data["recommendation_applied_count"], data["recommendation_count"]),
+            "consultations_completed": int(data["consultation_completed_count"]),
+            "avg_turnaround_hours": round(turnaround / 3600, 2) if turnaround is not None else None,
+        }
+
+    # ----- Пересборка -----
+
+    def rebuild(self):
+        """
+        Пересчитать итоги из recommendations и consultations
+        Метрики PRESERVED_METRICS не меняются: история анализов прореживается,
+        и пересчет по ней занизил бы прошлые дни
+        """
+        rebuilt = [name for name in METRICS if name not in PRESERVED_METRICS]
+        self.db.execute(update(AnalyticsRollup).values(**{name: 0 for name in rebuilt}))
+
+        day = func.date(Recommendation.created_at)
+        for row in self.db.query(
+            day, Project.designer_id, Project.status,
+            func.count(Recommendation.id),
+            func.sum(case((Recommendation.is_applied > 0, 1), else_=0))
+        ).join(Project, Project.id == Recommendation.project_id).group_by(
+            day, Project.designer_id, Project.status
+        ).all():
+            self.add(
+                (_as_date(row[0]), row[1] or 0, row[2] or ""),
+                recommendation_count=row[3], recommendation_applied_count=row[4] or 0
+            )
+
+        # Разность дат в SQL зависит от диалекта - суммируем в Python
+        turnaround: Dict[RollupKey, List[float]] = {}
+        consultations = self.db.query(
+            Consultation.created_at, Consultation.completed_at, Consultation.consultant_id, Project.status
+        ).outerjoin(Project, Project.id == Consultation.project_id).filter(
+            Consultation.status == "completed",
+            Consultation.completed_at.isnot(None)
+        ).yield_per(1000)
+        for created_at, completed_at, consultant_id, status in consultations:
+            key = (_as_date(completed_at), consultant_id or 0, status or "")
+            totals = turnaround.setdefault(key, [0, 0.0])
+            totals[0] += 1
+            if created_at:
+                totals[1] += max((completed_at - created_at).total_seconds(), 0.0)
+        for key, (count, seconds) in turnaround.items():
+            self.add(key, consultation_completed_count=count, consultation_turnaround_seconds=seconds)
+
+        # Пустые строки после пересчета
+        self.db.execute(delete(AnalyticsRollup).where(and_(
+            *(getattr(AnalyticsRollup, name) == 0 for name in METRICS)
+        )))
+
+
+if __name__ == "__main__":
+    # python -m backend.services.analytics rebuild
+    import argparse
+    from ..database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Сводная аналитика")
+    parser.add_argument("command", choices=["rebuild"])
+    args = parser.parse_args()
+
+    session = SessionLocal()
+    try:
+        AnalyticsService(session).rebuild()
+        session.commit()
+    finally:
+        session.close()
@@ -0,0 +1,39 @@
+"""
+Отслеживание изменений помещений
+
+У каждого помещения есть счетчик revision, который увеличивается при любом
+изменении самого помещения, его моделей или материалов этих моделей.
+Результаты анализа и валидации кэшируются по помещениям с ключом
+(помещение, revision, параметры) - пересчитываются только помещения,
+изменившиеся с прошлого расчета ("грязные").
+
+Функции только добавляют UPDATE в текущую транзакцию - коммит выполняет
+вызывающий код вместе с самим изменением.
+"""
+from sqlalchemy import update, select
+from sqlalchemy.orm import Session
+from typing import Iterable, Optional
+
+from ..models.room import Room
+from ..models.model import Model
+
+
+def touch_rooms(db: Session, room_ids: Iterable[Optional[int]]):
+    """Отметить помещения измененными (None пропускаются)"""
+    ids = {room_id for room_id in room_ids if room_id is not None}
+    if not ids:
+        return
+    db.execute(
+        update(Room).where(Room.id.in_(ids)).values(revision=Room.revision + 1),
+        execution_options={"synchronize_session": False}
+    )
+
+
+def touch_material_rooms(db: Session, material_id: int):
+    """Отметить измененными все помещения с моделями из этого материала"""
+    db.execute(
+        update(Room).where(
+            Room.id.in_(select(Model.room_id).where(Model.material_id == material_id))
+        ).values(revision=Room.revision + 1),
+        execution_options={"synchronize_session": False}
+    )
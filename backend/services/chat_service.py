@@ -0,0 +1,357 @@
+"""
+Сервис чата: поддержка производных таблиц чата
+
+- chat_unread_counters - счетчики непрочитанных по отправителям
+- chat_conversations - сводка диалогов для списка "входящих"
+- chat_messages_archive - сжатые старые сообщения
+
+Счетчики и сводка меняются в той же транзакции, что и сообщения, поэтому
+запросы количества непрочитанных и списка диалогов не сканируют
+историю сообщений. Архивация держит горячую таблицу chat_messages
+небольшой; чтение истории прозрачно продолжается в архиве.
+В архив переносится все старше срока (включая непрочитанное): отметка
+прочтения обновляется в обеих таблицах, счетчики от архивации не зависят.
+"""
+from sqlalchemy import update, delete, insert, case, func, and_
+from sqlalchemy.orm import Session
+from datetime import datetime, timedelta
+from typing import Dict, List, Any, Optional, Tuple
+import itertools
+import os
+import zlib
+
+from ..database import upsert
+from ..models.chat import ChatMessage, ChatMessageArchive, ChatUnreadCounter, ChatConversation
+from ..models.project import Project
+
+PREVIEW_LENGTH = 200
+CHAT_ARCHIVE_AFTER_DAYS = int(os.getenv("CHAT_ARCHIVE_AFTER_DAYS", "180"))
+ARCHIVE_BATCH_SIZE = 1000
+
+
+class ChatService:
+    """Операции чата, поддерживающие производные таблицы в актуальном состоянии"""
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def record_message(self, message: ChatMessage, project: Optional[Project] = None):
+        """
+        Обновить производные таблицы после добавления сообщения (без commit)
+        Сообщение должно быть уже сохранено через flush, чтобы иметь id
+        """
+        if message.recipient_id:
+            self.increment_unread(message.recipient_id, message.sender_id)
+
+        rows = self._conversation_rows(message, project)
+        if not rows:
+            return
+        statement = upsert(self.db, ChatConversation).values(rows)
+        statement = statement.on_conflict_do_update(
+            index_elements=["user_id", "thread_key"],
+            set_={
+                "last_message_id": statement.excluded.last_message_id,
+                "last_sender_id": statement.excluded.last_sender_id,
+                "last_message_preview": statement.excluded.last_message_preview,
+                "last_message_at": statement.excluded.last_message_at,
+            }
+        )
+        self.db.execute(statement)
+
+    def get_messages(
+        self,
+        user_id: int,
+        peer_id: Optional[int] = None,
+        project_id: Optional[int] = None,
+        skip: int = 0,
+        limit: int = 50
+    ) -> List[Any]:
+        """
+        Сообщения пользователя, новые первыми
+        Если горячая таблица исчерпана, страница дополняется из архива
+        (все архивные сообщения старше оставшихся в chat_messages)
+        """
+        hot_query = self._filter_messages(
+            self.db.query(ChatMessage), ChatMessage, user_id, peer_id, project_id
+        )
+        messages = hot_query.order_by(
+            ChatMessage.created_at.desc()
+        ).offset(skip).limit(limit).all()
+        if len(messages) == limit:
+            return messages
+
+        # Страница дошла до конца горячей таблицы - продолжаем в архиве
+        hot_total = skip + len(messages) if messages else hot_query.count()
+        archive_rows = self._filter_messages(
+            self.db.query(ChatMessageArchive), ChatMessageArchive, user_id, peer_id, project_id
+        ).order_by(
+            ChatMessageArchive.created_at.desc()
+        ).offset(max(skip - hot_total, 0)).limit(limit - len(messages)).all()
+
+        return messages + [self._unarchive(row) for row in archive_rows]
+
+    def archive_messages(self, older_than_days: int = CHAT_ARCHIVE_AFTER_DAYS) -> int:
+        """
+        Перенести старые сообщения в архив пачками по ARCHIVE_BATCH_SIZE
+        Переносится строго по дате, чтобы все архивные сообщения были старше
+        горячих (на этом основана постраничная выдача get_messages)
+        Возвращает количество перенесенных сообщений
+        """
+        cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+        moved = 0
+        while True:
+            batch = self.db.query(ChatMessage).filter(
+                ChatMessage.created_at < cutoff
+            ).order_by(ChatMessage.id).limit(ARCHIVE_BATCH_SIZE).all()
+            if not batch:
+                return moved
+
+            self.db.execute(insert(ChatMessageArchive), [
+                {
+                    "id": message.id,
+                    "sender_id": message.sender_id,
+                    "recipient_id": message.recipient_id,
+                    "project_id": message.project_id,
+                    "message_compressed": zlib.compress(message.message.encode("utf-8")),
+                    "is_read": message.is_read,
+                    "created_at": message.created_at,
+                }
+                for message in batch
+            ])
+            self.db.execute(
+                delete(ChatMessage).where(ChatMessage.id.in_([m.id for m in batch])),
+                execution_options={"synchronize_session": False}
+            )
+            self.db.commit()
+            self.db.expunge_all()
+            moved += len(batch)
+
+    def get_conversations(self, user_id: int, skip: int = 0, limit: int = 50) -> List[Dict[str, Any]]:
+        """Диалоги пользователя, отсортированные по последнему сообщению"""
+        rows = self.db.query(
+            ChatConversation, ChatUnreadCounter.unread_count
+        ).outerjoin(
+            ChatUnreadCounter,
+            and_(
+                ChatUnreadCounter.user_id == ChatConversation.user_id,
+                ChatUnreadCounter.peer_id == ChatConversation.peer_id
+            )
+        ).filter(
+            ChatConversation.user_id == user_id
+        ).order_by(
+            ChatConversation.last_message_at.desc()
+        ).offset(skip).limit(limit).all()
+
+        return [
+            {
+                "thread_key": conversation.thread_key,
+                "peer_id": conversation.peer_id,
+                "project_id": conversation.project_id,
+                "last_message_id": conversation.last_message_id,
+                "last_sender_id": conversation.last_sender_id,
+                "last_message_preview": conversation.last_message_preview,
+                "last_message_at": conversation.last_message_at,
+                "unread_count": unread_count or 0,
+            }
+            for conversation, unread_count in rows
+        ]
+
+    def increment_unread(self, user_id: int, peer_id: int, amount: int = 1):
+        """Увеличить счетчик непрочитанных (без commit)"""
+        statement = upsert(self.db, ChatUnreadCounter).values(
+            user_id=user_id, peer_id=peer_id, unread_count=amount
+        )
+        statement = statement.on_conflict_do_update(
+            index_elements=["user_id", "peer_id"],
+            set_={"unread_count": ChatUnreadCounter.unread_count + amount}
+        )
+        self.db.execute(statement)
+
+    def decrement_unread(self, user_id: int, peer_id: int, amount: int):
+        """Уменьшить счетчик непрочитанных, не опуская ниже нуля (без commit)"""
+        if amount <= 0:
+            return
+        self.db.execute(
+            update(ChatUnreadCounter)
+            .where(
+                ChatUnreadCounter.user_id == user_id,
+                ChatUnreadCounter.peer_id == peer_id
+            )
+            .values(unread_count=case(
+                (ChatUnreadCounter.unread_count > amount, ChatUnreadCounter.unread_count - amount),
+                else_=0
+            ))
+        )
+
+    def mark_read(
+        self,
+        user_id: int,
+        peer_id: int,
+        up_to_message_id: Optional[int] = None,
+        message_id: Optional[int] = None
+    ) -> int:
+        """
+        Пометить входящие сообщения от peer_id прочитанными
+        (по одному UPDATE для горячей таблицы и архива)
+        Возвращает количество помеченных сообщений
+        """
+        marked = 0
+        for model in (ChatMessage, ChatMessageArchive):
+            statement = update(model).where(
+                model.recipient_id == user_id,
+                model.sender_id == peer_id,
+                model.is_read == False
+            )
+            if message_id is not None:
+                statement = statement.where(model.id == message_id)
+            if up_to_message_id is not None:
+                statement = statement.where(model.id <= up_to_message_id)
+
+            marked += self.db.execute(
+                statement.values(is_read=True),
+                execution_options={"synchronize_session": False}
+            ).rowcount
+        self.decrement_unread(user_id, peer_id, marked)
+        self.db.commit()
+        return marked
+
+    def get_unread_counts(self, user_id: int) -> Dict[int, int]:
+        """Непрочитанные сообщения пользователя по отправителям"""
+        rows = self.db.query(
+            ChatUnreadCounter.peer_id, ChatUnreadCounter.unread_count
+        ).filter(
+            ChatUnreadCounter.user_id == user_id,
+            ChatUnreadCounter.unread_count > 0
+        ).all()
+        return {peer_id: count for peer_id, count in rows}
+
+    def rebuild_unread_counters(self):
+        """Пересчитать все счетчики по chat_messages и архиву (после миграции/сбоя)"""
+        self.db.query(ChatUnreadCounter).delete()
+        counts: Dict[Tuple[int, int], int] = {}
+        for model in (ChatMessage, ChatMessageArchive):
+            rows = self.db.query(
+                model.recipient_id, model.sender_id, func.count(model.id)
+            ).filter(
+                model.recipient_id.isnot(None),
+                model.is_read == False
+            ).group_by(model.recipient_id, model.sender_id).all()
+            for recipient_id, sender_id, count in rows:
+                counts[(recipient_id, sender_id)] = counts.get((recipient_id, sender_id), 0) + count
+        self.db.add_all([
+            ChatUnreadCounter(user_id=recipient_id, peer_id=sender_id, unread_count=count)
+            for (recipient_id, sender_id), count in counts.items()
+        ])
+        self.db.commit()
+
+    def rebuild_conversations(self):
+        """Пересобрать chat_conversations по истории сообщений (архив, затем горячая таблица)"""
+        self.db.query(ChatConversation).delete()
+        projects = {
+            project_id: (user_id, designer_id)
+            for project_id, user_id, designer_id in
+            self.db.query(Project.id, Project.user_id, Project.designer_id).all()
+        }
+
+        latest: Dict[Tuple[int, str], Dict[str, Any]] = {}
+        # Архивные сообщения старше горячих - идут первыми, чтобы последним осталось новейшее
+        archived = (
+            ChatMessage(**self._unarchive(row))
+            for row in self.db.query(ChatMessageArchive).order_by(ChatMessageArchive.id).yield_per(1000)
+        )
+        messages = self.db.query(ChatMessage).order_by(ChatMessage.id).yield_per(1000)
+        for message in itertools.chain(archived, messages):
+            owners = projects.get(message.project_id)
+            project = Project(user_id=owners[0], designer_id=owners[1]) if owners else None
+            for row in self._conversation_rows(message, project):
+                latest[(row["user_id"], row["thread_key"])] = row
+
+        self.db.add_all([ChatConversation(**row) for row in latest.values()])
+        self.db.commit()
+
+    @staticmethod
+    def _filter_messages(query, model, user_id: int, peer_id: Optional[int], project_id: Optional[int]):
+        """Фильтр доступных пользователю сообщений (для горячей таблицы и архива)"""
+        if peer_id:
+            query = query.filter(
+                ((model.sender_id == user_id) & (model.recipient_id == peer_id)) |
+                ((model.sender_id == peer_id) & (model.recipient_id == user_id))
+            )
+        else:
+            query = query.filter(
+                (model.sender_id == user_id) | (model.recipient_id == user_id)
+            )
+        if project_id:
+            query = query.filter(model.project_id == project_id)
+        return query
+
+    @staticmethod
+    def _unarchive(row: ChatMessageArchive) -> Dict[str, Any]:
+        return {
+            "id": row.id,
+            "sender_id": row.sender_id,
+            "recipient_id": row.recipient_id,
+            "project_id": row.project_id,
+            "message": zlib.decompress(row.message_compressed).decode("utf-8"),
+            "is_read": row.is_read,
+            "created_at": row.created_at,
+        }
+
+    def _conversation_rows(
+        self,
+        message: ChatMessage,
+        project: Optional[Project]
+    ) -> List[Dict[str, Any]]:
+        """Строки сводки диалогов, которые затрагивает сообщение"""
+        last = {
+            "last_message_id": message.id,
+            "last_sender_id": message.sender_id,
+            "last_message_preview": message.message[:PREVIEW_LENGTH],
+            "last_message_at": message.created_at,
+        }
+
+        if message.recipient_id:
+            pairs = {
+                (message.sender_id, message.recipient_id),
+                (message.recipient_id, message.sender_id),
+            }
+            return [
+                {"user_id": user_id, "thread_key": f"user:{peer_id}",
+                 "peer_id": peer_id, "project_id": None, **last}
+                for user_id, peer_id in pairs
+            ]
+
+        if message.project_id:
+            participants = {message.sender_id}
+            if project:
+                participants.update(p for p in (project.user_id, project.designer_id) if p)
+            return [
+                {"user_id": user_id, "thread_key": f"project:{message.project_id}",
+                 "peer_id": None, "project_id": message.project_id, **last}
+                for user_id in participants
+            ]
+
+        return []
+
+
+if __name__ == "__main__":
+    # python -m backend.services.chat_service rebuild
+    # python -m backend.services.chat_service archive [--days N]
+    import argparse
+    from ..database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Обслуживание таблиц чата")
+    parser.add_argument("command", choices=["rebuild", "archive"])
+    parser.add_argument("--days", type=int, default=CHAT_ARCHIVE_AFTER_DAYS)
+    args = parser.parse_args()
+
+    session = SessionLocal()
+    try:
+        service = ChatService(session)
+        if args.command == "rebuild":
+            service.rebuild_unread_counters()
+            service.rebuild_conversations()
+        else:
+            print(f"Перенесено в архив: {service.archive_messages(args.days)}")
+    finally:
+        session.close()
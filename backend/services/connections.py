@@ -0,0 +1,133 @@
+"""
+Обертка над WebSocket соединением с очередью отправки
+
+У каждого соединения своя ограниченная очередь и задача-писатель, поэтому
+рассылка не ждет медленного клиента: постановка в очередь не блокирует.
+Если очередь переполнена, применяется политика WS_SLOW_CONSUMER_POLICY:
+- drop_oldest - отбросить самое старое сообщение (по умолчанию)
+- drop_new    - отбросить новое сообщение
+- close       - закрыть соединение медленного клиента
+
+Писатель раз в WS_HEARTBEAT_INTERVAL секунд простоя отправляет ping и
+закрывает соединение, если клиент молчит дольше двух интервалов.
+"""
+from fastapi import WebSocket
+from typing import Dict, Callable, Optional, Union
+import asyncio
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+WS_SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "100"))
+WS_SLOW_CONSUMER_POLICY = os.getenv("WS_SLOW_CONSUMER_POLICY", "drop_oldest")
+WS_HEARTBEAT_INTERVAL = float(os.getenv("WS_HEARTBEAT_INTERVAL", "30"))
+
+PING_MESSAGE = json.dumps({"type": "ping"})
+
+# Метрики соединений текущего процесса
+connection_stats: Dict[str, int] = {
+    "active_connections": 0,
+    "opened_total": 0,
+    "closed_total": 0,
+    "dropped_messages": 0,
+    "slow_consumers_closed": 0,
+    "heartbeat_timeouts": 0,
+    "send_errors": 0,
+}
+
+
+class ClientConnection:
+    """WebSocket соединение с ограниченной очередью отправки и heartbeat"""
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        on_close: Optional[Callable[["ClientConnection"], None]] = None,
+        queue_size: int = WS_SEND_QUEUE_SIZE,
+        policy: str = WS_SLOW_CONSUMER_POLICY,
+        heartbeat_interval: float = WS_HEARTBEAT_INTERVAL
+    ):
+        self.websocket = websocket
+        self.on_close = on_close
+        self.policy = policy
+        self.heartbeat_interval = heartbeat_interval
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.closed = False
+        self.last_seen = time.monotonic()
+        connection_stats["active_connections"] += 1
+        connection_stats["opened_total"] += 1
+        self._writer = asyncio.create_task(self._write_loop())
+
+    def send(self, data: Union[str, bytes]) -> bool:
+        """Поставить сообщение в очередь, не дожидаясь отправки"""
+        if self.closed:
+            return False
+        try:
+            self.queue.put_nowait(data)
+            return True
+        except asyncio.QueueFull:
+            pass
+
+        connection_stats["dropped_messages"] += 1
+        if self.policy == "close":
+            connection_stats["slow_consumers_closed"] += 1
+            self.close(code=1013)  # Try Again Later
+            return False
+        if self.policy == "drop_oldest":
+            self.queue.get_nowait()
+            self.queue.put_nowait(data)
+            return True
+        return False
+
+    def touch(self):
+        """Отметить активность клиента (вызывается при получении данных)"""
+        self.last_seen = time.monotonic()
+
+    def close(self, code: int = 1000):
+        if self.closed:
+            return
+        self._mark_closed()
+        if asyncio.current_task() is not self._writer:
+            self._writer.cancel()
+        asyncio.create_task(self._close_socket(code))
+
+    async def _write_loop(self):
+        try:
+            while True:
+                try:
+                    data = await asyncio.wait_for(self.queue.get(), timeout=self.heartbeat_interval)
+                except asyncio.TimeoutError:
+                    if time.monotonic() - self.last_seen > 2 * self.heartbeat_interval:
+                        connection_stats["heartbeat_timeouts"] += 1
+                        self.close(code=1001)
+                        return
+                    data = PING_MESSAGE
+
+                if isinstance(data, bytes):
+                    await self.websocket.send_bytes(data)
+                else:
+                    await self.websocket.send_text(data)
+        except asyncio.CancelledError:
+            pass
+        except Exception:
+            connection_stats["send_errors"] += 1
+            logger.warning("Ошибка отправки в WebSocket, соединение закрыто")
+            self._mark_closed()
+
+    def _mark_closed(self):
+        if self.closed:
+            return
+        self.closed = True
+        connection_stats["active_connections"] -= 1
+        connection_stats["closed_total"] += 1
+        if self.on_close:
+            self.on_close(self)
+
+    async def _close_socket(self, code: int):
+        try:
+            await self.websocket.close(code=code)
+        except Exception:
+            pass
@@ -0,0 +1,186 @@
+"""
+Очередь консультаций
+
+Назначение выполняется атомарно: UPDATE ... WHERE consultant_id IS NULL
+срабатывает только у одного из конкурирующих консультантов. Для выбора
+следующей консультации в PostgreSQL используется SELECT ... FOR UPDATE
+SKIP LOCKED, поэтому параллельные запросы получают разные строки;
+в SQLite блокировка не поддерживается, и гонку разрешает тот же
+условный UPDATE с повторной попыткой.
+
+ConsultantLoadTracker поддерживает таблицу consultant_stats в той же
+транзакции, что и изменения консультаций.
+"""
+from sqlalchemy import update, func
+from sqlalchemy.orm import Session
+from datetime import datetime
+from typing import Optional, Iterable
+
+from ..database import upsert
+from ..models.chat import Consultation, ConsultantStats
+from ..models.model import Model
+from ..models.room import Room
+
+CLAIM_ATTEMPTS = 5
+
+
+class ConsultantLoadTracker:
+    """Инкрементальное обновление счетчиков нагрузки консультантов (без commit)"""
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def on_assigned(self, consultant_id: int):
+        statement = upsert(self.db, ConsultantStats).values(
+            consultant_id=consultant_id, open_count=1, assigned_count=1,
+            completed_count=0, total_response_seconds=0.0, category_counts={}
+        )
+        statement = statement.on_conflict_do_update(
+            index_elements=["consultant_id"],
+            set_={
+                "open_count": ConsultantStats.open_count + 1,
+                "assigned_count": ConsultantStats.assigned_count + 1,
+            }
+        )
+        self.db.execute(statement)
+
+    def on_unassigned(self, consultant_id: int):
+        self.db.execute(
+            update(ConsultantStats)
+            .where(ConsultantStats.consultant_id == consultant_id, ConsultantStats.open_count > 0)
+            .values(open_count=ConsultantStats.open_count - 1)
+        )
+
+    def on_completed(self, consultation: Consultation, sign: int = 1):
+        """
+        Закрыть консультацию в счетчиках: нагрузка, время решения, опыт по категориям
+        sign=-1 - повторное открытие завершенной консультации (вклад вычитается)
+        """
+        stats = self.db.query(ConsultantStats).filter(
+            ConsultantStats.consultant_id == consultation.consultant_id
+        ).with_for_update().first()
+        if stats is None:
+            return
+
+        stats.open_count = max(stats.open_count - sign, 0)
+        stats.completed_count = max(stats.completed_count + sign, 0)
+        if consultation.assigned_at and consultation.completed_at:
+            stats.total_response_seconds = max(stats.total_response_seconds + sign * (
+                consultation.completed_at - consultation.assigned_at
+            ).total_seconds(), 0.0)
+
+        categories = dict(stats.category_counts or {})
+        for category in project_categories(self.db, [consultation.project_id]).get(
+            consultation.project_id, set()
+        ):
+            categories[category] = categories.get(category, 0) + sign
+            if categories[category] <= 0:
+                del categories[category]
+        stats.category_counts = categories
+
+    def rebuild(self):
+        """Пересчитать consultant_stats по таблице consultations"""
+        self.db.query(ConsultantStats).delete()
+        stats = {}
+        consultations = self.db.query(Consultation).filter(
+            Consultation.consultant_id.isnot(None)
+        ).yield_per(1000)
+        finished = []
+        for consultation in consultations:
+            row = stats.setdefault(consultation.consultant_id, ConsultantStats(
+                consultant_id=consultation.consultant_id, open_count=0, assigned_count=0,
+                completed_count=0, total_response_seconds=0.0, category_counts={}
+            ))
+            row.assigned_count += 1
+            if consultation.status == "completed":
+                row.completed_count += 1
+                if consultation.assigned_at and consultation.completed_at:
+                    row.total_response_seconds += (
+                        consultation.completed_at - consultation.assigned_at
+                    ).total_seconds()
+                finished.append((consultation.consultant_id, consultation.project_id))
+            else:
+                row.open_count += 1
+
+        categories_by_project = project_categories(self.db, {p for _, p in finished})
+        for consultant_id, project_id in finished:
+            counts = stats[consultant_id].category_counts
+            for category in categories_by_project.get(project_id, set()):
+                counts[category] = counts.get(category, 0) + 1
+
+        self.db.add_all(stats.values())
+        self.db.commit()
+
+
+def project_categories(db: Session, project_ids: Iterable[Optional[int]]):
+    """Категории помещений проектов (по категориям их моделей) одним запросом"""
+    project_ids = [p for p in set(project_ids) if p is not None]
+    if not project_ids:
+        return {}
+    # Модель может быть привязана к проекту напрямую или через комнату
+    project_column = func.coalesce(Model.project_id, Room.project_id)
+    rows = db.query(project_column, Model.category).outerjoin(
+        Room, Room.id == Model.room_id
+    ).filter(
+        project_column.in_(project_ids),
+        Model.category.isnot(None)
+    ).group_by(project_column, Model.category).all()
+
+    categories = {}
+    for project_id, category in rows:
+        categories.setdefault(project_id, set()).add(category)
+    return categories
+
+
+class ConsultationQueue:
+    """Очередь ожидающих консультаций с приоритетом и возрастом"""
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def pending_query(self):
+        """Ожидающие консультации в порядке обработки (по частичному индексу)"""
+        return self.db.query(Consultation).filter(
+            Consultation.status == "pending",
+            Consultation.consultant_id.is_(None)
+        ).order_by(
+            Consultation.priority.desc(),
+            Consultation.created_at
+        )
+
+    def claim(self, consultation_id: int, consultant_id: int) -> bool:
+        """
+        Атомарно назначить консультацию, если она еще ожидает в очереди
+        Возвращает False, если консультацию уже забрал кто-то другой
+        или она закрыта
+        """
+        claimed = self.db.execute(
+            update(Consultation)
+            .where(
+                Consultation.id == consultation_id,
+                Consultation.consultant_id.is_(None),
+                Consultation.status == "pending"
+            )
+            .values(consultant_id=consultant_id, status="assigned", assigned_at=datetime.utcnow()),
+            execution_options={"synchronize_session": False}
+        ).rowcount == 1
+        if claimed:
+            ConsultantLoadTracker(self.db).on_assigned(consultant_id)
+        self.db.commit()
+        return claimed
+
+    def claim_next(self, consultant_id: int) -> Optional[Consultation]:
+        """Забрать следующую консультацию из очереди"""
+        for _ in range(CLAIM_ATTEMPTS):
+            candidate_id = self.pending_query().with_entities(
+                Consultation.id
+            ).limit(1).with_for_update(skip_locked=True).scalar()
+            if candidate_id is None:
+                self.db.rollback()
+                return None
+
+            if self.claim(candidate_id, consultant_id):
+                return self.db.query(Consultation).filter(
+                    Consultation.id == candidate_id
+                ).first()
+        return None
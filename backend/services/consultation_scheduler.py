@@ -0,0 +1,278 @@
+"""
+Автоматическое распределение консультаций между консультантами
+
+Планировщик берет ожидающие консультации из очереди и назначает каждую
+консультанту, выбранному стратегией. Стратегии работают с состоянием
+кандидатов, загруженным из consultant_stats одним запросом, и не
+обращаются к таблице consultations.
+
+Стратегии (CONSULTATION_STRATEGY):
+- least_loaded - минимум открытых консультаций
+- expertise    - нагрузка с поправкой на опыт в категориях помещений проекта
+- balanced     - нагрузка, опыт и среднее время решения (по умолчанию)
+
+Сравнение стратегий на синтетической нагрузке:
+python -m backend.services.consultation_scheduler simulate
+"""
+from sqlalchemy.orm import Session
+from typing import Dict, List, Optional, Set, Tuple
+import os
+
+from ..models.user import User
+from ..models.chat import Consultation, ConsultantStats
+from .consultation_queue import ConsultationQueue, project_categories
+
+CONSULTATION_STRATEGY = os.getenv("CONSULTATION_STRATEGY", "balanced")
+MAX_OPEN_CONSULTATIONS = int(os.getenv("MAX_OPEN_CONSULTATIONS", "10"))
+
+
+class CandidateState:
+    """Состояние консультанта, достаточное для выбора стратегией"""
+
+    def __init__(
+        self,
+        consultant_id: int,
+        open_count: int = 0,
+        completed_count: int = 0,
+        total_response_seconds: float = 0.0,
+        category_counts: Optional[Dict[str, int]] = None
+    ):
+        self.consultant_id = consultant_id
+        self.open_count = open_count
+        self.completed_count = completed_count
+        self.total_response_seconds = total_response_seconds
+        self.category_counts = category_counts or {}
+
+    @property
+    def avg_response_hours(self) -> float:
+        if not self.completed_count:
+            return 0.0
+        return self.total_response_seconds / self.completed_count / 3600
+
+    def expertise(self, categories: Set[str]) -> float:
+        """Доля завершенных консультаций в указанных категориях (0-1)"""
+        if not categories or not self.completed_count:
+            return 0.0
+        matched = sum(self.category_counts.get(category, 0) for category in categories)
+        return min(matched / self.completed_count, 1.0)
+
+
+class AssignmentStrategy:
+    """Базовая стратегия: меньший score - лучший кандидат"""
+
+    name = "base"
+
+    def __init__(self, max_open: int = MAX_OPEN_CONSULTATIONS):
+        self.max_open = max_open
+
+    def score(self, candidate: CandidateState, categories: Set[str]) -> float:
+        raise NotImplementedError
+
+    def choose(
+        self,
+        candidates: List[CandidateState],
+        categories: Set[str]
+    ) -> Optional[CandidateState]:
+        eligible = [c for c in candidates if c.open_count < self.max_open]
+        if not eligible:
+            return None
+        return min(
+            eligible,
+            key=lambda c: (self.score(c, categories), c.open_count, c.consultant_id)
+        )
+
+
+class LeastLoadedStrategy(AssignmentStrategy):
+    name = "least_loaded"
+
+    def score(self, candidate: CandidateState, categories: Set[str]) -> float:
+        return candidate.open_count
+
+
+class ExpertiseStrategy(AssignmentStrategy):
+    name = "expertise"
+    expertise_weight = 3.0  # Полный опыт в категории "стоит" трех открытых консультаций
+
+    def score(self, candidate: CandidateState, categories: Set[str]) -> float:
+        return candidate.open_count - self.expertise_weight * candidate.expertise(categories)
+
+
+class BalancedStrategy(ExpertiseStrategy):
+    name = "balanced"
+    response_weight = 0.5  # Штраф за каждый час среднего времени решения
+
+    def score(self, candidate: CandidateState, categories: Set[str]) -> float:
+        return (
+            super().score(candidate, categories)
+            + self.response_weight * candidate.avg_response_hours
+        )
+
+
+STRATEGIES = {
+    strategy.name: strategy
+    for strategy in (LeastLoadedStrategy, ExpertiseStrategy, BalancedStrategy)
+}
+
+
+def get_strategy(name: str = CONSULTATION_STRATEGY) -> AssignmentStrategy:
+    if name not in STRATEGIES:
+        raise ValueError(f"Неизвестная стратегия распределения: {name}")
+    return STRATEGIES[name]()
+
+
+class ConsultationScheduler:
+    """Назначение ожидающих консультаций по выбранной стратегии"""
+
+    def __init__(self, db: Session, strategy: Optional[AssignmentStrategy] = None):
+        self.db = db
+        self.strategy = strategy or get_strategy()
+        self.queue = ConsultationQueue(db)
+
+    def load_candidates(self) -> List[CandidateState]:
+        """Активные дизайнеры/консультанты со счетчиками - один запрос"""
+        rows = self.db.query(User.id, ConsultantStats).outerjoin(
+            ConsultantStats, ConsultantStats.consultant_id == User.id
+        ).filter(
+            User.role.in_(["designer", "consultant"]),
+            User.is_active == True
+        ).all()
+        return [
+            CandidateState(
+                user_id,
+                stats.open_count,
+                stats.completed_count,
+                stats.total_response_seconds,
+                stats.category_counts
+            ) if stats else CandidateState(user_id)
+            for user_id, stats in rows
+        ]
+
+    def assign_pending(self, limit: int = 100) -> List[Tuple[int, int]]:
+        """
+        Назначить до limit ожидающих консультаций
+        Возвращает пары (consultation_id, consultant_id)
+        """
+        candidates = self.load_candidates()
+        if not candidates:
+            return []
+
+        # Только id: claim() фиксирует транзакцию и сбрасывает загруженные объекты
+        pending = self.queue.pending_query().with_entities(
+            Consultation.id, Consultation.project_id
+        ).limit(limit).all()
+        categories_by_project = project_categories(self.db, [project_id for _, project_id in pending])
+
+        assigned = []
+        for consultation_id, project_id in pending:
+            categories = categories_by_project.get(project_id, set())
+            candidate = self.strategy.choose(candidates, categories)
+            if candidate is None:
+                break
+            # Консультацию мог забрать кто-то вручную - тогда просто пропускаем
+            if self.queue.claim(consultation_id, candidate.consultant_id):
+                candidate.open_count += 1
+                assigned.append((consultation_id, candidate.consultant_id))
+        return assigned
+
+
+def simulate(
+    strategy: AssignmentStrategy,
+    consultants: int = 20,
+    steps: int = 500,
+    arrivals_per_step: int = 25,
+    seed: int = 0
+) -> Dict[str, float]:
+    """
+    Дискретная симуляция без БД
+    У каждого консультанта есть "сильные" категории, в которых он решает
+    консультации вдвое быстрее; шаг симуляции - один час.
+    """
+    import random
+    import time
+
+    rng = random.Random(seed)
+    categories = ["kitchen", "bathroom", "living_room", "bedroom"]
+    strengths = {i: set(rng.sample(categories, 2)) for i in range(consultants)}
+    speed = {i: rng.uniform(0.5, 1.5) for i in range(consultants)}
+    candidates = [CandidateState(i) for i in range(consultants)]
+
+    queue: List[Tuple[int, Set[str]]] = []  # (шаг появления, категории)
+    in_progress: List[Tuple[int, CandidateState, int, Set[str]]] = []  # (окончание, кто, начало, категории)
+    waits: List[int] = []
+    matched = 0
+    max_open = 0
+    decision_seconds = 0.0
+
+    for step in range(steps):
+        for _ in range(arrivals_per_step):
+            queue.append((step, {rng.choice(categories)}))
+
+        remaining = []
+        for finish, candidate, start, cats in in_progress:
+            if finish > step:
+                remaining.append((finish, candidate, start, cats))
+                continue
+            candidate.open_count -= 1
+            candidate.completed_count += 1
+            candidate.total_response_seconds += (finish - start) * 3600
+            for category in cats:
+                candidate.category_counts[category] = candidate.category_counts.get(category, 0) + 1
+        in_progress = remaining
+
+        waiting = []
+        for arrived, cats in queue:
+            started = time.perf_counter()
+            candidate = strategy.choose(candidates, cats)
+            decision_seconds += time.perf_counter() - started
+            if candidate is None:
+                waiting.append((arrived, cats))
+                continue
+            strong = bool(cats & strengths[candidate.consultant_id])
+            duration = max(1, round(rng.expovariate(1 / 8) * speed[candidate.consultant_id] * (0.5 if strong else 1.0)))
+            candidate.open_count += 1
+            max_open = max(max_open, candidate.open_count)
+            matched += strong
+            waits.append(step - arrived)
+            in_progress.append((step + duration, candidate, step, cats))
+        queue = waiting
+
+    waits.sort()
+    assigned = len(waits) or 1
+    return {
+        "assigned": len(waits),
+        "still_waiting": len(queue),
+        "avg_wait_hours": sum(waits) / assigned,
+        "p95_wait_hours": waits[int(0.95 * (len(waits) - 1))] if waits else 0,
+        "max_open_per_consultant": max_open,
+        "expertise_match_ratio": matched / assigned,
+        "avg_decision_us": decision_seconds / assigned * 1e6,
+    }
+
+
+if __name__ == "__main__":
+    # python -m backend.services.consultation_scheduler simulate
+    # python -m backend.services.consultation_scheduler assign
+    # python -m backend.services.consultation_scheduler rebuild
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Распределение консультаций")
+    parser.add_argument("command", choices=["simulate", "assign", "rebuild"])
+    parser.add_argument("--strategy", default=CONSULTATION_STRATEGY)
+    args = parser.parse_args()
+
+    if args.command == "simulate":
+        for name in STRATEGIES:
+            print(name, simulate(get_strategy(name)))
+    else:
+        from ..database import SessionLocal
+        from .consultation_queue import ConsultantLoadTracker
+
+        session = SessionLocal()
+        try:
+            if args.command == "rebuild":
+                ConsultantLoadTracker(session).rebuild()
+            else:
+                scheduler = ConsultationScheduler(session, get_strategy(args.strategy))
+                print(f"Назначено консультаций: {len(scheduler.assign_pending())}")
+        finally:
+            session.close()
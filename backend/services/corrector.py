@@ -16,6 +16,7 @@ import logging
 from ..models.model import Model
 from ..models.room import Room
 from ..models.project import Project
+from .change_tracking import touch_rooms
 
 logger = logging.getLogger(__name__)
 
@@ -89,6 +90,7 @@ class Corrector:
         
         # Сохранение изменений
         if changes:
+            touch_rooms(self.db, [model.room_id])
             self.db.commit()
             self.db.refresh(model)
         
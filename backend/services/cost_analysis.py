@@ -0,0 +1,202 @@
+"""
+Стоимостной анализ проекта
+
+Цена модели (за единицу): позиция прайса CatalogPrice по Model.catalog_id,
+иначе properties.price материала модели, иначе модель считается без цены.
+Суммы по помещениям считаются одним SQL-запросом с группировкой по room_id
+(модели без помещения - отдельная группа room_id = None).
+
+Последний сохраненный результат анализа cost обновляется инкрементально:
+при изменении одной модели к сумме ее помещения прибавляется разница
+цены "до" и "после" (apply_change), без пересчета всего проекта.
+"""
+from sqlalchemy import func, or_
+from sqlalchemy.orm import Session
+from typing import Dict, Any, List, Optional
+import copy
+import os
+
+from ..models.analysis import AnalysisResult
+from ..models.catalog import Material, CatalogPrice
+from ..models.model import Model
+from ..models.room import Room
+from .result_cache import cache_key
+
+COST_CURRENCY = os.getenv("COST_CURRENCY", "RUB")
+UNASSIGNED_ROOM_NAME = "Без помещения"
+
+
+class CostAnalyzer:
+    """Смета проекта по прайсу каталога и ценам материалов"""
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def _priced_models(self):
+        """Запрос моделей с ценой за единицу (None - цены нет)"""
+        unit_price = func.coalesce(CatalogPrice.price, Material.properties["price"].as_float())
+        return self.db.query(Model).outerjoin(
+            CatalogPrice, CatalogPrice.catalog_id == Model.catalog_id
+        ).outerjoin(
+            Material, Material.id == Model.material_id
+        ), unit_price
+
+    def analyze(self, project_id: int) -> Dict[str, Any]:
+        """Смета всего проекта (один запрос с группировкой по помещениям)"""
+        query, unit_price = self._priced_models()
+        room_ids = self.db.query(Room.id).filter(Room.project_id == project_id)
+        totals = query.with_entities(
+            Model.room_id,
+            func.count(Model.id),
+            func.count(unit_price),
+            func.coalesce(func.sum(unit_price), 0.0),
+        ).filter(
+            or_(Model.project_id == project_id, Model.room_id.in_(room_ids))
+        ).group_by(Model.room_id).all()
+        by_room = {room_id: (items, priced, float(total)) for room_id, items, priced, total in totals}
+
+        rooms = []
+        for room in self.db.query(Room).filter(Room.project_id == project_id).order_by(Room.id).all():
+            items, priced, total = by_room.pop(room.id, (0, 0, 0.0))
+            rooms.append(self._room_entry(room.id, room.name, room.width * room.length, items, priced, total))
+        # Модели без помещения (и ссылающиеся на помещение другого проекта)
+        if by_room:
+            items, priced, total = (sum(values) for values in zip(*by_room.values()))
+            rooms.append(self._room_entry(None, UNASSIGNED_ROOM_NAME, 0.0, items, priced, total))
+
+        return self._summarize(project_id, rooms)
+
+    def model_entry(self, model_id: int) -> Optional[Dict[str, Any]]:
+        """Вклад одной модели в смету: помещение и цена"""
+        query, unit_price = self._priced_models()
+        row = query.with_entities(Model.room_id, unit_price).filter(Model.id == model_id).first()
+        if row is None:
+            return None
+        return {"room_id": row[0], "price": row[1]}
+
+    def apply_change(
+        self,
+        project_id: int,
+        before: Optional[Dict[str, Any]],
+        after: Optional[Dict[str, Any]]
+    ) -> Optional[AnalysisResult]:
+        """
+        Обновить последний результат анализа cost по изменению одной модели
+        before/after - model_entry до и после изменения (None - модели нет)
+        Коммит выполняет вызывающий код
+        """
+        if before == after:
+            return None
+        result = self._latest_result(project_id)
+        if result is None:
+            return None
+
+        # Новый объект details - иначе изменение JSON-поля не попадет в UPDATE
+        rooms = copy.deepcopy(result.details["analysis"]["rooms"])
+        for entry, sign in ((before, -1), (after, 1)):
+            if entry is None:
+                continue
+            room = self._find_room(rooms, entry["room_id"])
+            room["items"] += sign
+            if entry["price"] is not None:
+                room["priced_items"] += sign
+                room["total"] = round(room["total"] + sign * entry["price"], 2)
+            self._update_room(room)
+        rooms = [room for room in rooms if room["room_id"] is not None or room["items"] > 0]
+
+        return self._store(result, self._summarize(project_id, rooms))
+
+    def refresh(self, project_id: int) -> Optional[AnalysisResult]:
+        """Пересчитать последний результат cost целиком (пакетные изменения)"""
+        result = self._latest_result(project_id)
+        if result is None:
+            return None
+        return self._store(result, self.analyze(project_id))
+
+    def _latest_result(self, project_id: int) -> Optional[AnalysisResult]:
+        result = self.db.query(AnalysisResult).filter(
+            AnalysisResult.project_id == project_id,
+            AnalysisResult.analysis_type == "cost"
+        ).order_by(AnalysisResult.created_at.desc(), AnalysisResult.id.desc()).first()
+        return result if result is not None and result.details else None
+
+    @staticmethod
+    def _store(result: AnalysisResult, summary: Dict[str, Any]) -> AnalysisResult:
+        score = summary["analysis"]["score"]
+        result.details = summary
+        result.score = score
+        result.status = "good" if score > 75 else "warning"  # Как в routers/analysis.py
+        result.issues = summary["analysis"]["issues"]
+        result.suggestions = summary["analysis"]["suggestions"]
+        result.fingerprint = cache_key("analysis_result", summary)
+        return result
+
+    def _find_room(self, rooms: List[Dict[str, Any]], room_id: Optional[int]) -> Dict[str, Any]:
+        for room in rooms:
+            if room["room_id"] == room_id:
+                return room
+        if room_id is not None:
+            # Помещение создано после сохранения сметы
+            room_row = self.db.query(Room).filter(Room.id == room_id).first()
+            if room_row is not None:
+                room = self._room_entry(room_id, room_row.name, room_row.width * room_row.length, 0, 0, 0.0)
+                rooms.append(room)
+                return room
+        for room in rooms:
+            if room["room_id"] is None:
+                return room
+        room = self._room_entry(None, UNASSIGNED_ROOM_NAME, 0.0, 0, 0, 0.0)
+        rooms.append(room)
+        return room
+
+    @staticmethod
+    def _room_entry(room_id, name, area, items, priced, total) -> Dict[str, Any]:
+        room = {
+            "room_id": room_id,
+            "name": name,
+            "area": area or 0.0,
+            "items": int(items),
+            "priced_items": int(priced),
+            "total": round(float(total), 2),
+        }
+        CostAnalyzer._update_room(room)
+        return room
+
+    @staticmethod
+    def _update_room(room: Dict[str, Any]):
+        room["unpriced_items"] = room["items"] - room["priced_items"]
+        room["cost_per_m2"] = round(room["total"] / room["area"], 2) if room["area"] else None
+
+    @staticmethod
+    def _summarize(project_id: int, rooms: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Итоги сметы; оценка - доля предметов с известной ценой
+        (полнота сметы), бюджет у проекта не задается
+        """
+        items = sum(room["items"] for room in rooms)
+        priced = sum(room["priced_items"] for room in rooms)
+        issues: List[str] = []
+        suggestions: List[str] = []
+        for room in rooms:
+            if room["unpriced_items"]:
+                issues.append(f"{room['name']}: нет цены у предметов - {room['unpriced_items']}")
+        if priced < items:
+            suggestions.append("Добавьте позиции в прайс каталога или укажите цену материалов (properties.price)")
+
+        real_rooms = [room for room in rooms if room["room_id"] is not None]
+        return {
+            "project_id": project_id,
+            "total_rooms": len(real_rooms),
+            "total_area": float(sum(room["area"] for room in real_rooms)),
+            "analysis": {
+                "score": round(100.0 * priced / items, 1) if items else 100.0,
+                "issues": issues,
+                "suggestions": suggestions,
+                "rooms": rooms,
+                "total_cost": round(sum(room["total"] for room in rooms), 2),
+                "items": items,
+                "unpriced_items": items - priced,
+                "currency": COST_CURRENCY,
+            },
+            "engine": "cost",
+        }
@@ -0,0 +1,247 @@
+"""
+Эргономика: растровая сетка занятости и проходы к мебели
+
+Каждое помещение растеризуется в сетку с шагом resolution (м): клетки под
+габаритами мебели и за стенами заняты. Каждое помещение обрабатывается
+отдельно, сеткой своего размера (массив 1 × z × x), поэтому одно большое
+помещение не увеличивает сетки остальных.
+
+1. Карта свободного пространства D - расстояние (чебышёвское, в клетках)
+   от клетки до ближайшей занятой; ширина прохода через клетку ≈ (2D - 1) * resolution
+2. Волновой проход (аналог BFS) из основной свободной зоны помещения -
+   клетки с максимальным D - вычисляет для каждой клетки "узкое место":
+   наибольшую ширину, с которой до нее можно дойти
+3. Предмет доступен, если к нему можно подойти на расстояние ширины
+   прохода по пути не уже минимальной ширины прохода
+
+Двери (модели типа door) не считаются препятствием и служат точками входа.
+У проема стена не сужает проход: в зоне двери D считается только по мебели.
+Шаг сетки (ERGONOMICS_GRID_RESOLUTION) - компромисс точности и скорости:
+время растет примерно как (1 / resolution)^3. Шаг не меньше
+ERGONOMICS_MIN_RESOLUTION, а общее число клеток ограничено ERGONOMICS_MAX_CELLS.
+"""
+from typing import Dict, Any, List
+import math
+import os
+import numpy as np
+
+from .layout_analysis import SceneArrays, MIN_PASSAGE_WIDTH, FLOOR_MODEL_TYPES
+
+ERGONOMICS_GRID_RESOLUTION = float(os.getenv("ERGONOMICS_GRID_RESOLUTION", "0.1"))
+ERGONOMICS_MIN_RESOLUTION = 0.05
+# Предел клеток сетки на один анализ (все помещения) - при превышении шаг увеличивается
+ERGONOMICS_MAX_CELLS = int(os.getenv("ERGONOMICS_MAX_CELLS", "2000000"))
+DOOR_MODEL_TYPES = ("door",)
+CONVERGENCE_CHECK_EVERY = 8
+
+
+def rasterize(scene: SceneArrays, resolution: float, mask=None) -> np.ndarray:
+    """
+    Занятость клеток (помещение, z, x) с рамкой из занятых клеток по краю
+    Прямоугольники габаритов накладываются через разностный массив и
+    двойную кумулятивную сумму - без цикла по моделям
+    """
+    rows = np.ceil(scene.length / resolution).astype(np.int64)
+    cols = np.ceil(scene.width / resolution).astype(np.int64)
+    height, width = int(rows.max(initial=0)) + 2, int(cols.max(initial=0)) + 2
+    rooms = scene.room_count
+
+    x0, x1, z0, z1 = scene.bounds()
+    selected = np.ones(len(x0), dtype=bool) if mask is None else mask
+    room = scene.model_room[selected]
+    c0 = np.floor(x0[selected] / resolution).astype(np.int64) + 1
+    c1 = np.ceil(x1[selected] / resolution).astype(np.int64) + 1
+    r0 = np.floor(z0[selected] / resolution).astype(np.int64) + 1
+    r1 = np.ceil(z1[selected] / resolution).astype(np.int64) + 1
+
+    diff = np.zeros((rooms, height + 1, width + 1), dtype=np.int32)
+    np.add.at(diff, (room, r0, c0), 1)
+    np.add.at(diff, (room, r0, c1), -1)
+    np.add.at(diff, (room, r1, c0), -1)
+    np.add.at(diff, (room, r1, c1), 1)
+    occupied = diff.cumsum(axis=1).cumsum(axis=2)[:, :height, :width] > 0
+
+    # Стены и область за пределами помещения (сетка общая для всех помещений)
+    row_index = np.arange(height)[None, :, None]
+    col_index = np.arange(width)[None, None, :]
+    inside = (
+        (row_index >= 1) & (row_index <= rows[:, None, None]) &
+        (col_index >= 1) & (col_index <= cols[:, None, None])
+    )
+    return occupied | ~inside
+
+
+def _neighbors_max(values: np.ndarray) -> np.ndarray:
+    """Максимум по 4-соседям (и самой клетке) в каждом слое"""
+    result = values.copy()
+    np.maximum(result[:, 1:], values[:, :-1], out=result[:, 1:])
+    np.maximum(result[:, :-1], values[:, 1:], out=result[:, :-1])
+    np.maximum(result[:, :, 1:], values[:, :, :-1], out=result[:, :, 1:])
+    np.maximum(result[:, :, :-1], values[:, :, 1:], out=result[:, :, :-1])
+    return result
+
+
+def clearance_map(occupied: np.ndarray) -> np.ndarray:
+    """Чебышёвское расстояние до ближайшей занятой клетки (0 - занята)"""
+    distance = np.where(occupied, 0, np.iinfo(np.int32).max).astype(np.int32)
+    level = 0
+    frontier = occupied
+    while True:
+        # Клетки, соседние (по 8 направлениям) с фронтом, получают расстояние level + 1
+        grown = frontier.copy()
+        grown[:, 1:] |= frontier[:, :-1]
+        grown[:, :-1] |= frontier[:, 1:]
+        expanded = grown.copy()
+        expanded[:, :, 1:] |= grown[:, :, :-1]
+        expanded[:, :, :-1] |= grown[:, :, 1:]
+        new = expanded & (distance > level + 1)
+        if not new.any():
+            return distance
+        level += 1
+        distance[new] = level
+        frontier = expanded
+
+
+def bottleneck_map(clearance: np.ndarray, sources: np.ndarray) -> np.ndarray:
+    """
+    Для каждой клетки - наибольшее значение min(D) по путям от источников
+    (волновое распространение "самого широкого пути")
+    """
+    best = np.where(sources, clearance, 0)
+    iteration = 0
+    while True:
+        grown = np.minimum(_neighbors_max(best), clearance)
+        iteration += 1
+        if iteration % CONVERGENCE_CHECK_EVERY == 0 and np.array_equal(grown, best):
+            return grown
+        best = grown
+
+
+class ErgonomicsAnalyzer:
+    """Доступность мебели и ширина проходов по сетке занятости"""
+
+    def __init__(self, resolution: float = ERGONOMICS_GRID_RESOLUTION, min_passage: float = MIN_PASSAGE_WIDTH):
+        self.resolution = resolution
+        self.min_passage = min_passage
+
+    def analyze(self, snapshot: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Помещения обрабатываются по отдельности (сетка размером с само помещение),
+        шаг сетки увеличивается, если всего клеток больше ERGONOMICS_MAX_CELLS
+        """
+        model_types = FLOOR_MODEL_TYPES + DOOR_MODEL_TYPES
+        scene = SceneArrays(snapshot, model_types)
+        resolution = self.effective_resolution(scene)
+        required_clearance = self._required_clearance(resolution)
+
+        models_by_room: Dict[Any, List[Dict[str, Any]]] = {}
+        for model in snapshot.get("models", []):
+            models_by_room.setdefault(model.get("room_id"), []).append(model)
+        rooms = [
+            self._analyze_room(
+                SceneArrays({"rooms": [room], "models": models_by_room.get(room["id"], [])}, model_types),
+                resolution, required_clearance
+            )
+            for room in snapshot.get("rooms", [])
+        ]
+
+        total_area = float(scene.area.sum())
+        scores = np.array([room["score"] for room in rooms], dtype=float)
+        project_score = float(np.average(scores, weights=scene.area)) if total_area > 0 else (
+            float(scores.mean()) if rooms else 100.0
+        )
+        return {
+            "project_id": snapshot.get("project_id"),
+            "total_rooms": len(rooms),
+            "total_area": total_area,
+            "analysis": {
+                "score": round(project_score, 1),
+                "issues": [issue for room in rooms for issue in room["issues"]],
+                "suggestions": [suggestion for room in rooms for suggestion in room["suggestions"]],
+                "rooms": rooms,
+            },
+            "engine": "occupancy_grid",
+            "resolution": resolution,
+        }
+
+    def effective_resolution(self, scene: SceneArrays) -> float:
+        """Шаг сетки: не меньше ERGONOMICS_MIN_RESOLUTION и не больше ERGONOMICS_MAX_CELLS клеток"""
+        resolution = max(self.resolution, ERGONOMICS_MIN_RESOLUTION)
+        while True:
+            cells = float(((np.ceil(scene.length / resolution) + 2) * (np.ceil(scene.width / resolution) + 2)).sum())
+            if cells <= ERGONOMICS_MAX_CELLS:
+                return resolution
+            resolution = round(resolution * max(math.sqrt(cells / ERGONOMICS_MAX_CELLS), 1.05), 4)
+
+    def _required_clearance(self, resolution: float) -> int:
+        """Минимальное D, при котором через клетку проходит min_passage"""
+        return math.ceil(math.ceil(self.min_passage / resolution - 1e-9) / 2)
+
+    def _analyze_room(self, scene: SceneArrays, resolution: float, required_clearance: int) -> Dict[str, Any]:
+        """Результат одного помещения (scene содержит одно помещение и его модели)"""
+        is_door = np.array([m.get("type") in DOOR_MODEL_TYPES for m in scene.models], dtype=bool)
+
+        walls = rasterize(scene, resolution, np.zeros_like(is_door))
+        occupied = rasterize(scene, resolution, ~is_door)
+        clearance = clearance_map(occupied)
+
+        # Источники: проемы дверей, а без дверей - самая просторная клетка помещения
+        doors = rasterize(scene, resolution, is_door) & ~walls
+        has_door = bool(doors.any())
+        if has_door:
+            door_zone = (clearance_map(doors) <= 2 * required_clearance) & ~occupied
+            clearance = np.where(door_zone, clearance_map(occupied & ~walls), clearance)
+            sources = doors
+        else:
+            sources = np.zeros_like(occupied)
+            sources.flat[clearance.argmax()] = True
+        bottleneck = bottleneck_map(clearance, sources & ~occupied)
+
+        walkable = int((clearance >= required_clearance).sum())
+        free_cells = int((~occupied).sum())
+
+        # Узкое место пути к каждому предмету - лучшая клетка в зоне подхода
+        # (на расстоянии до ширины прохода от габарита); клетки вплотную к
+        # предмету узкие по определению, поэтому зона шире одного кольца
+        x0, x1, z0, z1 = scene.bounds()
+        margin = 2 * required_clearance
+        item_bottleneck = np.zeros(len(scene.models), dtype=np.int64)
+        for index in np.flatnonzero(~is_door):
+            r0 = max(int(z0[index] // resolution) + 1 - margin, 0)
+            r1 = int(math.ceil(z1[index] / resolution)) + 1 + margin
+            c0 = max(int(x0[index] // resolution) + 1 - margin, 0)
+            c1 = int(math.ceil(x1[index] / resolution)) + 1 + margin
+            item_bottleneck[index] = bottleneck[0, r0:r1, c0:c1].max(initial=0)
+
+        passage = np.maximum(2 * item_bottleneck - 1, 0) * resolution
+        unreachable = ~is_door & (item_bottleneck < required_clearance)
+        unreachable_count = int(unreachable.sum())
+        furniture = ~is_door
+        narrowest = float(passage[furniture].min()) if furniture.any() else math.inf
+
+        narrow_penalty = (
+            30 * max(self.min_passage - narrowest, 0) / self.min_passage if math.isfinite(narrowest) else 0
+        )
+        score = float(np.clip(100 - min(20 * unreachable_count, 60) - narrow_penalty, 0, 100))
+
+        name = scene.room_names[0]
+        issues: List[str] = []
+        suggestions: List[str] = []
+        blocked = [scene.models[i]["name"] for i in np.flatnonzero(unreachable)]
+        if blocked:
+            issues.append(f"{name}: нет прохода шириной {self.min_passage}м к: {', '.join(blocked)}")
+            suggestions.append(f"{name}: раздвиньте мебель, чтобы открыть проход к недоступным предметам")
+        elif math.isfinite(narrowest) and narrowest < self.min_passage:
+            issues.append(f"{name}: самое узкое место на пути к мебели {narrowest:.2f}м")
+
+        return {
+            "room_id": int(scene.room_ids[0]),
+            "name": name,
+            "score": round(score, 1),
+            "narrowest_passage": round(narrowest, 2) if math.isfinite(narrowest) else None,
+            "unreachable_items": unreachable_count,
+            "walkable_ratio": round(walkable / free_cells, 3) if free_cells else 0.0,
+            "has_door": has_door,
+            "issues": issues,
+            "suggestions": suggestions,
+        }
@@ -0,0 +1,258 @@
+"""
+Геометрический анализ планировки (без LLM)
+
+Работает со снимком проекта (RecommendationSystem.project_snapshot) и
+считает все помещения проекта сразу, массивами NumPy:
+- доля свободной площади пола
+- ширина самого широкого сквозного прохода по каждой оси
+- плотность расстановки мебели
+- пересечения мебели, слишком узкие зазоры, выход за границы помещения
+
+Координаты модели - центр в системе помещения: x по ширине [0, width],
+z по длине [0, length]; rotation.y - поворот вокруг вертикали в градусах.
+Габарит на полу - описанный прямоугольник (AABB) с учетом поворота и масштаба.
+"""
+from typing import Dict, Any, List, Optional
+import numpy as np
+
+MIN_PASSAGE_WIDTH = 0.9  # Минимальная ширина прохода, м
+MIN_CLEARANCE = 0.6  # Минимальный зазор между предметами, м (0 - вплотную, допустимо)
+MIN_FREE_FLOOR_RATIO = 0.5  # Рекомендуемая доля свободного пола
+MAX_LISTED_COLLISIONS = 20  # Сколько пересекающихся пар перечислять в issues
+
+# Типы моделей, занимающие пол
+FLOOR_MODEL_TYPES = ("furniture",)
+
+
+class SceneArrays:
+    """
+    Помещения и габариты моделей снимка проекта в виде массивов
+    Модели без помещения или без размеров пропускаются
+    """
+
+    def __init__(self, snapshot: Dict[str, Any], model_types: Optional[tuple] = FLOOR_MODEL_TYPES):
+        rooms = snapshot.get("rooms", [])
+        self.room_ids = np.array([room["id"] for room in rooms], dtype=np.int64)
+        self.room_names = [room["name"] for room in rooms]
+        self.width = np.array([room["dimensions"]["width"] or 0 for room in rooms], dtype=float)
+        self.length = np.array([room["dimensions"]["length"] or 0 for room in rooms], dtype=float)
+        self.height = np.array([room["dimensions"]["height"] or 0 for room in rooms], dtype=float)
+        self.area = self.width * self.length
+
+        room_index = {room_id: i for i, room_id in enumerate(self.room_ids.tolist())}
+        models = [
+            model for model in snapshot.get("models", [])
+            if model.get("room_id") in room_index and model.get("dimensions")
+            and (model_types is None or model.get("type") in model_types)
+        ]
+        self.models = models
+        self.model_room = np.array([room_index[m["room_id"]] for m in models], dtype=np.int64)
+
+        def component(values, key, default):
+            return np.array([float((v or {}).get(key, default) or 0) for v in values], dtype=float)
+
+        dimensions = [m["dimensions"] for m in models]
+        scale = [m.get("scale") for m in models]
+        model_width = component(dimensions, "width", 0) * component(scale, "x", 1)
+        model_depth = component(dimensions, "depth", 0) * component(scale, "z", 1)
+        self.model_height = component(dimensions, "height", 0) * component(scale, "y", 1)
+
+        angle = np.radians(component([m.get("rotation") for m in models], "y", 0))
+        cos, sin = np.abs(np.cos(angle)), np.abs(np.sin(angle))
+        self.half_x = (model_width * cos + model_depth * sin) / 2
+        self.half_z = (model_width * sin + model_depth * cos) / 2
+
+        position = [m.get("position") for m in models]
+        self.center_x = component(position, "x", 0)
+        self.center_z = component(position, "z", 0)
+
+    @property
+    def room_count(self) -> int:
+        return len(self.room_ids)
+
+    def bounds(self):
+        """Границы габаритов (x0, x1, z0, z1), обрезанные по помещению"""
+        room_width = self.width[self.model_room]
+        room_length = self.length[self.model_room]
+        return (
+            np.clip(self.center_x - self.half_x, 0, room_width),
+            np.clip(self.center_x + self.half_x, 0, room_width),
+            np.clip(self.center_z - self.half_z, 0, room_length),
+            np.clip(self.center_z + self.half_z, 0, room_length),
+        )
+
+    def room_pairs(self):
+        """Пары индексов моделей из одного помещения (i < j)"""
+        order = np.argsort(self.model_room, kind="stable")
+        counts = np.bincount(self.model_room, minlength=self.room_count)
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        first, second = [], []
+        for start, count in zip(starts.tolist(), counts.tolist()):
+            if count < 2:
+                continue
+            i, j = np.triu_indices(count, k=1)
+            first.append(order[start + i])
+            second.append(order[start + j])
+        if not first:
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty
+        return np.concatenate(first), np.concatenate(second)
+
+
+def widest_gaps(lo: np.ndarray, hi: np.ndarray, group: np.ndarray, extent: np.ndarray) -> np.ndarray:
+    """
+    Самый широкий свободный промежуток на отрезке [0, extent] каждой группы,
+    не покрытый интервалами [lo, hi) (все группы за один проход)
+    """
+    widest = extent.astype(float).copy()
+    if len(lo) == 0:
+        return widest
+
+    order = np.lexsort((lo, group))
+    lo, hi, group = lo[order], hi[order], group[order]
+    # Сдвиг по группам, чтобы накопленный максимум не переходил между группами
+    shift = group * (float(extent.max()) + 1.0)
+    covered = np.maximum.accumulate(hi + shift) - shift
+
+    first = np.ones(len(lo), dtype=bool)
+    first[1:] = group[1:] != group[:-1]
+    last = np.ones(len(lo), dtype=bool)
+    last[:-1] = first[1:]
+
+    previous = np.empty_like(lo)
+    previous[0] = 0.0
+    previous[1:] = covered[:-1]
+    previous[first] = 0.0
+
+    has_models = np.zeros(len(extent), dtype=bool)
+    has_models[group] = True
+    widest[has_models] = 0.0
+    np.maximum.at(widest, group, lo - previous)
+    np.maximum.at(widest, group[last], extent[group[last]] - covered[last])
+    return widest
+
+
+class LayoutAnalyzer:
+    """Оценка планировки всех помещений проекта (0-100)"""
+
+    def __init__(
+        self,
+        min_passage: float = MIN_PASSAGE_WIDTH,
+        min_clearance: float = MIN_CLEARANCE,
+        min_free_ratio: float = MIN_FREE_FLOOR_RATIO
+    ):
+        self.min_passage = min_passage
+        self.min_clearance = min_clearance
+        self.min_free_ratio = min_free_ratio
+
+    def analyze(self, snapshot: Dict[str, Any]) -> Dict[str, Any]:
+        scene = SceneArrays(snapshot)
+        rooms = scene.room_count
+        x0, x1, z0, z1 = scene.bounds()
+        group = scene.model_room
+
+        # Занятая площадь и плотность
+        occupied = np.bincount(group, weights=(x1 - x0) * (z1 - z0), minlength=rooms)
+        safe_area = np.where(scene.area > 0, scene.area, 1.0)
+        free_ratio = np.clip(1 - occupied / safe_area, 0, 1)
+        density = np.bincount(group, minlength=rooms) / safe_area
+
+        # Сквозные проходы: вдоль длины (промежутки по x) и вдоль ширины (по z)
+        passage = np.maximum(
+            widest_gaps(x0, x1, group, scene.width),
+            widest_gaps(z0, z1, group, scene.length)
+        )
+
+        # Выход за границы помещения
+        outside = (
+            (scene.center_x - scene.half_x < -1e-6) |
+            (scene.center_x + scene.half_x > scene.width[group] + 1e-6) |
+            (scene.center_z - scene.half_z < -1e-6) |
+            (scene.center_z + scene.half_z > scene.length[group] + 1e-6)
+        )
+        outside_count = np.bincount(group[outside], minlength=rooms)
+
+        # Пересечения и узкие зазоры между предметами одного помещения
+        i, j = scene.room_pairs()
+        dx = np.abs(scene.center_x[i] - scene.center_x[j]) - (scene.half_x[i] + scene.half_x[j])
+        dz = np.abs(scene.center_z[i] - scene.center_z[j]) - (scene.half_z[i] + scene.half_z[j])
+        overlap = (dx < -1e-6) & (dz < -1e-6)
+        gap = np.hypot(np.maximum(dx, 0), np.maximum(dz, 0))
+        narrow = ~overlap & (gap > 1e-6) & (gap < self.min_clearance)
+        collision_count = np.bincount(group[i[overlap]], minlength=rooms)
+        narrow_count = np.bincount(group[i[narrow]], minlength=rooms)
+
+        # Оценка помещения - штрафы за каждое нарушение
+        score = (
+            100
+            - 60 * np.clip(self.min_free_ratio - free_ratio, 0, None) / self.min_free_ratio
+            - 25 * np.clip(self.min_passage - passage, 0, None) / self.min_passage
+            - np.minimum(10 * collision_count, 30)
+            - np.minimum(10 * outside_count, 30)
+            - np.minimum(3 * narrow_count, 15)
+        )
+        score = np.clip(score, 0, 100)
+        total_area = float(scene.area.sum())
+        project_score = float(np.average(score, weights=scene.area)) if total_area > 0 else (
+            float(score.mean()) if rooms else 100.0
+        )
+
+        room_issues, room_suggestions = self._describe(
+            scene, free_ratio, passage, collision_count, outside_count, narrow_count,
+            [
+                (int(group[a]), scene.models[a]["name"], scene.models[b]["name"])
+                for a, b in zip(i[overlap][:MAX_LISTED_COLLISIONS], j[overlap][:MAX_LISTED_COLLISIONS])
+            ]
+        )
+
+        return {
+            "project_id": snapshot.get("project_id"),
+            "total_rooms": rooms,
+            "total_area": total_area,
+            "analysis": {
+                "score": round(project_score, 1),
+                "issues": [issue for issues in room_issues for issue in issues],
+                "suggestions": [suggestion for suggestions in room_suggestions for suggestion in suggestions],
+                "rooms": [
+                    {
+                        "room_id": int(scene.room_ids[r]),
+                        "name": scene.room_names[r],
+                        "score": round(float(score[r]), 1),
+                        "free_floor_ratio": round(float(free_ratio[r]), 3),
+                        "circulation_width": round(float(passage[r]), 2),
+                        "furniture_density": round(float(density[r]), 3),
+                        "collisions": int(collision_count[r]),
+                        "narrow_gaps": int(narrow_count[r]),
+                        "out_of_bounds": int(outside_count[r]),
+                        "issues": room_issues[r],
+                        "suggestions": room_suggestions[r],
+                    }
+                    for r in range(rooms)
+                ],
+            },
+            "engine": "geometry",
+        }
+
+    def _describe(self, scene, free_ratio, passage, collisions, outside, narrow, collided_pairs):
+        """Проблемы и предложения по каждому помещению (списки в порядке помещений)"""
+        room_issues: List[List[str]] = [[] for _ in range(scene.room_count)]
+        room_suggestions: List[List[str]] = [[] for _ in range(scene.room_count)]
+        for r in range(scene.room_count):
+            name = scene.room_names[r]
+            issues, suggestions = room_issues[r], room_suggestions[r]
+            if free_ratio[r] < self.min_free_ratio:
+                issues.append(f"{name}: свободно {free_ratio[r]:.0%} площади пола")
+                suggestions.append(f"{name}: уберите или замените часть мебели на более компактную")
+            if passage[r] < self.min_passage:
+                issues.append(f"{name}: самый широкий проход {passage[r]:.2f}м (нужно {self.min_passage}м)")
+                suggestions.append(f"{name}: освободите сквозной проход вдоль одной из стен")
+            if outside[r]:
+                issues.append(f"{name}: предметов за границами помещения - {int(outside[r])}")
+            if narrow[r]:
+                issues.append(f"{name}: узких зазоров между предметами - {int(narrow[r])}")
+                suggestions.append(
+                    f"{name}: сдвиньте предметы вплотную или разнесите не менее чем на {self.min_clearance}м"
+                )
+        for r, first, second in collided_pairs:
+            room_issues[r].append(f"Пересекаются: {first} и {second}")
+        return room_issues, room_suggestions
@@ -0,0 +1,192 @@
+"""
+Анализ освещения: расчет освещенности пола от светильников
+
+Модели типа fixture считаются точечными изотропными источниками:
+E = Φ · h / (4π · d³), где Φ - световой поток (лм), h - высота источника
+над расчетной плоскостью, d - расстояние до точки. Отраженный свет
+добавляется равномерной составляющей по формуле Сампнера:
+E_отр = ΣΦ · ρ / (S · (1 - ρ)), S - площадь всех поверхностей помещения.
+
+Световой поток берется из свойств материала модели (Material.properties:
+lumens или luminous_flux), иначе DEFAULT_FIXTURE_LUMENS - позиции каталога
+(CatalogPrice) светового потока не хранят.
+Высота источника - position.y, если задана (в том числе 0), иначе под потолком.
+
+Нормы берутся из Standard категории lighting (parameters: avg_lux, min_lux,
+min_uniformity), по умолчанию - DEFAULT_LIGHTING_NORMS.
+"""
+from typing import Dict, Any, List, Optional
+import math
+import os
+import numpy as np
+
+from .layout_analysis import SceneArrays
+
+LIGHTING_GRID_RESOLUTION = float(os.getenv("LIGHTING_GRID_RESOLUTION", "0.1"))
+DEFAULT_FIXTURE_LUMENS = 800.0
+FIXTURE_MODEL_TYPES = ("fixture",)
+DEFAULT_LIGHTING_NORMS = {"avg_lux": 150.0, "min_lux": 50.0, "min_uniformity": 0.3}
+LIGHTING_STANDARD_CATEGORY = "lighting"
+SURFACE_REFLECTANCE = 0.5  # Средний коэффициент отражения поверхностей
+HEATMAP_MAX_SIZE = 20  # Сторона уменьшенной тепловой карты в ответе
+CELL_CHUNK = 16384  # Клеток за один шаг broadcasting (ограничивает память)
+
+
+def fixture_lumens(model: Dict[str, Any], materials: Dict[int, Dict[str, Any]]) -> float:
+    properties = (materials.get(model.get("material_id")) or {}).get("properties") or {}
+    for key in ("lumens", "luminous_flux"):
+        value = properties.get(key)
+        if isinstance(value, (int, float)) and value > 0:
+            return float(value)
+    return DEFAULT_FIXTURE_LUMENS
+
+
+def illuminance(
+    points_x: np.ndarray,
+    points_z: np.ndarray,
+    fixtures: np.ndarray,
+    plane_height: float = 0.0
+) -> np.ndarray:
+    """
+    Освещенность (лк) в точках плоскости от набора источников
+    fixtures - массив (N, 4): x, y (высота), z, световой поток
+    """
+    result = np.zeros(len(points_x), dtype=np.float32)
+    if len(fixtures) == 0 or len(points_x) == 0:
+        return result
+
+    fx, fz = fixtures[:, 0].astype(np.float32), fixtures[:, 2].astype(np.float32)
+    height = np.maximum(fixtures[:, 1] - plane_height, 0.05).astype(np.float32)
+    # Φ · h / 4π - общий множитель источника
+    weight = (fixtures[:, 3] * height / (4 * math.pi)).astype(np.float32)
+    height_sq = height * height
+
+    for start in range(0, len(points_x), CELL_CHUNK):
+        px = points_x[start:start + CELL_CHUNK, None].astype(np.float32)
+        pz = points_z[start:start + CELL_CHUNK, None].astype(np.float32)
+        distance_sq = (px - fx) ** 2 + (pz - fz) ** 2 + height_sq
+        result[start:start + CELL_CHUNK] = (weight / (distance_sq * np.sqrt(distance_sq))).sum(axis=1)
+    return result
+
+
+def _downsample(grid: np.ndarray, size: int = HEATMAP_MAX_SIZE) -> List[List[int]]:
+    """Уменьшить карту до size x size средним по блокам"""
+    rows, cols = grid.shape
+    row_edges = np.linspace(0, rows, min(rows, size) + 1).astype(int)
+    col_edges = np.linspace(0, cols, min(cols, size) + 1).astype(int)
+    summed = np.add.reduceat(np.add.reduceat(grid, row_edges[:-1], axis=0), col_edges[:-1], axis=1)
+    counts = np.outer(np.diff(row_edges), np.diff(col_edges))
+    return np.rint(summed / counts).astype(int).tolist()
+
+
+class LightingAnalyzer:
+    """Освещенность пола каждого помещения и сравнение с нормами"""
+
+    def __init__(
+        self,
+        resolution: float = LIGHTING_GRID_RESOLUTION,
+        norms: Optional[Dict[str, float]] = None,
+        plane_height: float = 0.0
+    ):
+        self.resolution = resolution
+        # Нормы - делители в оценке, поэтому учитываются только положительные
+        self.norms = {
+            **DEFAULT_LIGHTING_NORMS,
+            **{key: value for key, value in (norms or {}).items() if value and value > 0},
+        }
+        self.plane_height = plane_height
+
+    def analyze(self, snapshot: Dict[str, Any]) -> Dict[str, Any]:
+        scene = SceneArrays(snapshot, model_types=())
+        materials = {material["id"]: material for material in snapshot.get("materials", [])}
+        room_index = {room_id: i for i, room_id in enumerate(scene.room_ids.tolist())}
+
+        fixtures_by_room: List[List[List[float]]] = [[] for _ in range(scene.room_count)]
+        for model in snapshot.get("models", []):
+            if model.get("type") not in FIXTURE_MODEL_TYPES or model.get("room_id") not in room_index:
+                continue
+            r = room_index[model["room_id"]]
+            position = model.get("position") or {}
+            y = position.get("y")
+            if y is None:
+                y = scene.height[r]
+            fixtures_by_room[r].append([
+                float(position.get("x") or 0), float(y),
+                float(position.get("z") or 0), fixture_lumens(model, materials)
+            ])
+
+        avg_norm = self.norms["avg_lux"]
+        min_norm = self.norms["min_lux"]
+        uniformity_norm = self.norms["min_uniformity"]
+        rooms: List[Dict[str, Any]] = []
+        scores = np.zeros(scene.room_count)
+
+        for r in range(scene.room_count):
+            name = scene.room_names[r]
+            issues: List[str] = []
+            suggestions: List[str] = []
+            cols = max(int(math.ceil(scene.width[r] / self.resolution)), 1)
+            rows = max(int(math.ceil(scene.length[r] / self.resolution)), 1)
+            xs = (np.arange(cols) + 0.5) * (scene.width[r] / cols)
+            zs = (np.arange(rows) + 0.5) * (scene.length[r] / rows)
+            grid_x, grid_z = np.meshgrid(xs, zs)
+            fixtures = np.array(fixtures_by_room[r], dtype=float).reshape(-1, 4)
+            lux = illuminance(grid_x.ravel(), grid_z.ravel(), fixtures, self.plane_height).reshape(rows, cols)
+            surface = 2 * (
+                scene.width[r] * scene.length[r] + (scene.width[r] + scene.length[r]) * scene.height[r]
+            )
+            if surface > 0:
+                lux += fixtures[:, 3].sum() * SURFACE_REFLECTANCE / (surface * (1 - SURFACE_REFLECTANCE))
+
+            avg_lux = float(lux.mean())
+            min_lux = float(lux.min())
+            uniformity = min_lux / avg_lux if avg_lux > 0 else 0.0
+            scores[r] = max(0.0, 100
+                - 50 * max(0.0, 1 - avg_lux / avg_norm)
+                - 30 * max(0.0, 1 - min_lux / min_norm)
+                - 20 * max(0.0, 1 - uniformity / uniformity_norm))
+
+            if not len(fixtures):
+                issues.append(f"{name}: нет светильников")
+                suggestions.append(f"{name}: добавьте основное освещение")
+            elif avg_lux < avg_norm:
+                issues.append(f"{name}: средняя освещенность {avg_lux:.0f} лк (норма {avg_norm:.0f} лк)")
+                needed = fixtures[:, 3].sum() * (avg_norm / avg_lux - 1) if avg_lux > 0 else 0
+                suggestions.append(f"{name}: увеличьте световой поток примерно на {needed:.0f} лм")
+            elif min_lux < min_norm or uniformity < uniformity_norm:
+                issues.append(f"{name}: неравномерное освещение (минимум {min_lux:.0f} лк)")
+                suggestions.append(f"{name}: распределите светильники равномернее или добавьте локальный свет")
+
+            rooms.append({
+                "room_id": int(scene.room_ids[r]),
+                "name": name,
+                "score": round(float(scores[r]), 1),
+                "fixtures": len(fixtures),
+                "total_lumens": float(fixtures[:, 3].sum()),
+                "avg_lux": round(avg_lux, 1),
+                "min_lux": round(min_lux, 1),
+                "max_lux": round(float(lux.max()), 1),
+                "uniformity": round(uniformity, 3),
+                "heatmap": _downsample(lux),
+                "issues": issues,
+                "suggestions": suggestions,
+            })
+
+        total_area = float(scene.area.sum())
+        project_score = float(np.average(scores, weights=scene.area)) if total_area > 0 else (
+            float(scores.mean()) if scene.room_count else 100.0
+        )
+        return {
+            "project_id": snapshot.get("project_id"),
+            "total_rooms": scene.room_count,
+            "total_area": total_area,
+            "analysis": {
+                "score": round(project_score, 1),
+                "issues": [issue for room in rooms for issue in room["issues"]],
+                "suggestions": [suggestion for room in rooms for suggestion in room["suggestions"]],
+                "rooms": rooms,
+                "norms": self.norms,
+            },
+            "engine": "lighting",
+            "resolution": self.resolution,
+        }
@@ -0,0 +1,301 @@
+"""
+Клиент LLM для рекомендаций и анализа
+
+Провайдер выбирается переменной окружения LLM_PROVIDER:
+- local     - офлайн-заглушка без сети (по умолчанию, тесты)
+- openai    - OpenAI Chat Completions (OPENAI_API_KEY, требуется пакет httpx)
+- anthropic - Anthropic Messages API (ANTHROPIC_API_KEY, требуется пакет httpx)
+
+LLM_BASE_URL позволяет направить провайдера openai на совместимый
+локальный сервер (vLLM, Ollama и т.п.).
+
+Ответ запрашивается в виде JSON-объекта (complete_json) или потоком
+текстовых фрагментов (stream). Клиент ограничивает число одновременных
+запросов (LLM_MAX_CONCURRENCY), прерывает запрос по таймауту (LLM_TIMEOUT;
+для потока - ожидание каждого фрагмента) и повторяет неудачные попытки
+с экспоненциальной задержкой (LLM_MAX_RETRIES). Поток повторяется только
+до получения первого фрагмента; закрытие потока потребителем закрывает
+HTTP-соединение с провайдером.
+"""
+from typing import Dict, Any, Optional, AsyncIterator
+import asyncio
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "local")
+LLM_MODEL = os.getenv("LLM_MODEL")
+LLM_BASE_URL = os.getenv("LLM_BASE_URL")
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+LLM_MAX_TOKENS = int(os.getenv("LLM_MAX_TOKENS", "2000"))
+
+RETRY_BASE_DELAY = 0.5
+
+
+class LLMError(Exception):
+    """Ошибка вызова LLM (после всех повторов)"""
+
+
+class LLMProvider:
+    """Базовый провайдер: один запрос - один текстовый ответ"""
+
+    name = "base"
+    default_model: Optional[str] = None
+
+    def __init__(self, model: Optional[str] = None):
+        self.model = model or self.default_model
+
+    async def complete(self, system: str, prompt: str) -> str:
+        raise NotImplementedError
+
+    async def stream(self, system: str, prompt: str, json_output: bool = True) -> AsyncIterator[str]:
+        """Поток фрагментов ответа; по умолчанию - весь ответ одним фрагментом"""
+        yield await self.complete(system, prompt)
+
+    async def close(self):
+        pass
+
+
+class LocalProvider(LLMProvider):
+    """
+    Офлайн-заглушка: детерминированный ответ без обращения к сети
+    Ответ строится по полю "stub" запроса (см. RecommendationSystem)
+    """
+
+    name = "local"
+    default_model = "local-stub"
+    chunk_size = 16
+
+    async def complete(self, system: str, prompt: str) -> str:
+        try:
+            request = json.loads(prompt)
+        except ValueError:
+            return json.dumps({"text": prompt[:200]}, ensure_ascii=False)
+        stub = request.get("stub", {})
+        return stub if isinstance(stub, str) else json.dumps(stub, ensure_ascii=False)
+
+    async def stream(self, system: str, prompt: str, json_output: bool = True) -> AsyncIterator[str]:
+        text = await self.complete(system, prompt)
+        for start in range(0, len(text), self.chunk_size):
+            yield text[start:start + self.chunk_size]
+            await asyncio.sleep(0)
+
+
+class HTTPProvider(LLMProvider):
+    """Провайдер поверх HTTP API (общий клиент httpx с пулом соединений)"""
+
+    base_url = ""
+
+    def __init__(self, api_key: Optional[str], model: Optional[str] = None, base_url: Optional[str] = None):
+        super().__init__(model)
+        try:
+            import httpx
+        except ImportError:
+            raise RuntimeError(f"Для LLM_PROVIDER={self.name} установите пакет httpx")
+        if not api_key and not base_url:
+            raise RuntimeError(f"Для LLM_PROVIDER={self.name} не задан API ключ")
+        self.api_key = api_key
+        self.http = httpx.AsyncClient(base_url=base_url or self.base_url, timeout=None)
+
+    async def close(self):
+        await self.http.aclose()
+
+    async def _post(self, path: str, headers: Dict[str, str], body: Dict[str, Any]) -> Dict[str, Any]:
+        response = await self.http.post(path, headers=headers, json=body)
+        if response.status_code >= 400:
+            raise LLMError(f"{self.name}: HTTP {response.status_code}: {response.text[:200]}")
+        return response.json()
+
+    async def _stream_events(
+        self,
+        path: str,
+        headers: Dict[str, str],
+        body: Dict[str, Any]
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """События SSE ответа провайдера (строки "data: {...}")"""
+        async with self.http.stream("POST", path, headers=headers, json=body) as response:
+            if response.status_code >= 400:
+                await response.aread()
+                raise LLMError(f"{self.name}: HTTP {response.status_code}: {response.text[:200]}")
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    return
+                yield json.loads(data)
+
+
+class OpenAIProvider(HTTPProvider):
+    name = "openai"
+    default_model = "gpt-4o-mini"
+    base_url = "https://api.openai.com/v1"
+
+    async def complete(self, system: str, prompt: str) -> str:
+        data = await self._post("/chat/completions", self._headers(), self._body(system, prompt, True))
+        return data["choices"][0]["message"]["content"]
+
+    async def stream(self, system: str, prompt: str, json_output: bool = True) -> AsyncIterator[str]:
+        body = {**self._body(system, prompt, json_output), "stream": True}
+        async for event in self._stream_events("/chat/completions", self._headers(), body):
+            for choice in event.get("choices", []):
+                content = choice.get("delta", {}).get("content")
+                if content:
+                    yield content
+
+    def _headers(self) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+
+    def _body(self, system: str, prompt: str, json_output: bool) -> Dict[str, Any]:
+        body = {
+            "model": self.model,
+            "max_tokens": LLM_MAX_TOKENS,
+            "messages": [
+                {"role": "system", "content": system},
+                {"role": "user", "content": prompt},
+            ],
+        }
+        if json_output:
+            body["response_format"] = {"type": "json_object"}
+        return body
+
+
+class AnthropicProvider(HTTPProvider):
+    name = "anthropic"
+    default_model = "claude-3-5-haiku-latest"
+    base_url = "https://api.anthropic.com/v1"
+
+    async def complete(self, system: str, prompt: str) -> str:
+        data = await self._post("/messages", self._headers(), self._body(system, prompt))
+        return "".join(block.get("text", "") for block in data["content"] if block.get("type") == "text")
+
+    async def stream(self, system: str, prompt: str, json_output: bool = True) -> AsyncIterator[str]:
+        body = {**self._body(system, prompt), "stream": True}
+        async for event in self._stream_events("/messages", self._headers(), body):
+            if event.get("type") == "content_block_delta":
+                text = event.get("delta", {}).get("text")
+                if text:
+                    yield text
+            elif event.get("type") == "error":
+                raise LLMError(f"{self.name}: {event.get('error')}")
+
+    def _headers(self) -> Dict[str, str]:
+        return {"x-api-key": self.api_key, "anthropic-version": "2023-06-01"}
+
+    def _body(self, system: str, prompt: str) -> Dict[str, Any]:
+        return {
+            "model": self.model,
+            "max_tokens": LLM_MAX_TOKENS,
+            "system": system,
+            "messages": [{"role": "user", "content": prompt}],
+        }
+
+
+class LLMClient:
+    """Обертка над провайдером: лимит параллельности, таймауты, повторы, разбор JSON"""
+
+    def __init__(
+        self,
+        provider: LLMProvider,
+        timeout: float = LLM_TIMEOUT,
+        max_retries: int = LLM_MAX_RETRIES,
+        max_concurrency: int = LLM_MAX_CONCURRENCY
+    ):
+        self.provider = provider
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    @property
+    def model_name(self) -> str:
+        return f"{self.provider.name}:{self.provider.model}"
+
+    async def complete_json(self, system: str, prompt: str) -> Dict[str, Any]:
+        """Один запрос к LLM с ответом в виде JSON-объекта"""
+        last_error: Optional[Exception] = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                await asyncio.sleep(RETRY_BASE_DELAY * 2 ** (attempt - 1))
+            try:
+                async with self._semaphore:
+                    text = await asyncio.wait_for(
+                        self.provider.complete(system, prompt), self.timeout
+                    )
+                return parse_json_object(text)
+            except asyncio.TimeoutError:
+                last_error = LLMError(f"{self.provider.name}: таймаут {self.timeout} с")
+            except (LLMError, ValueError) as e:
+                last_error = e
+            except Exception as e:
+                # Сетевые ошибки httpx и т.п.
+                last_error = LLMError(f"{self.provider.name}: {e}")
+            logger.warning("Попытка %s запроса к LLM не удалась: %s", attempt + 1, last_error)
+        raise LLMError(str(last_error))
+
+    async def stream(self, system: str, prompt: str, json_output: bool = True) -> AsyncIterator[str]:
+        """
+        Поток фрагментов ответа
+        Повтор возможен, пока не отдан первый фрагмент; закрытие генератора
+        потребителем (отмена запроса клиентом) прерывает запрос к провайдеру
+        """
+        last_error: Optional[Exception] = None
+        async with self._semaphore:
+            for attempt in range(self.max_retries + 1):
+                if attempt:
+                    await asyncio.sleep(RETRY_BASE_DELAY * 2 ** (attempt - 1))
+                started = False
+                chunks = self.provider.stream(system, prompt, json_output)
+                try:
+                    while True:
+                        try:
+                            chunk = await asyncio.wait_for(chunks.__anext__(), self.timeout)
+                        except StopAsyncIteration:
+                            return
+                        started = True
+                        yield chunk
+                except asyncio.TimeoutError:
+                    last_error = LLMError(f"{self.provider.name}: таймаут {self.timeout} с")
+                except LLMError as e:
+                    last_error = e
+                except Exception as e:
+                    last_error = LLMError(f"{self.provider.name}: {e}")
+                finally:
+                    await chunks.aclose()
+                if started:
+                    raise last_error
+                logger.warning("Попытка %s потокового запроса к LLM не удалась: %s", attempt + 1, last_error)
+        raise LLMError(str(last_error))
+
+    async def close(self):
+        await self.provider.close()
+
+
+def parse_json_object(text: str) -> Dict[str, Any]:
+    """Разобрать JSON-объект из ответа модели (допускается обрамляющий текст/```json)"""
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end < start:
+        raise ValueError("Ответ LLM не содержит JSON-объекта")
+    data = json.loads(text[start:end + 1])
+    if not isinstance(data, dict):
+        raise ValueError("Ответ LLM должен быть JSON-объектом")
+    return data
+
+
+def sse_event(event: str, data: Any) -> str:
+    """Сообщение в формате Server-Sent Events"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+def create_llm_client(provider: str = LLM_PROVIDER) -> LLMClient:
+    if provider == "openai":
+        return LLMClient(OpenAIProvider(os.getenv("OPENAI_API_KEY"), LLM_MODEL, LLM_BASE_URL))
+    if provider == "anthropic":
+        return LLMClient(AnthropicProvider(os.getenv("ANTHROPIC_API_KEY"), LLM_MODEL, LLM_BASE_URL))
+    return LLMClient(LocalProvider(LLM_MODEL))
+
+
+llm_client = create_llm_client()
@@ -0,0 +1,147 @@
+"""
+Сервис экспорта, импорта и клонирования проектов
+
+Импорт выполняется пакетной вставкой: все комнаты проекта добавляются
+одним INSERT ... RETURNING, после чего модели получают новые ID комнат
+и также вставляются одним запросом. Всё происходит в одной транзакции.
+"""
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+from typing import List, Dict, Any, Optional
+
+from ..models.project import Project
+from ..models.room import Room
+from ..models.model import Model
+from ..schemas.project import ProjectExport, ExportedModel
+
+MODEL_EXPORT_FIELDS = [
+    "name", "catalog_id", "type", "category", "file_url", "thumbnail_url",
+    "dimensions", "position", "rotation", "scale", "material_id",
+]
+
+
+class ProjectService:
+    """Экспорт/импорт проекта целиком (комнаты + 3D модели)"""
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def export_project(self, project: Project) -> ProjectExport:
+        """Собирает проект в формат экспорта двумя запросами (комнаты и модели)"""
+        rooms = self.db.query(Room).filter(
+            Room.project_id == project.id
+        ).order_by(Room.id).all()
+        room_ids = [room.id for room in rooms]
+
+        models_query = self.db.query(Model)
+        if room_ids:
+            models_query = models_query.filter(
+                (Model.project_id == project.id) | (Model.room_id.in_(room_ids))
+            )
+        else:
+            models_query = models_query.filter(Model.project_id == project.id)
+        models = models_query.order_by(Model.id).all()
+
+        models_by_room: Dict[Optional[int], List[ExportedModel]] = {}
+        for model in models:
+            exported = ExportedModel(
+                **{field: getattr(model, field) for field in MODEL_EXPORT_FIELDS}
+            )
+            models_by_room.setdefault(model.room_id, []).append(exported)
+
+        return ProjectExport(
+            name=project.name,
+            description=project.description,
+            status=project.status,
+            designer_id=project.designer_id,
+            rooms=[
+                {
+                    "name": room.name,
+                    "width": room.width,
+                    "length": room.length,
+                    "height": room.height,
+                    "position": room.position,
+                    "rotation": room.rotation,
+                    "models": models_by_room.get(room.id, []),
+                }
+                for room in rooms
+            ],
+            models=models_by_room.get(None, []),
+        )
+
+    def import_project(self, data: ProjectExport, user_id: int) -> Project:
+        """
+        Создает новый проект из формата экспорта
+        Комнаты и модели вставляются пакетно с переназначением ID
+        """
+        try:
+            project = Project(
+                name=data.name,
+                description=data.description,
+                status=data.status,
+                user_id=user_id,
+                designer_id=data.designer_id
+            )
+            self.db.add(project)
+            self.db.flush()
+
+            room_ids: List[int] = []
+            if data.rooms:
+                room_rows = [
+                    {
+                        "name": room.name,
+                        "width": room.width,
+                        "length": room.length,
+                        "height": room.height,
+                        "area": room.width * room.length,
+                        "project_id": project.id,
+                        "position": room.position,
+                        "rotation": room.rotation,
+                    }
+                    for room in data.rooms
+                ]
+                room_ids = self.db.execute(
+                    insert(Room).returning(Room.id, sort_by_parameter_order=True),
+                    room_rows
+                ).scalars().all()
+
+            model_rows: List[Dict[str, Any]] = [
+                self._model_row(model, project.id, None) for model in data.models
+            ]
+            for room, new_room_id in zip(data.rooms, room_ids):
+                model_rows.extend(
+                    self._model_row(model, project.id, new_room_id)
+                    for model in room.models
+                )
+            if model_rows:
+                self.db.execute(insert(Model), model_rows)
+
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
+
+        self.db.refresh(project)
+        return project
+
+    def duplicate_project(
+        self,
+        project: Project,
+        user_id: int,
+        name: Optional[str] = None
+    ) -> Project:
+        """Создает копию проекта для пользователя"""
+        data = self.export_project(project)
+        data.name = name or f"{project.name} (копия)"
+        return self.import_project(data, user_id)
+
+    @staticmethod
+    def _model_row(
+        model: ExportedModel,
+        project_id: int,
+        room_id: Optional[int]
+    ) -> Dict[str, Any]:
+        row = model.dict()
+        row["project_id"] = project_id
+        row["room_id"] = room_id
+        return row
@@ -0,0 +1,297 @@
+"""
+Брокер сообщений для рассылки событий между воркерами
+
+WebSocket соединения живут в памяти конкретного процесса uvicorn. Чтобы
+сообщение, отправленное через воркер B, дошло до клиента, подключенного
+к воркеру A, все события реального времени (чат, сцена) публикуются в
+брокер, а каждый воркер доставляет их своим локальным соединениям.
+
+Реализации выбираются по переменной окружения PUBSUB_URL:
+- memory://           - в пределах одного процесса (по умолчанию, тесты)
+- redis://host:6379/0 - Redis Pub/Sub (требуется пакет redis)
+- postgresql://...    - PostgreSQL LISTEN/NOTIFY (через psycopg2)
+"""
+from typing import Dict, Any, List, Callable, Awaitable, Tuple
+import asyncio
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+PUBSUB_URL = os.getenv("PUBSUB_URL", "memory://")
+CHANNEL_PREFIX = "interior_"
+RECONNECT_DELAY_SECONDS = 1.0
+MAX_RECONNECT_DELAY_SECONDS = 30.0
+
+Listener = Callable[[Dict[str, Any]], Awaitable[None]]
+
+
+class Broker:
+    """Базовый брокер: хранит подписчиков и раздает им входящие сообщения"""
+
+    # True, если сообщения не покидают текущий процесс
+    is_local = False
+
+    def __init__(self):
+        self.listeners: Dict[str, List[Listener]] = {}
+
+    def add_listener(self, channel: str, listener: Listener):
+        """Подписать обработчик на канал (до вызова start)"""
+        self.listeners.setdefault(channel, []).append(listener)
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    async def publish(self, channel: str, payload: Dict[str, Any]):
+        raise NotImplementedError
+
+    async def _dispatch(self, channel: str, payload: Dict[str, Any]):
+        for listener in self.listeners.get(channel, []):
+            try:
+                await listener(payload)
+            except Exception:
+                logger.exception("Ошибка обработчика канала %s", channel)
+
+
+class InMemoryBroker(Broker):
+    """Доставка внутри процесса - для одного воркера и тестов"""
+
+    is_local = True
+
+    async def publish(self, channel: str, payload: Dict[str, Any]):
+        await self._dispatch(channel, payload)
+
+
+class RedisBroker(Broker):
+    """Рассылка через Redis Pub/Sub (при обрыве соединения подписка восстанавливается)"""
+
+    def __init__(self, url: str):
+        super().__init__()
+        try:
+            import redis.asyncio as aioredis
+        except ImportError:
+            raise RuntimeError("Для PUBSUB_URL=redis://... установите пакет redis")
+        self.redis = aioredis.from_url(url)
+        self._pubsub = None
+        self._reader_task = None
+
+    async def start(self):
+        self._reader_task = asyncio.create_task(self._reader())
+
+    async def stop(self):
+        if self._reader_task:
+            self._reader_task.cancel()
+        if self._pubsub:
+            await self._pubsub.close()
+        await self.redis.close()
+
+    async def publish(self, channel: str, payload: Dict[str, Any]):
+        await self.redis.publish(CHANNEL_PREFIX + channel, json.dumps(payload, ensure_ascii=False))
+
+    async def _reader(self):
+        delay = RECONNECT_DELAY_SECONDS
+        while True:
+            try:
+                self._pubsub = self.redis.pubsub()
+                await self._pubsub.psubscribe(f"{CHANNEL_PREFIX}*")
+                delay = RECONNECT_DELAY_SECONDS
+                async for message in self._pubsub.listen():
+                    if message["type"] != "pmessage":
+                        continue
+                    channel = message["channel"]
+                    if isinstance(channel, bytes):
+                        channel = channel.decode()
+                    try:
+                        payload = json.loads(message["data"])
+                    except ValueError:
+                        logger.warning("Некорректное сообщение канала %s", channel)
+                        continue
+                    await self._dispatch(channel[len(CHANNEL_PREFIX):], payload)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Соединение с Redis Pub/Sub потеряно, переподключение через %s с", delay)
+            if self._pubsub:
+                try:
+                    await self._pubsub.close()
+                except Exception:
+                    pass
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, MAX_RECONNECT_DELAY_SECONDS)
+
+
+class PostgresBroker(Broker):
+    """
+    Рассылка через PostgreSQL LISTEN/NOTIFY
+    Размер сообщения NOTIFY ограничен 8000 байт: большие сообщения
+    записываются в таблицу pubsub_payloads, а в NOTIFY передается только
+    id строки - подписчики читают сообщение из таблицы. Строки старше
+    PAYLOAD_TTL_SECONDS удаляются при записи новых.
+
+    Входящие уведомления раздаются одной задачей из очереди - в порядке
+    получения, в том числе сообщения, читаемые из таблицы. При обрыве
+    соединения LISTEN оно восстанавливается (сообщения за время обрыва теряются).
+    """
+
+    NOTIFY_MAX_BYTES = 7900  # С запасом до 8000 байт вместе с именем канала
+    PAYLOAD_TTL_SECONDS = 300
+    PAYLOAD_REF_KEY = "__pubsub_payload_id"
+
+    def __init__(self, url: str):
+        super().__init__()
+        import psycopg2
+        self._psycopg2 = psycopg2
+        self.url = url
+        self._listen_conn = None
+        self._notify_conn = None
+        self._notify_lock = asyncio.Lock()
+        self._queue: "asyncio.Queue[Tuple[str, str]]" = asyncio.Queue()
+        self._consumer_task = None
+        self._reconnect_task = None
+
+    async def start(self):
+        self._notify_conn = self._connect()
+        with self._notify_conn.cursor() as cursor:
+            cursor.execute(
+                "CREATE TABLE IF NOT EXISTS pubsub_payloads ("
+                "id BIGSERIAL PRIMARY KEY, payload TEXT NOT NULL, "
+                "created_at TIMESTAMPTZ NOT NULL DEFAULT now())"
+            )
+        self._listen()
+        self._consumer_task = asyncio.create_task(self._consumer())
+
+    async def stop(self):
+        for task in (self._consumer_task, self._reconnect_task):
+            if task:
+                task.cancel()
+        self._close_listen()
+        if self._notify_conn:
+            self._notify_conn.close()
+
+    async def publish(self, channel: str, payload: Dict[str, Any]):
+        data = json.dumps(payload, ensure_ascii=False)
+        async with self._notify_lock:
+            await asyncio.get_running_loop().run_in_executor(
+                None, self._notify, CHANNEL_PREFIX + channel, data
+            )
+
+    def _connect(self):
+        conn = self._psycopg2.connect(self.url)
+        conn.set_isolation_level(self._psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        return conn
+
+    def _listen(self):
+        self._listen_conn = self._connect()
+        with self._listen_conn.cursor() as cursor:
+            for channel in self.listeners:
+                cursor.execute(f'LISTEN "{CHANNEL_PREFIX}{channel}"')
+        asyncio.get_running_loop().add_reader(self._listen_conn.fileno(), self._on_readable)
+
+    def _close_listen(self):
+        if self._listen_conn is None:
+            return
+        try:
+            asyncio.get_running_loop().remove_reader(self._listen_conn.fileno())
+            self._listen_conn.close()
+        except Exception:
+            pass
+        self._listen_conn = None
+
+    async def _relisten(self):
+        delay = RECONNECT_DELAY_SECONDS
+        while True:
+            await asyncio.sleep(delay)
+            try:
+                self._listen()
+                logger.info("Соединение LISTEN восстановлено")
+                return
+            except Exception:
+                logger.exception("Не удалось восстановить LISTEN, повтор через %s с", delay)
+                delay = min(delay * 2, MAX_RECONNECT_DELAY_SECONDS)
+
+    def _with_notify_conn(self, action):
+        """Выполнить action(cursor) на соединении NOTIFY, переподключившись один раз при обрыве"""
+        try:
+            with self._notify_conn.cursor() as cursor:
+                return action(cursor)
+        except (self._psycopg2.OperationalError, self._psycopg2.InterfaceError):
+            logger.warning("Соединение NOTIFY потеряно, переподключение")
+            try:
+                self._notify_conn.close()
+            except Exception:
+                pass
+            self._notify_conn = self._connect()
+            with self._notify_conn.cursor() as cursor:
+                return action(cursor)
+
+    def _notify(self, channel: str, data: str):
+        def send(cursor):
+            message = data
+            if len(channel.encode("utf-8")) + len(message.encode("utf-8")) > self.NOTIFY_MAX_BYTES:
+                # Слишком большое для NOTIFY - передаем ссылку на строку таблицы
+                cursor.execute(
+                    "DELETE FROM pubsub_payloads WHERE created_at < now() - make_interval(secs => %s)",
+                    (self.PAYLOAD_TTL_SECONDS,)
+                )
+                cursor.execute("INSERT INTO pubsub_payloads (payload) VALUES (%s) RETURNING id", (message,))
+                message = json.dumps({self.PAYLOAD_REF_KEY: cursor.fetchone()[0]})
+            cursor.execute("SELECT pg_notify(%s, %s)", (channel, message))
+        self._with_notify_conn(send)
+
+    def _load_payload(self, payload_id: int):
+        def load(cursor):
+            cursor.execute("SELECT payload FROM pubsub_payloads WHERE id = %s", (payload_id,))
+            return cursor.fetchone()
+        row = self._with_notify_conn(load)
+        return json.loads(row[0]) if row else None
+
+    async def _consumer(self):
+        """Раздача уведомлений строго по очереди"""
+        while True:
+            channel, raw = await self._queue.get()
+            try:
+                payload = json.loads(raw)
+                if isinstance(payload, dict) and list(payload) == [self.PAYLOAD_REF_KEY]:
+                    payload_id = payload[self.PAYLOAD_REF_KEY]
+                    async with self._notify_lock:
+                        payload = await asyncio.get_running_loop().run_in_executor(
+                            None, self._load_payload, payload_id
+                        )
+                    if payload is None:
+                        logger.warning("Сообщение %s канала %s не найдено в pubsub_payloads", payload_id, channel)
+                        continue
+                await self._dispatch(channel, payload)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Ошибка обработки уведомления канала %s", channel)
+
+    def _on_readable(self):
+        try:
+            self._listen_conn.poll()
+        except Exception:
+            logger.exception("Соединение LISTEN потеряно, переподключение")
+            self._close_listen()
+            if self._reconnect_task is None or self._reconnect_task.done():
+                self._reconnect_task = asyncio.create_task(self._relisten())
+            return
+        while self._listen_conn.notifies:
+            notify = self._listen_conn.notifies.pop(0)
+            self._queue.put_nowait((notify.channel[len(CHANNEL_PREFIX):], notify.payload))
+
+
+def create_broker(url: str = PUBSUB_URL) -> Broker:
+    if url.startswith("redis://") or url.startswith("rediss://"):
+        return RedisBroker(url)
+    if url.startswith("postgres://"):
+        url = url.replace("postgres://", "postgresql://", 1)
+    if url.startswith("postgresql://"):
+        return PostgresBroker(url)
+    return InMemoryBroker()
+
+
+broker = create_broker()
@@ -11,29 +11,62 @@ Methods:
     - создатьРекомендацию(рекомендация: int, данные: map<string, any>): Рекомендация
     - предложитьАльтернативы(проект: Проект): list<Рекомендация>
 """
+from sqlalchemy import or_
 from sqlalchemy.orm import Session
-from typing import List, Dict, Any, Optional
-import os
+from typing import List, Dict, Any, Optional, AsyncIterator, Tuple
+import asyncio
+import json
 
 from ..models.recommendation import Recommendation
 from ..models.project import Project
 from ..models.room import Room
 from ..models.model import Model
+from ..models.catalog import Material, Standard
+from .result_cache import ResultCacheService, cache_key
+from .layout_analysis import LayoutAnalyzer
+from .ergonomics_analysis import ErgonomicsAnalyzer
+from .cost_analysis import CostAnalyzer
+from .analytics import AnalyticsService
+from .lighting_analysis import LightingAnalyzer, LIGHTING_STANDARD_CATEGORY, DEFAULT_LIGHTING_NORMS
+from .llm_client import LLMClient, LocalProvider, parse_json_object, llm_client as default_llm_client
+
+RECOMMENDATION_TYPES = ["layout", "material", "style", "optimization"]
+PRIORITIES = {"low", "medium", "high"}
+# Меняются при изменении промптов/алгоритмов анализа - старые записи кэша не используются
+PROMPT_VERSION = "1"
+ANALYSIS_VERSION = "2"
+
+SYSTEM_PROMPT = (
+    "Вы - эксперт по дизайну интерьеров. Отвечайте строго одним JSON-объектом "
+    "на русском языке без пояснений вне JSON."
+)
+
+RECOMMENDATIONS_INSTRUCTIONS = (
+    "Проанализируйте проект и дайте по одной рекомендации каждого типа: "
+    + ", ".join(RECOMMENDATION_TYPES) + ". Формат ответа: "
+    '{"recommendations": [{"type": "...", "text": "...", '
+    '"priority": "low|medium|high", "confidence": 0.0-1.0}]}'
+)
+
+REPORT_SYSTEM_PROMPT = "Вы - эксперт по дизайну интерьеров. Пишите кратко, на русском языке."
+
+REPORT_INSTRUCTIONS = (
+    "По результатам автоматического анализа проекта напишите текстовый отчет "
+    "для клиента: общая оценка, главные проблемы и что сделать в первую очередь."
+)
 
 
 class RecommendationSystem:
     """
     Система генерации рекомендаций с использованием AI/LLM
     
-    ⚠️ ЗАГЛУШКИ для LLM интеграции - пользователь реализует самостоятельно
-    Места для интеграции помечены комментариями: # TODO: LLM Integration
+    Все типы рекомендаций генерируются одним запросом к LLM
+    (провайдер настраивается в services/llm_client.py)
     """
     
-    def __init__(self, db: Session):
+    def __init__(self, db: Session, llm: Optional[LLMClient] = None):
         self.db = db
-        # Получаем API ключи из окружения
-        self.openai_key = os.getenv("OPENAI_API_KEY")
-        self.anthropic_key = os.getenv("ANTHROPIC_API_KEY")
+        self.llm = llm or default_llm_client
     
     def create_recommendation(
         self,
@@ -44,96 +77,99 @@ class RecommendationSystem:
         создатьРекомендацию(рекомендация: int, данные: map<string, any>): Рекомендация
         Создает рекомендацию на основе данных
         """
-        project_id = data.get("project_id")
-        recommendation_type = data.get("type", "general")
-        
-        # TODO: LLM Integration
-        # Здесь должен быть вызов LLM для генерации рекомендаций
-        # Пример:
-        # llm_response = await self._call_llm(project_data, recommendation_type)
-        # text = llm_response["recommendation"]
-        # confidence = llm_response["confidence"]
-        
-        # ЗАГЛУШКА: Генерируем базовую рекомендацию
-        text = self._generate_mock_recommendation(recommendation_type)
-        
-        recommendation = Recommendation(
-            text=text,
-            type=recommendation_type,
-            priority=data.get("priority", "medium"),
-            project_id=project_id,
-            confidence_score=data.get("confidence_score", 0.75),
-            metadata=data.get("metadata", {})
-        )
+        recommendation = self._build_recommendation(data["project_id"], data)
         
         self.db.add(recommendation)
+        self.db.flush()
+        self._record_recommendations(data["project_id"], [recommendation])
         self.db.commit()
         self.db.refresh(recommendation)
         
         return recommendation
     
-    def suggest_alternatives(
+    async def suggest_alternatives(
         self,
         project: Project
     ) -> List[Recommendation]:
         """
         предложитьАльтернативы(проект: Проект): list<Рекомендация>
-        Предлагает альтернативные решения для проекта
+        Предлагает альтернативные решения для проекта - все типы за один запрос к LLM
+        Работа с БД (синхронная сессия) выполняется в потоке, не блокируя цикл событий
         """
-        # Получаем данные проекта
-        rooms = self.db.query(Room).filter(Room.project_id == project.id).all()
-        models = self.db.query(Model).filter(Model.project_id == project.id).all()
-        
-        project_data = {
-            "project_id": project.id,
-            "project_name": project.name,
-            "rooms_count": len(rooms),
-            "total_area": sum(r.area or 0 for r in rooms),
-            "models_count": len(models)
-        }
+        project_id = project.id
+        data = await asyncio.to_thread(self.project_snapshot, project)
+        response = await self._call_llm(data, "recommendations")
+        return await asyncio.to_thread(self._save_recommendations, project_id, response)
+    
+    async def stream_alternatives(self, project: Project) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        Потоковая версия suggest_alternatives
+        События: ("token", фрагмент ответа LLM)..., затем ("result", сохраненные рекомендации)
+        Рекомендации сохраняются только после полного ответа; при закрытии
+        генератора запрос к LLM прерывается и ничего не сохраняется
+        """
+        project_id = project.id  # После commit в _cache_get объект проекта истекает
+        data = await asyncio.to_thread(self.project_snapshot, project)
+        key = self._cache_key(data, "recommendations")
+        cache = ResultCacheService(self.db)
         
-        # TODO: LLM Integration
-        # Здесь должен быть вызов LLM для генерации альтернатив
-        # Пример:
-        # alternatives = await self._call_llm_for_alternatives(project_data)
+        response = await asyncio.to_thread(self._cache_get, cache, key)
+        if response is None:
+            chunks = []
+            async for chunk in self.llm.stream(SYSTEM_PROMPT, self._build_prompt(data, "recommendations")):
+                chunks.append(chunk)
+                yield "token", chunk
+            response = parse_json_object("".join(chunks))
+            await asyncio.to_thread(cache.set, key, "recommendations", response, project_id)
         
-        # ЗАГЛУШКА: Генерируем несколько рекомендаций
-        recommendations = []
-        recommendation_types = ["layout", "material", "style", "optimization"]
+        yield "result", await asyncio.to_thread(self._save_recommendations, project_id, response)
+    
+    async def stream_report(self, analysis_result: Dict[str, Any]) -> AsyncIterator[str]:
+        """Текстовый отчет LLM по результату анализа - поток фрагментов (кэшируется целиком)"""
+        key = self._cache_key(analysis_result, "report")
+        cache = ResultCacheService(self.db)
         
-        for rec_type in recommendation_types:
-            rec = self.create_recommendation(
-                recommendation_id=0,  # будет установлен БД
-                data={
-                    "project_id": project.id,
-                    "type": rec_type,
-                    "priority": "medium",
-                    "confidence_score": 0.8,
-                    "metadata": {"generated_by": "mock_system"}
-                }
-            )
-            recommendations.append(rec)
+        cached = await asyncio.to_thread(self._cache_get, cache, key)
+        if cached is not None:
+            yield cached["report"]
+            return
         
-        return recommendations
+        chunks = []
+        prompt = self._build_prompt(analysis_result, "report")
+        async for chunk in self.llm.stream(REPORT_SYSTEM_PROMPT, prompt, json_output=False):
+            chunks.append(chunk)
+            yield chunk
+        await asyncio.to_thread(
+            cache.set, key, "report", {"report": "".join(chunks)}, analysis_result.get("project_id")
+        )
     
-    def analyze_project_layout(
-        self,
-        project_id: int
-    ) -> Dict[str, Any]:
+    def project_snapshot(self, project: Project, room_ids: Optional[List[int]] = None) -> Dict[str, Any]:
         """
-        Анализирует планировку проекта и дает рекомендации
+        Данные проекта для промпта и ключа кэша: помещения, модели и их материалы
+        Порядок строк фиксирован, чтобы одинаковый проект давал одинаковый снимок
+        room_ids - только эти помещения и их модели (пересчет измененных помещений)
         """
-        project = self.db.query(Project).filter(Project.id == project_id).first()
-        if not project:
-            return None
+        rooms_query = self.db.query(Room).filter(Room.project_id == project.id)
+        if room_ids is not None:
+            rooms_query = rooms_query.filter(Room.id.in_(room_ids))
+        rooms = rooms_query.order_by(Room.id).all()
+        selected_ids = [room.id for room in rooms]
+        models_filter = Model.room_id.in_(selected_ids)
+        if room_ids is None:
+            models_filter = or_(Model.project_id == project.id, models_filter)
+        models = self.db.query(Model).filter(models_filter).order_by(Model.id).all()
+        material_ids = sorted({model.material_id for model in models if model.material_id})
+        materials = self.db.query(Material).filter(
+            Material.id.in_(material_ids)
+        ).order_by(Material.id).all() if material_ids else []
         
-        rooms = self.db.query(Room).filter(Room.project_id == project_id).all()
-        models = self.db.query(Model).filter(Model.project_id == project_id).all()
-        
-        # Собираем данные для анализа
-        analysis_data = {
+        return {
+            "project_id": project.id,
+            "project_name": project.name,
+            "total_area": sum(r.area or 0 for r in rooms),
             "rooms": [
                 {
+                    "id": room.id,
                     "name": room.name,
                     "area": room.area,
                     "dimensions": {
@@ -146,42 +182,212 @@ class RecommendationSystem:
             ],
             "models": [
                 {
+                    "id": model.id,
                     "name": model.name,
                     "type": model.type,
-                    "dimensions": model.dimensions
+                    "category": model.category,
+                    "room_id": model.room_id,
+                    "material_id": model.material_id,
+                    "dimensions": model.dimensions,
+                    "position": model.position,
+                    "rotation": model.rotation,
+                    "scale": model.scale
                 }
                 for model in models
+            ],
+            "materials": [
+                {
+                    "id": material.id,
+                    "name": material.name,
+                    "type": material.type,
+                    "properties": material.properties
+                }
+                for material in materials
             ]
         }
+    
+    def analyze_project(
+        self,
+        project: Project,
+        analysis_type: str = "layout",
+        options: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """
+        Анализ проекта с повторным использованием результатов по помещениям
         
-        # TODO: LLM Integration
-        # Вызов LLM для анализа планировки
-        # analysis_result = await self._call_llm_for_analysis(analysis_data)
+        Результат каждого помещения кэшируется с ключом (помещение, Room.revision,
+        параметры); движок запускается только для помещений, изменившихся с
+        прошлого анализа (services/change_tracking.py), итог проекта
+        собирается из результатов помещений.
+        options - параметры движка анализа (например, resolution для ergonomics)
+        """
+        if analysis_type == "cost":
+            # Цены не входят в снимок проекта; сводный SQL-запрос дешевле кэша
+            return CostAnalyzer(self.db).analyze(project.id)
+        
+        options = dict(options or {})
+        if analysis_type == "lighting":
+            options["norms"] = self._lighting_norms()
+        kind = f"analysis:{analysis_type}"
+        rooms = self.db.query(Room.id, Room.revision, Room.width, Room.length).filter(
+            Room.project_id == project.id
+        ).order_by(Room.id).all()
+        keys = {
+            room.id: cache_key(kind, {
+                "analysis_version": ANALYSIS_VERSION, "options": options,
+                "room_id": room.id, "revision": room.revision
+            })
+            for room in rooms
+        }
+        cache = ResultCacheService(self.db)
+        cached = cache.get_many(list(keys.values()))
+        
+        entries = {room_id: cached[key]["room"] for room_id, key in keys.items() if key in cached}
+        dirty = [room.id for room in rooms if room.id not in entries]
+        meta = next(iter(cached.values()))["meta"] if cached else None
+        if dirty or meta is None:
+            result = self._analysis_engine(analysis_type, options)(
+                self.project_snapshot(project, room_ids=dirty)
+            )
+            meta = {
+                "result": {
+                    key: value for key, value in result.items()
+                    if key not in ("project_id", "total_rooms", "total_area", "analysis")
+                },
+                "analysis": {
+                    key: value for key, value in result["analysis"].items()
+                    if key not in ("score", "issues", "suggestions", "rooms")
+                },
+            }
+            fresh = {entry["room_id"]: entry for entry in result["analysis"]["rooms"]}
+            entries.update(fresh)
+            cache.set_many([
+                {"key": keys[room_id], "kind": kind, "value": {"room": entry, "meta": meta},
+                 "project_id": project.id}
+                for room_id, entry in fresh.items()
+            ])
         
-        # ЗАГЛУШКА: Возвращаем базовый анализ
+        return self._merge_room_results(project.id, rooms, entries, meta)
+    
+    def _analysis_engine(self, analysis_type: str, options: Dict[str, Any]):
+        """Функция анализа снимка проекта для типа анализа"""
+        if analysis_type == "ergonomics":
+            return ErgonomicsAnalyzer(**options).analyze
+        if analysis_type == "lighting":
+            return LightingAnalyzer(**options).analyze
+        return LayoutAnalyzer().analyze
+    
+    @staticmethod
+    def _merge_room_results(
+        project_id: int,
+        rooms: List[Any],
+        entries: Dict[int, Dict[str, Any]],
+        meta: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """Итог проекта из результатов помещений (оценка - средняя, взвешенная по площади)"""
+        room_entries = [entries[room.id] for room in rooms]
+        areas = [(room.width or 0) * (room.length or 0) for room in rooms]
+        total_area = float(sum(areas))
+        if total_area > 0:
+            score = sum(entry["score"] * area for entry, area in zip(room_entries, areas)) / total_area
+        else:
+            score = sum(entry["score"] for entry in room_entries) / len(room_entries) if room_entries else 100.0
         return {
             "project_id": project_id,
             "total_rooms": len(rooms),
-            "total_area": sum(r.area or 0 for r in rooms),
+            "total_area": total_area,
             "analysis": {
-                "score": 85,
-                "issues": [
-                    "Недостаточное освещение в гостиной",
-                    "Узкий коридор - рекомендуется расширение"
-                ],
+                "score": round(score, 1),
+                "issues": [issue for entry in room_entries for issue in entry.get("issues", [])],
                 "suggestions": [
-                    "Добавьте больше источников света",
-                    "Рассмотрите перепланировку коридора"
-                ]
+                    suggestion for entry in room_entries for suggestion in entry.get("suggestions", [])
+                ],
+                "rooms": room_entries,
+                **meta["analysis"],
             },
-            "note": "⚠️ Это заглушка. Интегрируйте LLM для полного анализа."
+            **meta["result"],
         }
     
-    def _generate_mock_recommendation(self, rec_type: str) -> str:
+    def analyze_project_layout(
+        self,
+        project_id: int,
+        snapshot: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """
+        Анализирует планировку проекта и дает рекомендации
+        Геометрический расчет по всем помещениям сразу (services/layout_analysis.py)
+        """
+        if snapshot is None:
+            project = self.db.query(Project).filter(Project.id == project_id).first()
+            if not project:
+                return None
+            snapshot = self.project_snapshot(project)
+        
+        return LayoutAnalyzer().analyze(snapshot)
+    
+    def _lighting_norms(self) -> Dict[str, float]:
         """
-        ЗАГЛУШКА: Генерирует базовые рекомендации
-        TODO: Заменить на реальный вызов LLM
+        Нормы освещенности из стандарта категории lighting (если он есть)
+        Принимаются только положительные числа, иначе - DEFAULT_LIGHTING_NORMS
         """
+        standard = self.db.query(Standard).filter(
+            Standard.category == LIGHTING_STANDARD_CATEGORY
+        ).order_by(Standard.id).first()
+        parameters = (standard.parameters or {}) if standard else {}
+        return {
+            key: float(parameters[key]) for key in DEFAULT_LIGHTING_NORMS
+            if isinstance(parameters.get(key), (int, float)) and not isinstance(parameters[key], bool)
+            and parameters[key] > 0
+        }
+    
+    def _save_recommendations(self, project_id: int, response: Dict[str, Any]) -> List[Recommendation]:
+        """Сохранить рекомендации из ответа LLM одним commit"""
+        recommendations = [
+            self._build_recommendation(project_id, item)
+            for item in self._parse_recommendations(response)
+        ]
+        self.db.add_all(recommendations)
+        self.db.flush()
+        self._record_recommendations(project_id, recommendations)
+        self.db.commit()
+        for recommendation in recommendations:
+            self.db.refresh(recommendation)
+        return recommendations
+    
+    def _record_recommendations(self, project_id: int, recommendations: List[Recommendation]):
+        project = self.db.query(Project).filter(Project.id == project_id).first()
+        AnalyticsService(self.db).on_recommendations(project, recommendations)
+    
+    def _build_recommendation(self, project_id: int, data: Dict[str, Any]) -> Recommendation:
+        recommendation_type = data.get("type", "general")
+        priority = data.get("priority", "medium")
+        extra = data.get("metadata") if isinstance(data.get("metadata"), dict) else {}
+        return Recommendation(
+            text=data.get("text") or self._generate_mock_recommendation(recommendation_type),
+            type=recommendation_type,
+            priority=priority if priority in PRIORITIES else "medium",
+            project_id=project_id,
+            confidence_score=data.get("confidence", data.get("confidence_score", 0.75)),
+            metadata={"generated_by": self.llm.model_name, "prompt_version": PROMPT_VERSION,
+                      **extra}
+        )
+    
+    @staticmethod
+    def _parse_recommendations(response: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Проверить структуру ответа LLM: по одной рекомендации известного типа"""
+        items = {}
+        for item in response.get("recommendations") or []:
+            if not isinstance(item, dict) or not isinstance(item.get("text"), str):
+                continue
+            if item.get("type") in RECOMMENDATION_TYPES and item["type"] not in items:
+                confidence = item.get("confidence")
+                if not isinstance(confidence, (int, float)):
+                    confidence = 0.75
+                items[item["type"]] = {**item, "confidence": min(max(float(confidence), 0.0), 1.0)}
+        return [items[t] for t in RECOMMENDATION_TYPES if t in items]
+    
+    def _generate_mock_recommendation(self, rec_type: str) -> str:
+        """Базовые рекомендации: ответ офлайн-провайдера и запасной текст"""
         mock_recommendations = {
             "layout": "Рассмотрите возможность открытой планировки для увеличения визуального пространства.",
             "material": "Используйте натуральные материалы: дерево и камень для создания уютной атмосферы.",
@@ -190,30 +396,55 @@ class RecommendationSystem:
         }
         return mock_recommendations.get(rec_type, "Общая рекомендация по улучшению дизайна.")
     
+    def _build_prompt(self, data: Dict[str, Any], prompt_type: str) -> str:
+        """Промпт - JSON с инструкцией и данными проекта"""
+        if prompt_type == "report":
+            request = {"task": REPORT_INSTRUCTIONS, "analysis": data}
+            if self.llm.provider.name == LocalProvider.name:
+                analysis = data.get("analysis", {})
+                request["stub"] = " ".join(
+                    [f"Общая оценка проекта: {analysis.get('score')}/100."]
+                    + analysis.get("issues", []) + analysis.get("suggestions", [])
+                )
+            return json.dumps(request, ensure_ascii=False, default=str)
+        
+        request = {"task": RECOMMENDATIONS_INSTRUCTIONS, "project": data}
+        if self.llm.provider.name == LocalProvider.name:
+            # Офлайн-провайдер возвращает поле stub как ответ модели
+            request["stub"] = {
+                "recommendations": [
+                    {"type": t, "text": self._generate_mock_recommendation(t),
+                     "priority": "medium", "confidence": 0.8}
+                    for t in RECOMMENDATION_TYPES
+                ]
+            }
+        return json.dumps(request, ensure_ascii=False, default=str)
+    
     async def _call_llm(self, data: Dict[str, Any], prompt_type: str) -> Dict[str, Any]:
         """
-        TODO: LLM Integration
-        Метод для вызова LLM API (OpenAI, Anthropic, и т.д.)
-        
-        Пример реализации с OpenAI:
-        
-        import openai
-        openai.api_key = self.openai_key
-        
-        response = await openai.ChatCompletion.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": "Вы - эксперт по дизайну интерьеров"},
-                {"role": "user", "content": f"Проанализируйте: {data}"}
-            ]
-        )
+        Вызов LLM: один запрос, ответ - JSON-объект (LLMError при неудаче)
+        Повторный запрос с теми же данными, промптом и моделью берется из кэша
+        """
+        key = self._cache_key(data, prompt_type)
+        cache = ResultCacheService(self.db)
+        cached = await asyncio.to_thread(self._cache_get, cache, key)
+        if cached is not None:
+            return cached
         
-        return {
-            "recommendation": response.choices[0].message.content,
-            "confidence": 0.9
-        }
+        response = await self.llm.complete_json(SYSTEM_PROMPT, self._build_prompt(data, prompt_type))
+        await asyncio.to_thread(cache.set, key, prompt_type, response, data.get("project_id"))
+        return response
+    
+    def _cache_get(self, cache: ResultCacheService, key: str) -> Optional[Any]:
         """
-        raise NotImplementedError(
-            "⚠️ LLM интеграция не реализована. "
-            "Добавьте свой API ключ и реализуйте этот метод."
-        )
+        Чтение кэша перед запросом к LLM с commit: счетчик обращений (и прочие
+        изменения сессии) фиксируются, и транзакция не остается открытой на время ответа LLM
+        """
+        value = cache.get(key)
+        self.db.commit()
+        return value
+    
+    def _cache_key(self, data: Dict[str, Any], prompt_type: str) -> str:
+        return cache_key(prompt_type, {
+            "prompt_version": PROMPT_VERSION, "model": self.llm.model_name, "data": data
+        })
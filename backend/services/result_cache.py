@@ -0,0 +1,161 @@
+"""
+Кэш результатов LLM и анализа, адресуемый содержимым
+
+Ключ - SHA-256 канонического JSON (сортированные ключи, без пробелов)
+снимка проекта вместе с типом запроса, версией промпта и моделью.
+Любое изменение помещений, моделей или материалов дает новый ключ,
+поэтому явная инвалидация не нужна - устаревшие записи вытесняются
+по TTL (RESULT_CACHE_TTL_HOURS) и по размеру (RESULT_CACHE_MAX_ENTRIES,
+вытесняются давно не использованные).
+
+Вытеснение (с COUNT по таблице) выполняется не при каждой записи, а после
+каждых RESULT_CACHE_EVICT_EVERY записанных значений в процессе, поэтому
+между проходами размер кэша может ненадолго превышать лимит.
+"""
+from sqlalchemy import update, delete, func
+from sqlalchemy.orm import Session
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional
+import hashlib
+import json
+import os
+
+from ..database import upsert
+from ..models.analysis import ResultCache
+
+RESULT_CACHE_TTL_HOURS = int(os.getenv("RESULT_CACHE_TTL_HOURS", "168"))
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "10000"))
+RESULT_CACHE_EVICT_EVERY = int(os.getenv("RESULT_CACHE_EVICT_EVERY", "100"))
+
+_writes_since_evict = 0
+
+
+def cache_key(kind: str, payload: Dict[str, Any]) -> str:
+    """Канонический хэш запроса: одинаковые данные дают одинаковый ключ"""
+    canonical = json.dumps(
+        {"kind": kind, "payload": payload},
+        sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ResultCacheService:
+    """
+    Чтение и запись кэша (без commit - фиксирует вызывающий код)
+    get/get_many тоже пишут (счетчик обращений), поэтому вызывающий код
+    должен сделать commit сразу после работы с кэшем, а не держать
+    транзакцию открытой на время долгих операций (запрос к LLM, поток SSE)
+    """
+
+    def __init__(
+        self,
+        db: Session,
+        ttl_hours: int = RESULT_CACHE_TTL_HOURS,
+        max_entries: int = RESULT_CACHE_MAX_ENTRIES
+    ):
+        self.db = db
+        self.ttl = timedelta(hours=ttl_hours)
+        self.max_entries = max_entries
+
+    def get(self, key: str) -> Optional[Any]:
+        now = datetime.utcnow()
+        row = self.db.query(ResultCache.value).filter(
+            ResultCache.key == key,
+            ResultCache.expires_at > now
+        ).first()
+        if row is None:
+            return None
+
+        self.db.execute(
+            update(ResultCache)
+            .where(ResultCache.key == key)
+            .values(hits=ResultCache.hits + 1, last_used_at=now)
+        )
+        return row.value
+
+    def get_many(self, keys: List[str]) -> Dict[str, Any]:
+        """Несколько записей одним запросом: {ключ: значение} для найденных"""
+        if not keys:
+            return {}
+        now = datetime.utcnow()
+        rows = self.db.query(ResultCache.key, ResultCache.value).filter(
+            ResultCache.key.in_(keys),
+            ResultCache.expires_at > now
+        ).all()
+        found = {row.key: row.value for row in rows}
+        if found:
+            self.db.execute(
+                update(ResultCache)
+                .where(ResultCache.key.in_(list(found)))
+                .values(hits=ResultCache.hits + 1, last_used_at=now),
+                execution_options={"synchronize_session": False}
+            )
+        return found
+
+    def set(self, key: str, kind: str, value: Any, project_id: Optional[int] = None):
+        now = datetime.utcnow()
+        statement = upsert(self.db, ResultCache).values(
+            key=key, kind=kind, project_id=project_id, value=value, hits=0,
+            created_at=now, expires_at=now + self.ttl, last_used_at=now
+        )
+        statement = statement.on_conflict_do_update(
+            index_elements=["key"],
+            set_={
+                "value": statement.excluded.value,
+                "created_at": now,
+                "expires_at": statement.excluded.expires_at,
+                "last_used_at": now,
+            }
+        )
+        self.db.execute(statement)
+        self._after_write(1)
+
+    def set_many(self, items: List[Dict[str, Any]]):
+        """Записать несколько значений (key, kind, value, project_id) одним запросом"""
+        if not items:
+            return
+        now = datetime.utcnow()
+        statement = upsert(self.db, ResultCache)
+        statement = statement.on_conflict_do_update(
+            index_elements=["key"],
+            set_={
+                "value": statement.excluded.value,
+                "created_at": now,
+                "expires_at": statement.excluded.expires_at,
+                "last_used_at": now,
+            }
+        )
+        self.db.execute(statement, [
+            {
+                "key": item["key"], "kind": item["kind"], "project_id": item.get("project_id"),
+                "value": item["value"], "hits": 0,
+                "created_at": now, "expires_at": now + self.ttl, "last_used_at": now,
+            }
+            for item in items
+        ])
+        self._after_write(len(items))
+
+    def _after_write(self, written: int):
+        """Запустить вытеснение, если с прошлого прохода записано достаточно значений"""
+        global _writes_since_evict
+        _writes_since_evict += written
+        if _writes_since_evict >= RESULT_CACHE_EVICT_EVERY:
+            _writes_since_evict = 0
+            self.evict()
+
+    def evict(self) -> int:
+        """Удалить просроченные записи и самые давно использованные сверх лимита"""
+        removed = self.db.execute(
+            delete(ResultCache).where(ResultCache.expires_at <= datetime.utcnow())
+        ).rowcount
+
+        excess = self.db.query(func.count(ResultCache.key)).scalar() - self.max_entries
+        if excess > 0:
+            oldest = self.db.query(ResultCache.key).order_by(
+                ResultCache.last_used_at
+            ).limit(excess).subquery()
+            removed += self.db.execute(
+                delete(ResultCache).where(ResultCache.key.in_(oldest.select())),
+                execution_options={"synchronize_session": False}
+            ).rowcount
+        return removed
@@ -0,0 +1,180 @@
+"""
+Синхронизация 3D сцены проекта в реальном времени
+
+Клиенты подписываются на канал проекта через WebSocket. Изменения комнат
+и моделей публикуются как дельты (только изменившиеся поля) и
+накапливаются до следующего такта: частые обновления позиции одного
+объекта схлопываются в одно сообщение. Рассылка идет с фиксированной
+частотой SCENE_SYNC_TICK_RATE (Гц).
+
+Накопленные дельты публикуются в брокер (services.pubsub), поэтому
+подписчики получают изменения независимо от того, какой воркер обработал
+запрос. Сообщения кодируются в JSON, либо в msgpack, если клиент
+запросил его и пакет msgpack установлен.
+"""
+from fastapi import WebSocket
+from typing import Dict, Any, Optional, Tuple
+import asyncio
+import json
+import logging
+import os
+import threading
+
+try:
+    import msgpack
+except ImportError:  # msgpack - необязательная зависимость
+    msgpack = None
+
+from .pubsub import Broker, broker as default_broker
+from .connections import ClientConnection
+
+logger = logging.getLogger(__name__)
+
+SCENE_SYNC_TICK_RATE = float(os.getenv("SCENE_SYNC_TICK_RATE", "20"))
+SCENE_CHANNEL = "scene"
+
+# Поля, которые клиенты могут транслировать напрямую во время перетаскивания
+LIVE_TRANSFORM_FIELDS = ("position", "rotation", "scale")
+
+
+def entity_fields(entity: Any) -> Dict[str, Any]:
+    """Все колонки ORM-объекта в виде словаря"""
+    return {column.name: getattr(entity, column.name) for column in entity.__table__.columns}
+
+
+def changed_fields(entity: Any, patch: Dict[str, Any]) -> Dict[str, Any]:
+    """Оставляет из patch только поля, значение которых отличается от текущего"""
+    return {key: value for key, value in patch.items() if getattr(entity, key) != value}
+
+
+class SceneHub:
+    """Каналы сцены по проектам с пакетной рассылкой дельт"""
+
+    def __init__(self, broker: Broker = default_broker, tick_rate: float = SCENE_SYNC_TICK_RATE):
+        self.broker = broker
+        self.broker.add_listener(SCENE_CHANNEL, self._deliver_local)
+        self.tick_interval = 1.0 / tick_rate
+        # project_id -> {соединение: encoding}
+        self.subscribers: Dict[int, Dict[ClientConnection, str]] = {}
+        # project_id -> {(entity, entity_id): поля или None для удаления}
+        self._pending: Dict[int, Dict[Tuple[str, int], Optional[Dict[str, Any]]]] = {}
+        # publish вызывается из синхронных обработчиков в пуле потоков
+        self._lock = threading.Lock()
+        self._flush_task: Optional[asyncio.Task] = None
+
+    async def subscribe(
+        self,
+        websocket: WebSocket,
+        project_id: int,
+        encoding: str = "json"
+    ) -> ClientConnection:
+        """Подписать принятое WebSocket соединение на канал проекта"""
+        if encoding == "msgpack" and msgpack is None:
+            encoding = "json"
+        connection = ClientConnection(
+            websocket, on_close=lambda closed: self._remove(closed, project_id)
+        )
+        self.subscribers.setdefault(project_id, {})[connection] = encoding
+        return connection
+
+    async def start(self):
+        """Запустить периодическую рассылку (вызывается при старте приложения)"""
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        if self._flush_task:
+            self._flush_task.cancel()
+            self._flush_task = None
+
+    def unsubscribe(self, connection: ClientConnection, project_id: int):
+        connection.close()
+        self._remove(connection, project_id)
+
+    def _remove(self, connection: ClientConnection, project_id: int):
+        connections = self.subscribers.get(project_id)
+        if connections is None:
+            return
+        connections.pop(connection, None)
+        if not connections:
+            del self.subscribers[project_id]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "scene_projects": len(self.subscribers),
+            "scene_connections": sum(len(c) for c in self.subscribers.values()),
+        }
+
+    def publish(
+        self,
+        project_id: Optional[int],
+        entity: str,
+        entity_id: int,
+        fields: Optional[Dict[str, Any]]
+    ):
+        """
+        Поставить дельту в очередь рассылки
+        fields=None означает удаление объекта
+        """
+        if project_id is None:
+            return
+        # Без внешнего брокера подписчики могут быть только в этом процессе
+        if self.broker.is_local and project_id not in self.subscribers:
+            return
+        if fields is not None and not fields:
+            return
+
+        key = (entity, entity_id)
+        with self._lock:
+            project_pending = self._pending.setdefault(project_id, {})
+            if fields is None:
+                project_pending[key] = None
+            elif project_pending.get(key, {}) is not None:
+                project_pending.setdefault(key, {}).update(fields)
+
+    async def flush(self):
+        """Опубликовать накопленные дельты в брокер"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+
+        for project_id, deltas in pending.items():
+            await self.broker.publish(SCENE_CHANNEL, {
+                "type": "scene_delta",
+                "project_id": project_id,
+                "changes": [
+                    {"entity": entity, "id": entity_id, "deleted": True}
+                    if fields is None else
+                    {"entity": entity, "id": entity_id, "fields": fields}
+                    for (entity, entity_id), fields in deltas.items()
+                ]
+            })
+
+    async def _deliver_local(self, message: Dict[str, Any]):
+        """Доставить дельту подписчикам, подключенным к этому процессу"""
+        project_id = message["project_id"]
+        connections = self.subscribers.get(project_id)
+        if not connections:
+            return
+
+        encoded: Dict[str, Any] = {}
+        for connection, encoding in list(connections.items()):
+            if encoding not in encoded:
+                encoded[encoding] = self._encode(message, encoding)
+            connection.send(encoded[encoding])
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.tick_interval)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Ошибка рассылки дельт сцены")
+
+    @staticmethod
+    def _encode(message: Dict[str, Any], encoding: str):
+        if encoding == "msgpack":
+            return msgpack.packb(message, use_bin_type=True)
+        return json.dumps(message, ensure_ascii=False)
+
+
+scene_hub = SceneHub()
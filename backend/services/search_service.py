@@ -0,0 +1,179 @@
+"""
+Полнотекстовый поиск по сообщениям чата и комментариям проектов
+
+- PostgreSQL: GIN индексы по to_tsvector('russian', ...), ts_rank и ts_headline
+- SQLite: виртуальные таблицы FTS5, синхронизируемые триггерами
+
+Последнее слово запроса ищется по префиксу, чтобы поиск работал при вводе.
+Архивные сообщения (chat_messages_archive) не индексируются.
+
+Фрагменты (snippet) - экранированный HTML: СУБД выделяет совпадения
+служебными символами, которые заменяются на теги после экранирования текста.
+"""
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from typing import List, Dict, Any, Optional
+import html
+import re
+
+HIGHLIGHT_START = "<b>"
+HIGHLIGHT_END = "</b>"
+# Маркеры совпадений в выдаче СУБД (символы области частного использования Unicode)
+MARK_START = "\ue000"
+MARK_END = "\ue001"
+
+POSTGRES_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS ix_chat_messages_fts "
+    "ON chat_messages USING GIN (to_tsvector('russian', message))",
+    "CREATE INDEX IF NOT EXISTS ix_comments_fts "
+    "ON comments USING GIN (to_tsvector('russian', text))",
+]
+
+# Внешние FTS5 таблицы поверх исходных (content=...), триггеры держат их в актуальном состоянии
+SQLITE_FTS_TABLES = {
+    "chat_messages_fts": ("chat_messages", "message"),
+    "comments_fts": ("comments", "text"),
+}
+
+
+def ensure_search_indexes(engine: Engine):
+    """Создать поисковые индексы для текущей БД (вызывается при старте)"""
+    with engine.begin() as conn:
+        if engine.dialect.name == "postgresql":
+            for statement in POSTGRES_INDEXES:
+                conn.execute(text(statement))
+            return
+
+        if engine.dialect.name != "sqlite":
+            return
+
+        for fts_table, (table, column) in SQLITE_FTS_TABLES.items():
+            exists = conn.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                {"name": fts_table}
+            ).first()
+            if exists:
+                continue
+
+            conn.execute(text(
+                f"CREATE VIRTUAL TABLE {fts_table} USING fts5("
+                f"{column}, content='{table}', content_rowid='id', tokenize='unicode61')"
+            ))
+            conn.execute(text(
+                f"CREATE TRIGGER {fts_table}_ai AFTER INSERT ON {table} BEGIN "
+                f"INSERT INTO {fts_table}(rowid, {column}) VALUES (new.id, new.{column}); END"
+            ))
+            conn.execute(text(
+                f"CREATE TRIGGER {fts_table}_ad AFTER DELETE ON {table} BEGIN "
+                f"INSERT INTO {fts_table}({fts_table}, rowid, {column}) "
+                f"VALUES ('delete', old.id, old.{column}); END"
+            ))
+            conn.execute(text(
+                f"CREATE TRIGGER {fts_table}_au AFTER UPDATE OF {column} ON {table} BEGIN "
+                f"INSERT INTO {fts_table}({fts_table}, rowid, {column}) "
+                f"VALUES ('delete', old.id, old.{column}); "
+                f"INSERT INTO {fts_table}(rowid, {column}) VALUES (new.id, new.{column}); END"
+            ))
+            # Индексация уже существующих строк
+            conn.execute(text(f"INSERT INTO {fts_table}({fts_table}) VALUES ('rebuild')"))
+
+
+def highlight(snippet: Optional[str]) -> Optional[str]:
+    """Экранировать текст фрагмента и заменить маркеры совпадений тегами выделения"""
+    if snippet is None:
+        return None
+    return html.escape(snippet).replace(MARK_START, HIGHLIGHT_START).replace(MARK_END, HIGHLIGHT_END)
+
+
+class SearchService:
+    """Поиск по сообщениям и комментариям с учетом прав пользователя"""
+
+    def __init__(self, db: Session):
+        self.db = db
+        self.dialect = db.get_bind().dialect.name
+
+    def search(
+        self,
+        query: str,
+        user_id: int,
+        see_all_projects: bool,
+        skip: int = 0,
+        limit: int = 20
+    ) -> List[Dict[str, Any]]:
+        """
+        Найти сообщения пользователя и комментарии доступных ему проектов
+        Результаты отсортированы по релевантности
+        """
+        terms = re.findall(r"\w+", query.lower())
+        if not terms:
+            return []
+
+        params = {"user_id": user_id, "see_all": see_all_projects, "top": skip + limit}
+        if self.dialect == "postgresql":
+            params["q"] = " & ".join(terms[:-1] + [f"{terms[-1]}:*"])
+            statements = self._postgres_statements()
+        else:
+            params["q"] = " ".join(f'"{term}"' for term in terms[:-1]) + f' "{terms[-1]}"*'
+            statements = self._sqlite_statements()
+
+        results: List[Dict[str, Any]] = []
+        for result_type, statement in statements:
+            for row in self.db.execute(text(statement), params).mappings():
+                results.append({"type": result_type, **row, "snippet": highlight(row["snippet"])})
+
+        results.sort(key=lambda r: r["rank"], reverse=True)
+        return results[skip:skip + limit]
+
+    @staticmethod
+    def _access_filter(alias: str) -> str:
+        return (
+            f"(:see_all OR EXISTS (SELECT 1 FROM projects p WHERE p.id = {alias}.project_id "
+            f"AND (p.user_id = :user_id OR p.designer_id = :user_id)))"
+        )
+
+    def _postgres_statements(self):
+        headline = (
+            f"'StartSel={MARK_START}, StopSel={MARK_END}, MaxWords=20, MinWords=5'"
+        )
+        messages = f"""
+            SELECT m.id, m.project_id, m.created_at,
+                   ts_headline('russian', m.message, q, {headline}) AS snippet,
+                   ts_rank(to_tsvector('russian', m.message), q) AS rank
+            FROM chat_messages m, to_tsquery('russian', :q) q
+            WHERE to_tsvector('russian', m.message) @@ q
+              AND (m.sender_id = :user_id OR m.recipient_id = :user_id)
+            ORDER BY rank DESC LIMIT :top
+        """
+        comments = f"""
+            SELECT c.id, c.project_id, c.created_at,
+                   ts_headline('russian', c.text, q, {headline}) AS snippet,
+                   ts_rank(to_tsvector('russian', c.text), q) AS rank
+            FROM comments c, to_tsquery('russian', :q) q
+            WHERE to_tsvector('russian', c.text) @@ q
+              AND {self._access_filter("c")}
+            ORDER BY rank DESC LIMIT :top
+        """
+        return [("message", messages), ("comment", comments)]
+
+    def _sqlite_statements(self):
+        # bm25 возвращает меньшие значения для более релевантных строк
+        messages = f"""
+            SELECT m.id, m.project_id, m.created_at,
+                   snippet(chat_messages_fts, 0, '{MARK_START}', '{MARK_END}', '…', 12) AS snippet,
+                   -bm25(chat_messages_fts) AS rank
+            FROM chat_messages_fts JOIN chat_messages m ON m.id = chat_messages_fts.rowid
+            WHERE chat_messages_fts MATCH :q
+              AND (m.sender_id = :user_id OR m.recipient_id = :user_id)
+            ORDER BY rank DESC LIMIT :top
+        """
+        comments = f"""
+            SELECT c.id, c.project_id, c.created_at,
+                   snippet(comments_fts, 0, '{MARK_START}', '{MARK_END}', '…', 12) AS snippet,
+                   -bm25(comments_fts) AS rank
+            FROM comments_fts JOIN comments c ON c.id = comments_fts.rowid
+            WHERE comments_fts MATCH :q
+              AND {self._access_filter("c")}
+            ORDER BY rank DESC LIMIT :top
+        """
+        return [("message", messages), ("comment", comments)]
@@ -0,0 +1,287 @@
+"""
+Правила валидации, задаваемые данными (Standard.parameters)
+
+Правило - декларативное требование к полю помещения, модели или проекта:
+    {
+        "code": "room.min_height",          # Стабильный код проблемы
+        "target": "room",                   # room | model | project
+        "field": "height",
+        "op": ">=",                         # >=, >, <=, <, ==, !=, exists
+        "value": 2.5,                       # или "ref": "room_width" - другое поле
+        "where": {"type": "furniture", "height": {">=": 2.5}},  # Условия применимости
+        "unless": "room.min_height",        # Не проверять, если сработало (более раннее) правило
+        "severity": "error",                # error | warning
+        "param": "min_ceiling_height",      # Имя параметра стандарта для порога
+        "message": "Комната {name}: высота {height}м меньше {value}м"
+    }
+Нарушение - строка, для которой поле известно и требование не выполнено
+(для exists - поле отсутствует). В message доступны поля строки и value.
+
+Источники правил:
+- DEFAULT_RULES - базовые нормы; порог заменяется числовым параметром
+  стандарта с именем из "param" (например, {"min_ceiling_height": 2.4})
+- standards.parameters["rules"] - дополнительные правила; правило с тем же
+  code заменяет базовое
+
+Правила компилируются в функции над массивами NumPy один раз и кэшируются
+до изменения стандартов (отпечаток: число, max(id), max(updated_at));
+проверка выполняется сразу для всех строк одного типа.
+"""
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from typing import Dict, Any, List, Optional, Callable, Iterable
+import logging
+import operator
+import threading
+import numpy as np
+
+from ..models.catalog import Standard
+
+logger = logging.getLogger(__name__)
+
+TARGETS = ("room", "model", "project")
+SEVERITIES = ("error", "warning")
+OPERATORS: Dict[str, Callable] = {
+    ">=": operator.ge,
+    ">": operator.gt,
+    "<=": operator.le,
+    "<": operator.lt,
+    "==": operator.eq,
+    "!=": operator.ne,
+}
+
+DEFAULT_RULES: List[Dict[str, Any]] = [
+    # Помещения (СНиП)
+    {"code": "room.min_height", "target": "room", "field": "height", "op": ">=", "value": 2.5,
+     "param": "min_ceiling_height", "severity": "error",
+     "message": "Комната {name}: высота потолка {height}м меньше минимальной ({value}м)"},
+    {"code": "room.recommended_height", "target": "room", "field": "height", "op": ">=", "value": 2.7,
+     "param": "recommended_ceiling_height", "severity": "warning", "unless": "room.min_height",
+     "message": "Комната {name}: рекомендуется высота потолка не менее {value}м"},
+    {"code": "room.min_area", "target": "room", "field": "area", "op": ">=", "value": 8,
+     "param": "min_room_area", "severity": "warning", "where": {"area": {">": 0}},
+     "message": "Комната {name}: площадь {area}м² меньше рекомендуемой для жилых помещений"},
+    {"code": "room.proportions", "target": "room", "field": "ratio", "op": "<=", "value": 3,
+     "param": "max_room_ratio", "severity": "warning",
+     "message": "Комната {name}: неоптимальные пропорции (соотношение {ratio:.1f}:1)"},
+    # Модели
+    {"code": "model.dimensions_missing", "target": "model", "field": "max_dimension", "op": "exists",
+     "severity": "warning", "message": "Модель {name}: отсутствуют размеры"},
+    {"code": "model.width_positive", "target": "model", "field": "width", "op": ">", "value": 0,
+     "severity": "error", "message": "Недопустимый размер width: {width}"},
+    {"code": "model.height_positive", "target": "model", "field": "height", "op": ">", "value": 0,
+     "severity": "error", "message": "Недопустимый размер height: {height}"},
+    {"code": "model.depth_positive", "target": "model", "field": "depth", "op": ">", "value": 0,
+     "severity": "error", "message": "Недопустимый размер depth: {depth}"},
+    {"code": "model.furniture_max_size", "target": "model", "field": "max_dimension", "op": "<=", "value": 5,
+     "param": "max_furniture_size", "severity": "warning", "where": {"type": "furniture"},
+     "message": "Необычно большой размер мебели: {max_dimension}м"},
+    {"code": "model.position_x_min", "target": "model", "field": "x", "op": ">=", "value": 0,
+     "where": {"room_width": {">": 0}}, "severity": "error",
+     "message": "Модель {name} выходит за границы комнаты по X"},
+    {"code": "model.position_x_max", "target": "model", "field": "x", "op": "<=", "ref": "room_width",
+     "severity": "error", "message": "Модель {name} выходит за границы комнаты по X"},
+    {"code": "model.position_z_min", "target": "model", "field": "z", "op": ">=", "value": 0,
+     "where": {"room_length": {">": 0}}, "severity": "error",
+     "message": "Модель {name} выходит за границы комнаты по Z"},
+    {"code": "model.position_z_max", "target": "model", "field": "z", "op": "<=", "ref": "room_length",
+     "severity": "error", "message": "Модель {name} выходит за границы комнаты по Z"},
+    {"code": "model.material_standard", "target": "model", "field": "has_material_standard",
+     "op": "==", "value": 1, "severity": "error",
+     "message": "Для материала ID {material_id} не найдены стандарты"},
+    # Проект
+    {"code": "project.min_total_area", "target": "project", "field": "total_area", "op": ">=", "value": 20,
+     "param": "min_apartment_area", "severity": "warning",
+     "message": "Общая площадь проекта ({total_area}м²) меньше минимальной для квартиры"},
+]
+
+
+class Columns:
+    """Столбцы набора строк как массивы (числа - float с NaN для отсутствующих)"""
+
+    def __init__(self, rows: List[Dict[str, Any]]):
+        self.rows = rows
+        self._cache: Dict[str, np.ndarray] = {}
+
+    def number(self, field: str) -> np.ndarray:
+        if field not in self._cache:
+            self._cache[field] = np.array([
+                float(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else np.nan
+                for value in (row.get(field) for row in self.rows)
+            ], dtype=float)
+        return self._cache[field]
+
+    def text(self, field: str) -> np.ndarray:
+        key = f"text:{field}"
+        if key not in self._cache:
+            self._cache[key] = np.array([row.get(field) for row in self.rows], dtype=object)
+        return self._cache[key]
+
+
+class Rule:
+    """Скомпилированное правило: violations(columns) -> маска нарушений"""
+
+    def __init__(self, spec: Dict[str, Any], standard: Optional[str] = None):
+        self.code = str(spec["code"])
+        self.target = spec["target"]
+        self.severity = spec.get("severity", "error")
+        self.message = spec.get("message") or f"Нарушено правило {self.code}"
+        self.value = spec.get("value")
+        self.standard = standard
+        unless = spec.get("unless") or []
+        self.unless = [unless] if isinstance(unless, str) else list(unless)
+        if self.target not in TARGETS:
+            raise ValueError(f"неизвестный target: {self.target}")
+        if self.severity not in SEVERITIES:
+            raise ValueError(f"неизвестный severity: {self.severity}")
+        self._check = self._compile_check(spec["field"], spec["op"], self.value, spec.get("ref"))
+        self._where = [self._compile_condition(field, condition)
+                       for field, condition in (spec.get("where") or {}).items()]
+
+    @staticmethod
+    def _compile_check(field: str, op: str, value: Any, ref: Optional[str]):
+        if op == "exists":
+            return lambda columns: np.isnan(columns.number(field))
+        compare = OPERATORS[op]
+        if ref is None and not isinstance(value, (int, float)):
+            raise ValueError("для сравнения нужен числовой value или ref")
+
+        def check(columns: Columns) -> np.ndarray:
+            values = columns.number(field)
+            limit = columns.number(ref) if ref else value
+            with np.errstate(invalid="ignore"):
+                known = ~np.isnan(values) & ~np.isnan(limit)
+                return known & ~compare(values, limit)
+        return check
+
+    @staticmethod
+    def _compile_condition(field: str, condition: Any):
+        if isinstance(condition, dict):
+            checks = [(OPERATORS[op], limit) for op, limit in condition.items()]
+            if not all(isinstance(limit, (int, float)) and not isinstance(limit, bool) for _, limit in checks):
+                raise ValueError(f"условие {field}: для сравнения нужен числовой порог")
+
+            def matches(columns: Columns) -> np.ndarray:
+                values = columns.number(field)
+                with np.errstate(invalid="ignore"):
+                    result = ~np.isnan(values)
+                    for compare, limit in checks:
+                        result &= compare(values, limit)
+                return result
+            return matches
+        if isinstance(condition, str):
+            return lambda columns: columns.text(field) == condition
+        if isinstance(condition, (int, float)) and not isinstance(condition, bool):
+            return lambda columns: columns.number(field) == condition
+        raise ValueError(f"условие {field}: ожидается число, строка или словарь операторов")
+
+    def violations(self, columns: Columns) -> np.ndarray:
+        mask = self._check(columns)
+        for condition in self._where:
+            mask = mask & condition(columns)
+        return mask
+
+    def issue(self, row: Dict[str, Any], entity_type: str) -> Dict[str, Any]:
+        try:
+            message = self.message.format(**{**row, "value": self.value})
+        except (KeyError, ValueError, IndexError):
+            message = self.message
+        return {
+            "code": self.code,
+            "severity": self.severity,
+            "entity_type": entity_type,
+            "entity_id": row.get("id"),
+            "message": message,
+            "standard": self.standard,
+        }
+
+
+class RuleSet:
+    """Набор скомпилированных правил по типам проверяемых объектов"""
+
+    def __init__(self, rules: Iterable[Rule], material_ids: Iterable[int], version: str):
+        self.rules: Dict[str, List[Rule]] = {target: [] for target in TARGETS}
+        for rule in rules:
+            self.rules[rule.target].append(rule)
+        self.material_ids = set(material_ids)  # Материалы, для которых есть стандарты
+        self.version = version
+
+    def evaluate(self, target: str, rows: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+        """Проблемы каждой строки (в порядке правил) - все строки за один проход по правилам"""
+        issues: List[List[Dict[str, Any]]] = [[] for _ in rows]
+        if not rows:
+            return issues
+        columns = Columns(rows)
+        fired: Dict[str, np.ndarray] = {}
+        for rule in self.rules[target]:
+            try:
+                mask = np.broadcast_to(np.asarray(rule.violations(columns), dtype=bool), (len(rows),))
+            except Exception as e:
+                # Ошибочное правило не должно ломать проверку остальных
+                logger.warning("Правило %s не применено: %s", rule.code, e)
+                continue
+            for code in rule.unless:
+                if code in fired:
+                    mask = mask & ~fired[code]
+            fired[rule.code] = mask
+            for index in np.flatnonzero(mask):
+                issues[index].append(rule.issue(rows[index], target))
+        return issues
+
+
+def compile_rules(standards: Iterable[Standard], version: str = "") -> RuleSet:
+    """Собрать набор правил: базовые нормы с порогами из стандартов + правила стандартов"""
+    standards = list(standards)
+    specs: Dict[str, Dict[str, Any]] = {}
+    sources: Dict[str, Optional[str]] = {}
+    for spec in DEFAULT_RULES:
+        specs[spec["code"]] = dict(spec)
+        sources[spec["code"]] = None
+
+    for standard in standards:
+        parameters = standard.parameters if isinstance(standard.parameters, dict) else {}
+        for spec in specs.values():
+            value = parameters.get(spec.get("param"))
+            if spec.get("param") and isinstance(value, (int, float)) and not isinstance(value, bool):
+                spec["value"] = value
+                sources[spec["code"]] = standard.code
+        for spec in parameters.get("rules") or []:
+            if isinstance(spec, dict) and spec.get("code"):
+                specs[str(spec["code"])] = spec
+                sources[str(spec["code"])] = standard.code
+
+    rules = []
+    for code, spec in specs.items():
+        try:
+            rules.append(Rule(spec, sources[code]))
+        except (KeyError, ValueError, TypeError) as e:
+            logger.warning("Правило %s стандарта %s пропущено: %s", code, sources[code], e)
+    material_ids = {standard.material_id for standard in standards if standard.material_id}
+    return RuleSet(rules, material_ids, version)
+
+
+_cache_lock = threading.Lock()
+_cached_rule_set: Optional[RuleSet] = None
+
+
+def get_rule_set(db: Session) -> RuleSet:
+    """Набор правил из кэша процесса; перекомпилируется, если стандарты изменились"""
+    global _cached_rule_set
+    count, max_id, max_updated = db.query(
+        func.count(Standard.id), func.max(Standard.id), func.max(Standard.updated_at)
+    ).one()
+    version = f"{count}:{max_id}:{max_updated}"
+    rule_set = _cached_rule_set
+    if rule_set is not None and rule_set.version == version:
+        return rule_set
+    with _cache_lock:
+        if _cached_rule_set is None or _cached_rule_set.version != version:
+            _cached_rule_set = compile_rules(db.query(Standard).order_by(Standard.id).all(), version)
+        return _cached_rule_set
+
+
+def invalidate_rule_set():
+    """Сбросить кэш правил процесса (после изменения стандартов)"""
+    global _cached_rule_set
+    with _cache_lock:
+        _cached_rule_set = None
@@ -0,0 +1,162 @@
+"""
+Сохраненные результаты валидации проекта
+
+После проверки проекта проблемы сохраняются по объектам со стабильными
+кодами правил (ValidationIssue), а проверенные помещения - с ревизией
+и версией правил (ValidationScope). Это дает:
+- разницу с прошлой проверкой: новые и устраненные проблемы
+  (ключ проблемы - тип и id объекта + код правила, текст не учитывается)
+- текущие проблемы без повторной проверки; проблемы помещений, изменившихся
+  после проверки (Room.revision) или проверенных по другим правилам,
+  не отдаются, а помещения возвращаются в stale_rooms
+
+Модели без помещения и проверка проекта в целом (область room_id = 0)
+ревизии не имеют и обновляются только следующей проверкой проекта.
+"""
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+from datetime import datetime
+from typing import Dict, Any, List, Tuple
+
+from ..models.model import Model
+from ..models.room import Room
+from ..models.validation import ValidationScope, ValidationIssue
+from .validation_rules import get_rule_set
+
+IssueKey = Tuple[str, int, str]
+
+
+def _key(entity_type: str, entity_id: int, code: str) -> IssueKey:
+    return (entity_type, entity_id, code)
+
+
+def issue_dict(row: ValidationIssue) -> Dict[str, Any]:
+    """Проблема в формате ValidationResult.issues"""
+    return {
+        "code": row.code,
+        "severity": row.severity,
+        "entity_type": row.entity_type,
+        "entity_id": row.entity_id,
+        "message": row.message,
+        "standard": row.standard,
+    }
+
+
+class ValidationStore:
+    """Текущие проблемы проектов и разница между проверками (без commit)"""
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def save(self, project_id: int, issues: List[Dict[str, Any]], rules_version: str) -> Dict[str, Any]:
+        """
+        Заменить сохраненные проблемы проекта результатом полной проверки
+        Возвращает новые и устраненные проблемы
+        """
+        now = datetime.utcnow()
+        rooms = self.db.query(Room.id, Room.revision).filter(Room.project_id == project_id).all()
+        room_ids = [room_id for room_id, _ in rooms]
+        model_rooms = dict(self.db.query(Model.id, Model.room_id).filter(or_(
+            Model.project_id == project_id, Model.room_id.in_(room_ids)
+        )).all())
+
+        def scope(issue: Dict[str, Any]) -> int:
+            if issue["entity_type"] == "room":
+                return issue["entity_id"]
+            if issue["entity_type"] == "model":
+                return model_rooms.get(issue["entity_id"]) or 0
+            return 0
+
+        stored = {
+            _key(row.entity_type, row.entity_id, row.code): row
+            for row in self.db.query(ValidationIssue).filter(ValidationIssue.project_id == project_id).all()
+        }
+        current: Dict[IssueKey, Dict[str, Any]] = {}
+        for issue in issues:
+            current.setdefault(_key(issue["entity_type"], issue["entity_id"], issue["code"]), issue)
+
+        new_issues: List[Dict[str, Any]] = []
+        for key, issue in current.items():
+            row = stored.get(key)
+            if row is None:
+                new_issues.append(issue)
+                row = ValidationIssue(
+                    project_id=project_id,
+                    entity_type=issue["entity_type"],
+                    entity_id=issue["entity_id"],
+                    code=issue["code"],
+                    first_seen_at=now
+                )
+                self.db.add(row)
+            row.room_id = scope(issue)
+            row.severity = issue["severity"]
+            row.message = issue["message"]
+            row.standard = issue.get("standard")
+            row.validated_at = now
+
+        resolved = [row for key, row in stored.items() if key not in current]
+        resolved_issues = [issue_dict(row) for row in resolved]
+        if resolved:
+            self.db.query(ValidationIssue).filter(
+                ValidationIssue.id.in_([row.id for row in resolved])
+            ).delete(synchronize_session=False)
+
+        # Проверенные области - заново (число помещений проекта невелико)
+        self.db.query(ValidationScope).filter(
+            ValidationScope.project_id == project_id
+        ).delete(synchronize_session=False)
+        self.db.add_all([
+            ValidationScope(
+                project_id=project_id, room_id=room_id, revision=revision or 0,
+                rules_version=rules_version, validated_at=now
+            )
+            for room_id, revision in [(0, 0)] + rooms
+        ])
+
+        return {"new": new_issues, "resolved": resolved_issues}
+
+    def current(self, project_id: int) -> Dict[str, Any]:
+        """Сохраненные проблемы, еще соответствующие ревизиям помещений и правилам"""
+        rules_version = get_rule_set(self.db).version
+        revisions = dict(self.db.query(Room.id, Room.revision).filter(Room.project_id == project_id).all())
+        scopes = {
+            scope.room_id: scope
+            for scope in self.db.query(ValidationScope).filter(ValidationScope.project_id == project_id).all()
+        }
+
+        def is_current(room_id: int) -> bool:
+            scope = scopes.get(room_id)
+            return (
+                scope is not None
+                and scope.rules_version == rules_version
+                and (room_id == 0 or scope.revision == (revisions.get(room_id) or 0))
+            )
+
+        stale_rooms = [room_id for room_id in sorted(revisions) if not is_current(room_id)]
+        # Области удаленных помещений не учитываются
+        valid_scopes = [room_id for room_id in scopes if (room_id == 0 or room_id in revisions) and is_current(room_id)]
+        rows = []
+        if valid_scopes:
+            rows = self.db.query(ValidationIssue).filter(
+                ValidationIssue.project_id == project_id,
+                ValidationIssue.room_id.in_(valid_scopes)
+            ).order_by(ValidationIssue.room_id, ValidationIssue.id).all()
+
+        issues = [issue_dict(row) for row in rows]
+        errors = sum(1 for issue in issues if issue["severity"] == "error")
+        validated_at = max((scope.validated_at for scope in scopes.values() if scope.validated_at), default=None)
+        return {
+            "project_id": project_id,
+            "validated_at": validated_at,
+            "is_current": bool(scopes) and not stale_rooms and is_current(0),
+            "stale_rooms": stale_rooms,
+            "is_valid": errors == 0,
+            "error_count": errors,
+            "warning_count": len(issues) - errors,
+            "issues": issues,
+        }
+
+    def clear(self, project_id: int):
+        """Удалить результаты проекта (при удалении проекта)"""
+        for table in (ValidationIssue, ValidationScope):
+            self.db.query(table).filter(table.project_id == project_id).delete(synchronize_session=False)
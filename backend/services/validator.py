@@ -9,33 +9,70 @@ Attributes:
 Methods:
     - соответствуетСтандарту(модель: Модель): bool
     - проверитьПараметры(параметры: list<string>): list<string>
+
+Нормы задаются данными: правила компилируются из Standard.parameters
+(services/validation_rules.py) и проверяются сразу для всех помещений
+и моделей проекта.
+
+Проверка при записи (VALIDATE_ON_WRITE или параметр validate запроса):
+- off    - не проверять
+- warn   - проверить изменяемый объект, предупреждения вернуть в ответе
+- strict - как warn, но запись с ошибками отклоняется
+Проверяется только изменяемый объект: модель (и ее пересечения с соседями
+по помещению) или помещение (и положение его моделей в новых границах -
+прочие правила моделей при записи помещения не применяются).
 """
 from sqlalchemy.orm import Session
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Optional, Union
 import logging
+import os
+import numpy as np
 
 from ..models.model import Model
 from ..models.room import Room
-from ..models.catalog import Standard
 from ..models.project import Project
+from .result_cache import ResultCacheService, cache_key
+from .validation_rules import get_rule_set
+from .layout_analysis import SceneArrays, FLOOR_MODEL_TYPES
 
 logger = logging.getLogger(__name__)
 
+# Меняется при изменении правил проверки - сохраненные результаты комнат не используются
+VALIDATION_VERSION = "2"
+
+VALIDATE_ON_WRITE = os.getenv("VALIDATE_ON_WRITE", "off")
+# Правила моделей, зависящие от размеров помещения - проверяются при записи помещения
+ROOM_BOUNDS_RULE_PREFIX = "model.position_"
+
 
 class ValidationResult:
     """Результат валидации"""
-    def __init__(self, is_valid: bool, errors: List[str], warnings: List[str]):
+    def __init__(
+        self,
+        is_valid: bool,
+        errors: List[str],
+        warnings: List[str],
+        issues: Optional[List[Dict[str, Any]]] = None
+    ):
         self.is_valid = is_valid
         self.errors = errors
         self.warnings = warnings
-    
+        self.issues = issues or []
+
+    @classmethod
+    def from_issues(cls, issues: List[Dict[str, Any]]) -> "ValidationResult":
+        errors = [issue["message"] for issue in issues if issue["severity"] == "error"]
+        warnings = [issue["message"] for issue in issues if issue["severity"] != "error"]
+        return cls(len(errors) == 0, errors, warnings, issues)
+
     def to_dict(self) -> Dict[str, Any]:
         return {
             "is_valid": self.is_valid,
             "errors": self.errors,
             "warnings": self.warnings,
             "error_count": len(self.errors),
-            "warning_count": len(self.warnings)
+            "warning_count": len(self.warnings),
+            "issues": self.issues
         }
 
 
@@ -47,70 +84,44 @@ class Validator:
     - Эргономических требований
     - Безопасности конструкций
     """
-    
+
     def __init__(self, db: Session):
         self.db = db
-        self.standards = self._load_standards()
-    
-    def _load_standards(self) -> List[Standard]:
-        """Загрузка стандартов из БД"""
-        return self.db.query(Standard).all()
-    
+        self.rules = get_rule_set(db)
+
     def validate_model(self, model: Model) -> ValidationResult:
         """
         соответствуетСтандарту(модель: Модель): bool
         Проверяет соответствие модели стандартам
         """
-        errors = []
-        warnings = []
-        
-        # Проверка размеров модели
-        if model.dimensions:
-            dim_errors, dim_warnings = self._check_dimensions(model.dimensions, model.type)
-            errors.extend(dim_errors)
-            warnings.extend(dim_warnings)
-        else:
-            warnings.append(f"Модель {model.name}: отсутствуют размеры")
-        
-        # Проверка позиции (не должна быть вне комнаты)
-        if model.room_id:
-            room_errors = self._check_model_position(model)
-            errors.extend(room_errors)
-        
-        # Проверка материала на соответствие стандартам
-        if model.material_id:
-            material_errors = self._check_material_standards(model.material_id)
-            errors.extend(material_errors)
-        
-        is_valid = len(errors) == 0
-        return ValidationResult(is_valid, errors, warnings)
-    
+        room = self.db.query(Room).filter(Room.id == model.room_id).first() if model.room_id else None
+        return ValidationResult.from_issues(self.check_models([model], {room.id: room} if room else {})[0])
+
     def validate_room(self, room: Room) -> ValidationResult:
         """
         Проверяет помещение на соответствие строительным нормам
         """
-        errors = []
-        warnings = []
-        
-        # Проверка минимальной высоты потолков (СНиП)
-        if room.height < 2.5:
-            errors.append(f"Комната {room.name}: высота потолка {room.height}м меньше минимальной (2.5м)")
-        elif room.height < 2.7:
-            warnings.append(f"Комната {room.name}: рекомендуется высота потолка не менее 2.7м")
-        
-        # Проверка площади
-        if room.area and room.area < 8:
-            warnings.append(f"Комната {room.name}: площадь {room.area}м² меньше рекомендуемой для жилых помещений")
-        
-        # Проверка пропорций
-        if room.width and room.length:
-            ratio = max(room.width, room.length) / min(room.width, room.length)
-            if ratio > 3:
-                warnings.append(f"Комната {room.name}: неоптимальные пропорции (соотношение {ratio:.1f}:1)")
-        
-        is_valid = len(errors) == 0
-        return ValidationResult(is_valid, errors, warnings)
-    
+        return ValidationResult.from_issues(self.check_rooms([room])[0])
+
+    def validate_write(self, entity: Union[Room, Model]) -> ValidationResult:
+        """
+        Проверка изменяемого объекта до commit (изменения должны быть сделаны
+        в сессии, для новых объектов - flush, чтобы был id)
+        """
+        if isinstance(entity, Room):
+            issues = self.check_rooms([entity])[0]
+            models = self.db.query(Model).filter(Model.room_id == entity.id).order_by(Model.id).all()
+            for model_issues in self.check_models(models, {entity.id: entity}):
+                issues.extend(
+                    issue for issue in model_issues if issue["code"].startswith(ROOM_BOUNDS_RULE_PREFIX)
+                )
+            return ValidationResult.from_issues(issues)
+
+        room = self.db.query(Room).filter(Room.id == entity.room_id).first() if entity.room_id else None
+        issues = self.check_models([entity], {room.id: room} if room else {})[0]
+        issues.extend(self._collisions(entity, room))
+        return ValidationResult.from_issues(issues)
+
     def validate_project(self, project_id: int) -> ValidationResult:
         """
         проверитьПараметры(параметры: list<string>): list<string>
@@ -119,85 +130,153 @@ class Validator:
         project = self.db.query(Project).filter(Project.id == project_id).first()
         if not project:
             return ValidationResult(False, ["Проект не найден"], [])
-        
-        all_errors = []
-        all_warnings = []
-        
-        # Проверка всех комнат
-        rooms = self.db.query(Room).filter(Room.project_id == project_id).all()
-        for room in rooms:
-            result = self.validate_room(room)
-            all_errors.extend(result.errors)
-            all_warnings.extend(result.warnings)
-        
-        # Проверка всех моделей
-        models = self.db.query(Model).filter(Model.project_id == project_id).all()
-        for model in models:
-            result = self.validate_model(model)
-            all_errors.extend(result.errors)
-            all_warnings.extend(result.warnings)
-        
-        # Проверка общей площади проекта
-        total_area = sum(r.area or 0 for r in rooms)
-        if total_area < 20:
-            warnings.append(f"Общая площадь проекта ({total_area}м²) меньше минимальной для квартиры")
-        
-        is_valid = len(all_errors) == 0
-        return ValidationResult(is_valid, all_errors, all_warnings)
-    
-    def _check_dimensions(
-        self,
-        dimensions: Dict[str, float],
-        model_type: str
-    ) -> Tuple[List[str], List[str]]:
-        """Проверка размеров объекта"""
-        errors = []
-        warnings = []
-        
-        # Базовые проверки
-        for dim_name, value in dimensions.items():
-            if value <= 0:
-                errors.append(f"Недопустимый размер {dim_name}: {value}")
-        
-        # Специфические проверки для типов мебели
-        if model_type == "furniture":
-            # Проверка на слишком большую мебель
-            max_dim = max(dimensions.values()) if dimensions else 0
-            if max_dim > 5:
-                warnings.append(f"Необычно большой размер мебели: {max_dim}м")
-        
-        return errors, warnings
-    
-    def _check_model_position(self, model: Model) -> List[str]:
-        """Проверка, что модель находится в пределах комнаты"""
-        errors = []
-        
-        room = self.db.query(Room).filter(Room.id == model.room_id).first()
-        if not room or not model.position:
-            return errors
-        
-        # Проверка координат
-        pos = model.position
-        if "x" in pos and "z" in pos:
-            if pos["x"] < 0 or pos["x"] > room.width:
-                errors.append(f"Модель {model.name} выходит за границы комнаты по X")
-            if pos["z"] < 0 or pos["z"] > room.length:
-                errors.append(f"Модель {model.name} выходит за границы комнаты по Z")
-        
-        return errors
-    
-    def _check_material_standards(self, material_id: int) -> List[str]:
-        """Проверка материала на соответствие стандартам"""
-        errors = []
-        
-        # Получаем стандарты для материала
-        standards = self.db.query(Standard).filter(
-            Standard.material_id == material_id
+
+        # Проверка комнат и их моделей - с повторным использованием результатов
+        # неизмененных комнат (ключ: комната, Room.revision, версия правил)
+        rooms = self.db.query(Room).filter(Room.project_id == project_id).order_by(Room.id).all()
+        issues = [issue for room_issues in self._validate_rooms(rooms, project_id) for issue in room_issues]
+
+        # Модели проекта без комнаты
+        models = self.db.query(Model).filter(
+            Model.project_id == project_id,
+            Model.room_id.is_(None)
+        ).order_by(Model.id).all()
+        for model_issues in self.check_models(models, {}):
+            issues.extend(model_issues)
+
+        # Проверка проекта в целом (общая площадь)
+        issues.extend(self.rules.evaluate("project", [{
+            "id": project.id,
+            "name": project.name,
+            "total_area": sum(r.area or 0 for r in rooms),
+            "room_count": len(rooms),
+        }])[0])
+
+        return ValidationResult.from_issues(issues)
+
+    def check_rooms(self, rooms: List[Room]) -> List[List[Dict[str, Any]]]:
+        """Проблемы каждого помещения - одна проверка всех правил для всего списка"""
+        return self.rules.evaluate("room", [self._room_row(room) for room in rooms])
+
+    def check_models(self, models: List[Model], rooms: Dict[int, Room]) -> List[List[Dict[str, Any]]]:
+        """Проблемы каждой модели; rooms - помещения моделей по id (для проверки границ)"""
+        return self.rules.evaluate("model", [
+            self._model_row(model, rooms.get(model.room_id)) for model in models
+        ])
+
+    def _validate_rooms(self, rooms: List[Room], project_id: int) -> List[List[Dict[str, Any]]]:
+        """
+        Проблемы каждой комнаты вместе с ее моделями
+        Проверяются только комнаты, изменившиеся с прошлой проверки;
+        кэш фиксирует вызывающий код (commit)
+        """
+        keys = {
+            room.id: cache_key("validation:room", {
+                "version": VALIDATION_VERSION, "rules": self.rules.version,
+                "room_id": room.id, "revision": room.revision
+            })
+            for room in rooms
+        }
+        cache = ResultCacheService(self.db)
+        cached = cache.get_many(list(keys.values()))
+
+        dirty = [room for room in rooms if keys[room.id] not in cached]
+        fresh: Dict[int, List[Dict[str, Any]]] = {}
+        if dirty:
+            models = self.db.query(Model).filter(
+                Model.room_id.in_([room.id for room in dirty])
+            ).order_by(Model.id).all()
+            for room, room_issues in zip(dirty, self.check_rooms(dirty)):
+                fresh[room.id] = room_issues
+            for model, model_issues in zip(models, self.check_models(models, {room.id: room for room in dirty})):
+                fresh[model.room_id].extend(model_issues)
+            cache.set_many([
+                {"key": keys[room_id], "kind": "validation:room", "value": value, "project_id": project_id}
+                for room_id, value in fresh.items()
+            ])
+
+        return [fresh[room.id] if room.id in fresh else cached[keys[room.id]] for room in rooms]
+
+    def _collisions(self, model: Model, room: Optional[Room]) -> List[Dict[str, Any]]:
+        """Пересечения габаритов модели с другой мебелью помещения (как в анализе планировки)"""
+        if room is None or model.type not in FLOOR_MODEL_TYPES:
+            return []
+        neighbours = self.db.query(Model).filter(
+            Model.room_id == room.id,
+            Model.id != model.id,
+            Model.type.in_(FLOOR_MODEL_TYPES)
         ).all()
-        
-        if not standards:
-            errors.append(f"Для материала ID {material_id} не найдены стандарты")
-        
-        # TODO: Более детальная проверка параметров материала
-        
-        return errors
+        if not neighbours:
+            return []
+
+        scene = SceneArrays({
+            "rooms": [{
+                "id": room.id, "name": room.name,
+                "dimensions": {"width": room.width, "length": room.length, "height": room.height},
+            }],
+            "models": [
+                {
+                    "id": item.id, "name": item.name, "type": item.type, "room_id": item.room_id,
+                    "dimensions": item.dimensions, "position": item.position,
+                    "rotation": item.rotation, "scale": item.scale,
+                }
+                for item in [model] + neighbours
+            ],
+        })
+        if not scene.models or scene.models[0]["id"] != model.id:
+            return []
+        dx = np.abs(scene.center_x[1:] - scene.center_x[0]) - (scene.half_x[1:] + scene.half_x[0])
+        dz = np.abs(scene.center_z[1:] - scene.center_z[0]) - (scene.half_z[1:] + scene.half_z[0])
+        return [
+            {
+                "code": "model.collision",
+                "severity": "warning",
+                "entity_type": "model",
+                "entity_id": model.id,
+                "message": f"Модель {model.name} пересекается с {scene.models[index + 1]['name']}",
+                "standard": None,
+            }
+            for index in np.flatnonzero((dx < -1e-6) & (dz < -1e-6))
+        ]
+
+    @staticmethod
+    def _room_row(room: Room) -> Dict[str, Any]:
+        """Поля помещения, доступные правилам"""
+        ratio = None
+        if room.width and room.length:
+            ratio = max(room.width, room.length) / min(room.width, room.length)
+        return {
+            "id": room.id,
+            "name": room.name,
+            "width": room.width,
+            "length": room.length,
+            "height": room.height,
+            "area": room.area,
+            "ratio": ratio,
+        }
+
+    def _model_row(self, model: Model, room: Optional[Room]) -> Dict[str, Any]:
+        """Поля модели, доступные правилам"""
+        dimensions = model.dimensions or {}
+        position = model.position or {}
+        values = [value for value in dimensions.values() if isinstance(value, (int, float))]
+        has_position = room is not None and "x" in position and "z" in position
+        return {
+            "id": model.id,
+            "name": model.name,
+            "type": model.type,
+            "category": model.category,
+            "room_id": model.room_id,
+            "material_id": model.material_id,
+            "width": dimensions.get("width"),
+            "height": dimensions.get("height"),
+            "depth": dimensions.get("depth"),
+            "max_dimension": max(values) if values else None,
+            "x": position.get("x") if has_position else None,
+            "z": position.get("z") if has_position else None,
+            "room_width": room.width if room else None,
+            "room_length": room.length if room else None,
+            "has_material_standard": (
+                (1 if model.material_id in self.rules.material_ids else 0) if model.material_id else None
+            ),
+        }